@@ -0,0 +1,144 @@
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Optional, Union
+
+LOGGER_NAME = "wavetrader"
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """队列写满时直接丢弃日志，保证记录日志永远不会阻塞事件循环"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 格式化放到后台线程，这里只保留原始字段
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname} {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class LogPipeline:
+    """日志先进入有界队列，由后台线程负责格式化和写出"""
+
+    def __init__(
+        self,
+        level: str = "INFO",
+        queue_size: int = 10000,
+        fmt: str = "json",
+        body_max_chars: int = 512,
+        body_sample_rate: float = 1.0
+    ):
+        self.body_max_chars = body_max_chars
+        self.body_sample_rate = body_sample_rate
+
+        self.handler = _DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        self.listener = QueueListener(self.handler.queue, stream_handler)
+
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(level.upper())
+        self.logger.propagate = False
+        for old in list(self.logger.handlers):
+            self.logger.removeHandler(old)
+        self.logger.addHandler(self.handler)
+        self._started = False
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def start(self) -> None:
+        if not self._started:
+            self.listener.start()
+            self._started = True
+
+    def stop(self) -> None:
+        if self._started:
+            self.listener.stop()
+            self._started = False
+
+    def render_body(self, body: Union[str, Callable[[], str], None], status: Optional[int]) -> Optional[str]:
+        """按规则截断或采样响应体：错误响应总是记录，成功响应按采样率记录"""
+        if body is None or self.body_max_chars <= 0:
+            return None
+        is_error = status is not None and status >= 400
+        if not is_error and self.body_sample_rate < 1.0 and random.random() >= self.body_sample_rate:
+            return None
+        text = body() if callable(body) else body
+        if text is None:
+            return None
+        text = str(text)
+        if len(text) > self.body_max_chars:
+            return f"{text[:self.body_max_chars]}...(truncated {len(text) - self.body_max_chars} chars)"
+        return text
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def setup_logging(**kwargs: Any) -> LogPipeline:
+    global _pipeline
+    _pipeline = LogPipeline(**kwargs)
+    return _pipeline
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def log_event(
+    message: str,
+    level: int = logging.INFO,
+    logger: Optional[logging.Logger] = None,
+    body: Union[str, Callable[[], str], None] = None,
+    **fields: Any
+) -> None:
+    """记录一条结构化日志。
+
+    常用字段: endpoint, upstream, status, latency, attempt。
+    body 可以传入返回文本的函数，只有在确实需要记录时才会解码响应体。
+    """
+    logger = logger or get_logger()
+    if not logger.isEnabledFor(level):
+        return
+    if body is not None and _pipeline is not None:
+        rendered = _pipeline.render_body(body, fields.get("status"))
+        if rendered is not None:
+            fields["body"] = rendered
+    if isinstance(fields.get("latency"), float):
+        fields["latency"] = round(fields["latency"], 4)
+    logger.log(level, message, extra={"fields": fields})
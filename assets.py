@@ -0,0 +1,248 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from app_logging import log_event
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有时只提供gzip
+    brotli = None
+
+# 小于该大小的文件压缩收益可以忽略
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+class Asset:
+    __slots__ = ("content", "encoded", "etag", "media_type")
+
+    def __init__(self, content: bytes, media_type: str):
+        self.content = content
+        self.media_type = media_type
+        self.etag = hashlib.sha256(content).hexdigest()[:16]
+        # 编码 -> 压缩后的内容，只保留比原文件小的版本
+        self.encoded: Dict[str, bytes] = {}
+        if len(content) >= MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                self._add("br", brotli.compress(content, quality=11))
+            self._add("gzip", gzip.compress(content, compresslevel=9, mtime=0))
+
+    def _add(self, encoding: str, data: bytes) -> None:
+        if len(data) < len(self.content):
+            self.encoded[encoding] = data
+
+
+def _accepted_encodings(headers: Headers) -> List[str]:
+    accepted = []
+    for part in headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.append(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(if_none_match: Optional[str], etags: List[str]) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or any(etag in candidates for etag in etags)
+
+
+class AssetStore:
+    """启动时把静态文件读入内存：预压缩（br/gzip）、按内容哈希生成带指纹的URL。
+
+    原路径（/static/app.js）每次协商缓存（ETag + no-cache），
+    带指纹的路径（/static/app.<hash>.js）内容永不变化，可以 immutable 长期缓存。
+    """
+
+    def __init__(self, roots: Dict[str, str]):
+        self.roots = roots
+        # URL -> (资源, Cache-Control)
+        self._assets: Dict[str, Tuple[Asset, str]] = {}
+        # 原路径 -> 带指纹的路径
+        self.manifest: Dict[str, str] = {}
+
+    def build(self) -> None:
+        self._assets.clear()
+        self.manifest.clear()
+        for prefix, directory in self.roots.items():
+            for dirpath, _, filenames in os.walk(directory):
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    url = f"{prefix}/{os.path.relpath(path, directory).replace(os.sep, '/')}"
+                    with open(path, "rb") as f:
+                        content = f.read()
+                    self._add(url, content)
+        log_event(
+            "静态资源已加载",
+            assets=len(self.manifest),
+            brotli=brotli is not None,
+            bytes=sum(len(asset.content) for asset, _ in self._assets.values())
+        )
+
+    def _add(self, url: str, content: bytes) -> None:
+        media_type = mimetypes.guess_type(url)[0] or "application/octet-stream"
+        # text/* 由 Response 自动补上 charset
+        if media_type in ("application/javascript", "application/json"):
+            media_type += "; charset=utf-8"
+        asset = Asset(content, media_type)
+        stem, ext = os.path.splitext(url)
+        fingerprinted = f"{stem}.{asset.etag[:10]}{ext}"
+        self._assets[url] = (asset, REVALIDATE_CACHE)
+        self._assets[fingerprinted] = (asset, IMMUTABLE_CACHE)
+        self.manifest[url] = fingerprinted
+
+    def url(self, path: str) -> str:
+        """返回带指纹的URL，未知路径原样返回"""
+        return self.manifest.get(path, path)
+
+    def render_html(self, path: str) -> Asset:
+        """把HTML中引用的静态资源替换为带指纹的URL，并注入资源清单供前端动态加载使用"""
+        html = self._assets[path][0].content.decode("utf-8")
+        for original, fingerprinted in self.manifest.items():
+            html = html.replace(f'"{original}"', f'"{fingerprinted}"')
+        manifest = json.dumps(self.manifest, ensure_ascii=False)
+        # 放在<head>最前面，保证后续脚本执行时清单已经存在
+        html = html.replace("<head>", f"<head>\n    <script>window.ASSET_MANIFEST = {manifest};</script>", 1)
+        return Asset(html.encode("utf-8"), "text/html")
+
+    def get(self, path: str) -> Optional[Tuple[Asset, str]]:
+        return self._assets.get(path)
+
+
+def asset_response(
+    asset: Asset,
+    headers: Headers,
+    cache_control: str = REVALIDATE_CACHE,
+    method: str = "GET"
+) -> Response:
+    """按 Accept-Encoding 选择预压缩版本，If-None-Match 命中时返回304"""
+    accepted = _accepted_encodings(headers)
+    encoding = next((e for e in ("br", "gzip") if e in asset.encoded and e in accepted), None)
+    # 每种编码是不同的表示，ETag 需要区分
+    etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+    response_headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(headers.get("if-none-match"), [etag]):
+        return Response(status_code=304, headers=response_headers)
+
+    body = asset.encoded[encoding] if encoding else asset.content
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+    if method == "HEAD":
+        response_headers["Content-Length"] = str(len(body))
+        body = b""
+    return Response(content=body, media_type=asset.media_type, headers=response_headers)
+
+
+class AssetFiles:
+    """替代 StaticFiles 的ASGI应用，从 AssetStore 的内存副本提供文件"""
+
+    def __init__(self, store: AssetStore, prefix: str):
+        self.store = store
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send) -> None:
+        method = scope["method"]
+        entry = self.store.get(self.prefix + scope["path"])
+        if method not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"Allow": "GET, HEAD"})
+        elif entry is None:
+            response = Response("Not Found", status_code=404, media_type="text/plain")
+        else:
+            asset, cache_control = entry
+            response = asset_response(asset, Headers(scope=scope), cache_control, method)
+        await response(scope, receive, send)
+
+
+class JSONCompressionMiddleware:
+    """按 Accept-Encoding 压缩较大的JSON响应。
+
+    只处理 application/json，SSE等流式响应原样透传（压缩会把事件攒在缓冲区里）。
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose(self, headers: Headers) -> Optional[str]:
+        accepted = _accepted_encodings(headers)
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self._choose(Headers(scope=scope))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    headers.get("content-type", "").startswith("application/json")
+                    and "content-encoding" not in headers
+                ):
+                    start = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await self._send_compressed(start, b"".join(chunks), encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_compressed(self, start: dict, body: bytes, encoding: str, send) -> None:
+        headers: List[Tuple[bytes, bytes]] = [
+            (k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"vary")
+        ]
+        vary = [v for k, v in start["headers"] if k.lower() == b"vary"]
+        if len(body) >= self.minimum_size:
+            compressed = self._compress(encoding, body)
+            if len(compressed) < len(body):
+                body = compressed
+                headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
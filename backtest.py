@@ -0,0 +1,386 @@
+"""从AI策略文本中解析交易价位，并用记录的价格序列批量回放打分。
+
+回放对一批策略一次性展开成 (策略, 采样点) 的扁平数组，入场、止盈、止损
+都用 numpy 的 reduceat 按策略分段求第一个满足条件的位置，没有逐tick的Python循环。
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LONG = 1
+SHORT = -1
+
+# 没有解析出持仓时间时的回放窗口（秒）
+DEFAULT_HOLDING_SECONDS = 24 * 3600
+# 每批展开的 (策略, 采样点) 数量上限，控制内存占用
+MAX_BATCH_TICKS = 4_000_000
+MAX_TARGETS = 3
+
+_UNIT_SECONDS = {
+    "分钟": 60, "小时": 3600, "天": 86400, "日": 86400, "周": 604800,
+    "min": 60, "minute": 60, "minutes": 60, "m": 60,
+    "hour": 3600, "hours": 3600, "h": 3600, "hr": 3600, "hrs": 3600,
+    "day": 86400, "days": 86400, "d": 86400,
+    "week": 604800, "weeks": 604800, "w": 604800,
+}
+
+_ENTRY = re.compile(r"入场|买入区间|买入价|建仓|entry", re.I)
+_TAKE_PROFIT = re.compile(r"止盈|目标|take[\s-]*profit|target|\btp\d?\b", re.I)
+_STOP_LOSS = re.compile(r"止损|stop[\s-]*loss|\bsl\b", re.I)
+_HOLDING = re.compile(r"持仓|持有|holding|hold\b", re.I)
+_SHORT = re.compile(r"卖出|做空|减仓|\bsell\b|\bshort\b", re.I)
+_LONG = re.compile(r"买入|做多|\bbuy\b|\blong\b", re.I)
+_ACTION = re.compile(r"时机|建议|操作|方向|action|recommendation", re.I)
+# 按优先级判断一个子句属于哪个字段
+_FIELDS = (
+    ("stop_loss", _STOP_LOSS),
+    ("take_profit", _TAKE_PROFIT),
+    ("entry", _ENTRY),
+    ("holding", _HOLDING),
+    ("action", _ACTION),
+)
+
+# 行首的列表符号和序号（"-"、"### 2."、"1、"），"1.5" 这样的价格不算序号
+_LIST_MARKER = re.compile(r"^\s*(?:(?:[-*•>]+|#+|\d+[.)、](?!\d))\s*)*")
+_HEADING = re.compile(r"^\s*(?:#|\d+[.)、](?!\d))")
+# 同一行内的子句：中文逗号、分号、句号
+_CLAUSE = re.compile(r"[，；;。]")
+# 价格或百分比，后面不能是时间单位或倍数
+_NUMBER = re.compile(
+    r"(?<![\d.])(\$)?\s*(\d[\d,]*(?:\.\d+)?(?:e-?\d+)?)(?!\d)\s*(%|％)?"
+    r"(?!\s*(?:分钟|小时|天|日|周|倍|x\b|min|hour|day|week))",
+    re.I
+)
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)\s*(?:[-~至到]\s*(\d+(?:\.\d+)?))?\s*(分钟|小时|天|日|周|minutes?|hours?|hrs?|days?|weeks?|[mhdw]\b)", re.I)
+
+
+def _lines(text: str) -> List[Tuple[bool, List[str]]]:
+    """返回每行的 (是否开始新的小节, 子句列表)，已去掉列表序号和加粗标记"""
+    text = re.sub(r"<br\s*/?>", "\n", text, flags=re.I)
+    lines = []
+    for raw in text.splitlines():
+        line = raw.replace("**", "")
+        content = _LIST_MARKER.sub("", line)
+        clauses = [c.strip() for c in _CLAUSE.split(content) if c.strip()]
+        if not clauses:
+            continue
+        # markdown 标题，或者不带数值的编号行（"6. 建议的仓位大小"）
+        section = line.lstrip().startswith("#") or (bool(_HEADING.match(line)) and not _NUMBER.search(content))
+        lines.append((section, clauses))
+    return lines
+
+
+def _numbers(line: str) -> Tuple[List[float], List[float]]:
+    """返回一行中的 (绝对价格, 百分比)"""
+    prices, percents = [], []
+    for match in _NUMBER.finditer(line):
+        dollar, value, percent = match.groups()
+        before = line[match.start() - 1] if match.start() else ""
+        # "目标1"、"TP2" 这类紧跟在文字后面的小整数是编号，不是价格
+        if not dollar and not percent and before.isalpha() and value.isdigit() and int(value) < 10:
+            continue
+        try:
+            number = float(value.replace(",", ""))
+        except ValueError:
+            continue
+        (percents if percent else prices).append(number)
+    return prices, percents
+
+
+def _field(clause: str) -> Optional[str]:
+    for name, pattern in _FIELDS:
+        if pattern.search(clause):
+            return name
+    return None
+
+
+def parse_strategy(text: str, reference_price: Optional[float] = None) -> Dict[str, Any]:
+    """从策略文本中提取方向、入场区间、止盈目标、止损和持仓时间，解析不到的字段为None。
+
+    按行和行内的中文标点拆成子句，每个子句按关键词归到一个字段；没有关键词的子句
+    归到同一行前面的字段，或者上方只有标题没有数值的字段（"### 2. 入场区间" 下一行的价格）。
+    只给了百分比的止盈/止损按入场价（没有入场价时按 reference_price）换算成价格。
+    """
+    direction: Optional[int] = None
+    entry: List[float] = []
+    targets: List[float] = []
+    target_percents: List[float] = []
+    stop_loss: Optional[float] = None
+    stop_percent: Optional[float] = None
+    holding: Optional[float] = None
+
+    def apply(field: str, clause: str) -> bool:
+        """把子句中的数值写入字段，返回是否找到了数值"""
+        nonlocal direction, stop_loss, stop_percent, holding
+        if field == "action":
+            short, long = _SHORT.search(clause), _LONG.search(clause)
+            # "买入还是卖出" 这类同时出现的是提问，不是结论
+            if bool(short) == bool(long):
+                return False
+            if direction is None:
+                direction = SHORT if short else LONG
+            return True
+        if field == "holding":
+            match = _DURATION.search(clause)
+            if match and holding is None:
+                amount = float(match.group(2) or match.group(1))
+                unit = match.group(3).lower()
+                holding = amount * _UNIT_SECONDS.get(unit, _UNIT_SECONDS.get(unit.rstrip("s"), 3600))
+            return bool(match)
+        prices, percents = _numbers(clause)
+        if field == "stop_loss":
+            if stop_loss is None and prices:
+                stop_loss = prices[0]
+            elif stop_percent is None and percents:
+                stop_percent = percents[0]
+        elif field == "take_profit":
+            targets.extend(prices)
+            target_percents.extend(percents)
+        elif field == "entry" and len(entry) < 2:
+            entry.extend(prices[:2 - len(entry)])
+        return bool(prices or percents)
+
+    # heading：上方只有标题、还没有数值的字段，作用到后续没有关键词的行
+    heading: Optional[str] = None
+    for section, clauses in _lines(text):
+        if section:
+            heading = None
+        current = None
+        for clause in clauses:
+            field = _field(clause)
+            if field is None:
+                target = current or heading
+                if target:
+                    apply(target, clause)
+                continue
+            if not apply(field, clause):
+                heading = field
+            elif field != heading:
+                heading = None
+            current = field
+
+    direction = direction or LONG
+
+    entry_low = entry_high = None
+    if len(entry) == 2:
+        entry_low, entry_high = min(entry), max(entry)
+    elif entry:
+        # 只有一个价格时视为限价：做多在该价格及以下入场，做空在该价格及以上
+        entry_low, entry_high = (None, entry[0]) if direction == LONG else (entry[0], None)
+
+    base = entry_high if direction == LONG else entry_low
+    base = base or reference_price
+    if not targets and target_percents and base:
+        targets = [base * (1 + direction * p / 100) for p in target_percents]
+    if stop_loss is None and stop_percent is not None and base:
+        stop_loss = base * (1 - direction * stop_percent / 100)
+
+    # 只保留在止损另一侧的目标，按离入场由近到远排序
+    if stop_loss is not None:
+        targets = [t for t in targets if direction * (t - stop_loss) > 0]
+    targets = sorted(set(targets), reverse=direction == SHORT)
+
+    return {
+        "direction": direction,
+        "entry_low": entry_low,
+        "entry_high": entry_high,
+        "take_profits": targets[:MAX_TARGETS],
+        "stop_loss": stop_loss,
+        "holding_seconds": holding,
+    }
+
+
+def _column(strategies: Sequence[Dict[str, Any]], name: str, default: float = np.nan) -> np.ndarray:
+    return np.array([default if s.get(name) is None else s[name] for s in strategies], dtype=np.float64)
+
+
+def _replay_batch(
+    price: np.ndarray,
+    start: np.ndarray,
+    length: np.ndarray,
+    direction: np.ndarray,
+    entry_low: np.ndarray,
+    entry_high: np.ndarray,
+    targets: np.ndarray,
+    stop_loss: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """回放一批策略，length 必须都大于0"""
+    k = len(start)
+    offsets = np.concatenate(([0], np.cumsum(length)[:-1]))
+    total = int(length.sum())
+    sid = np.repeat(np.arange(k), length)
+    local = np.arange(total) - offsets[sid]
+    p = price[start[sid] + local]
+    never = total + 1
+
+    # 入场：窗口内第一个落在入场区间的采样
+    in_entry = (p >= entry_low[sid]) & (p <= entry_high[sid])
+    entry_at = np.minimum.reduceat(np.where(in_entry, local, never), offsets)
+    entered = entry_at < length
+    entry_at = np.minimum(entry_at, length - 1)
+    entry_price = p[offsets + entry_at]
+
+    # 出场：入场之后第一个触及第一止盈或止损的采样，转换到 direction*价格 后两个方向的判断一致
+    q = p * direction[sid]
+    after = local > entry_at[sid]
+    hit_tp = after & (q >= (targets[:, 0] * direction)[sid])
+    hit_sl = after & (q <= (stop_loss * direction)[sid])
+    exit_hit = np.minimum.reduceat(np.where(hit_tp | hit_sl, local, never), offsets)
+    closed = exit_hit < length
+    exit_at = np.where(closed, exit_hit, length - 1)
+    exit_price = p[offsets + exit_at]
+    # 同一个采样同时满足时按止损算（保守）
+    stopped = closed & hit_sl[offsets + np.minimum(exit_at, length - 1)]
+
+    # 持仓期间的最有利/最不利价格
+    holding = (local >= entry_at[sid]) & (local <= exit_at[sid])
+    best = np.maximum.reduceat(np.where(holding, q, -np.inf), offsets) * direction
+    worst = np.minimum.reduceat(np.where(holding, q, np.inf), offsets) * direction
+
+    targets_hit = np.sum(direction[:, None] * (best[:, None] - targets) >= 0, axis=1)
+    return {
+        "entered": entered,
+        "entry_price": entry_price,
+        "exit_price": exit_price,
+        "reason": np.where(~entered, "no_entry", np.where(stopped, "stop_loss", np.where(closed, "take_profit", "time"))),
+        "return": np.where(entered, direction * (exit_price / entry_price - 1), np.nan),
+        "max_favorable": np.where(entered, direction * (best / entry_price - 1), np.nan),
+        "max_adverse": np.where(entered, direction * (worst / entry_price - 1), np.nan),
+        "targets_hit": np.where(entered, targets_hit, 0),
+        "ticks": exit_at - entry_at + 1,
+    }
+
+
+def replay(
+    strategies: Sequence[Dict[str, Any]],
+    ticks: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    default_holding: float = DEFAULT_HOLDING_SECONDS,
+    max_batch_ticks: int = MAX_BATCH_TICKS
+) -> Dict[str, Any]:
+    """用记录的价格序列回放策略。
+
+    每个策略从生成时刻开始、持续 holding_seconds（没有则 default_holding），
+    入场后第一止盈先到记为止盈，止损先到记为止损，都没到则在窗口结束时按最后价格平仓。
+    """
+    started_at = time.perf_counter()
+    n = len(strategies)
+    if n == 0:
+        return {"summary": summarize({}, 0, 0, started_at), "results": {}}
+
+    # 所有代币的序列拼成一个数组，记录每个代币的起始位置
+    token_offsets: Dict[str, int] = {}
+    price_parts = []
+    position = 0
+    for token, (ts, price) in ticks.items():
+        token_offsets[token] = position
+        price_parts.append(price)
+        position += len(ts)
+    price = np.concatenate(price_parts) if price_parts else np.empty(0)
+
+    created_at = _column(strategies, "created_at")
+    holding = _column(strategies, "holding_seconds", default_holding)
+    start = np.zeros(n, dtype=np.int64)
+    end = np.zeros(n, dtype=np.int64)
+    tokens = np.array([s["token"] for s in strategies], dtype=object)
+    for token in set(tokens):
+        if token not in token_offsets:
+            continue
+        idx = np.flatnonzero(tokens == token)
+        ts = ticks[token][0]
+        start[idx] = token_offsets[token] + np.searchsorted(ts, created_at[idx], "left")
+        end[idx] = token_offsets[token] + np.searchsorted(ts, created_at[idx] + holding[idx], "right")
+
+    length = end - start
+    direction = _column(strategies, "direction", LONG)
+    entry_low = np.nan_to_num(_column(strategies, "entry_low"), nan=-np.inf)
+    entry_high = np.nan_to_num(_column(strategies, "entry_high"), nan=np.inf)
+    stop_loss = _column(strategies, "stop_loss")
+    targets = np.full((n, MAX_TARGETS), np.nan)
+    for i, strategy in enumerate(strategies):
+        levels = (strategy.get("take_profits") or [])[:MAX_TARGETS]
+        targets[i, :len(levels)] = levels
+
+    results: Dict[str, np.ndarray] = {
+        "entered": np.zeros(n, dtype=bool),
+        "entry_price": np.full(n, np.nan),
+        "exit_price": np.full(n, np.nan),
+        "reason": np.full(n, "no_data", dtype=object),
+        "return": np.full(n, np.nan),
+        "max_favorable": np.full(n, np.nan),
+        "max_adverse": np.full(n, np.nan),
+        "targets_hit": np.zeros(n, dtype=np.int64),
+        "ticks": np.zeros(n, dtype=np.int64),
+    }
+
+    # 按累计展开长度切批，单个超长窗口自成一批
+    has_data = np.flatnonzero(length > 0)
+    cumulative = np.cumsum(length[has_data])
+    batch_id = (cumulative - 1) // max_batch_ticks
+    for batch in np.unique(batch_id):
+        idx = has_data[batch_id == batch]
+        out = _replay_batch(
+            price, start[idx], length[idx], direction[idx],
+            entry_low[idx], entry_high[idx], targets[idx], stop_loss[idx]
+        )
+        for key, values in out.items():
+            results[key][idx] = values
+
+    return {"summary": summarize(results, n, int(length.sum()), started_at), "results": results}
+
+
+def summarize(results: Dict[str, np.ndarray], strategies: int, ticks: int, started_at: float) -> Dict[str, Any]:
+    def rate(count: int, total: int) -> Optional[float]:
+        return round(count / total, 4) if total else None
+
+    summary: Dict[str, Any] = {"strategies": strategies, "ticks_replayed": ticks}
+    if strategies:
+        reason = results["reason"]
+        returns = results["return"][results["entered"]]
+        with_data = int(np.sum(reason != "no_data"))
+        entered = len(returns)
+        summary.update({
+            "with_data": with_data,
+            "entered": entered,
+            "entry_rate": rate(entered, with_data),
+            "win_rate": rate(int(np.sum(returns > 0)), entered),
+            "take_profit_rate": rate(int(np.sum(reason == "take_profit")), entered),
+            "stop_loss_rate": rate(int(np.sum(reason == "stop_loss")), entered),
+            "time_exit_rate": rate(int(np.sum(reason == "time")), entered),
+            "avg_return": round(float(returns.mean()), 6) if entered else None,
+            "median_return": round(float(np.median(returns)), 6) if entered else None,
+            "avg_targets_hit": round(float(results["targets_hit"][results["entered"]].mean()), 3) if entered else None,
+        })
+    summary["elapsed"] = round(time.perf_counter() - started_at, 4)
+    return summary
+
+
+def result_rows(strategies: Sequence[Dict[str, Any]], results: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """把回放结果和策略拼成JSON友好的列表"""
+    def number(value: Any) -> Optional[float]:
+        value = float(value)
+        return None if np.isnan(value) else round(value, 10)
+
+    rows = []
+    for i, strategy in enumerate(strategies):
+        rows.append({
+            "id": strategy.get("id"),
+            "token_address": strategy["token"],
+            "created_at": strategy["created_at"],
+            "direction": "long" if strategy.get("direction", LONG) == LONG else "short",
+            "entry_low": strategy.get("entry_low"),
+            "entry_high": strategy.get("entry_high"),
+            "take_profits": strategy.get("take_profits") or [],
+            "stop_loss": strategy.get("stop_loss"),
+            "holding_seconds": strategy.get("holding_seconds"),
+            "outcome": results["reason"][i],
+            "entry_price": number(results["entry_price"][i]) if results["entered"][i] else None,
+            "exit_price": number(results["exit_price"][i]) if results["entered"][i] else None,
+            "return": number(results["return"][i]),
+            "max_favorable": number(results["max_favorable"][i]),
+            "max_adverse": number(results["max_adverse"][i]),
+            "targets_hit": int(results["targets_hit"][i]),
+            "ticks": int(results["ticks"][i]),
+        })
+    return rows
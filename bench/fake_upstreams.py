@@ -0,0 +1,169 @@
+"""本地模拟的 DexScreener / GMGN / AI 上游，用于压测 server.py。
+
+三个上游共用一个端口（路径互不冲突），行为由环境变量 BENCH_FAKE_CONFIG
+中的JSON控制，例如:
+
+    {
+        "dexscreener": {"latency": {"dist": "lognormal", "median": 0.05, "sigma": 0.5}, "error_rate": 0.0},
+        "gmgn": {"latency": {"dist": "uniform", "min": 0.02, "max": 0.2}, "error_rate": 0.01},
+        "ai": {"latency": {"dist": "fixed", "value": 1.0}, "stream_chunks": 50, "chunk_interval": 0.02}
+    }
+"""
+import asyncio
+import json
+import os
+import random
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_CONFIG: Dict[str, Dict[str, Any]] = {
+    "dexscreener": {"latency": {"dist": "lognormal", "median": 0.05, "sigma": 0.5}, "error_rate": 0.0},
+    "gmgn": {"latency": {"dist": "lognormal", "median": 0.08, "sigma": 0.5}, "error_rate": 0.0},
+    "ai": {
+        "latency": {"dist": "lognormal", "median": 1.0, "sigma": 0.3},
+        "error_rate": 0.0,
+        "stream_chunks": 40,
+        "chunk_interval": 0.02
+    }
+}
+
+
+def load_config() -> Dict[str, Dict[str, Any]]:
+    config = {name: dict(values) for name, values in DEFAULT_CONFIG.items()}
+    for name, values in json.loads(os.getenv("BENCH_FAKE_CONFIG", "{}")).items():
+        config.setdefault(name, {}).update(values)
+    return config
+
+
+CONFIG = load_config()
+
+app = FastAPI(title="WaveTrader fake upstreams")
+
+
+def sample_latency(upstream: str) -> float:
+    spec = CONFIG[upstream].get("latency") or {"dist": "fixed", "value": 0}
+    dist = spec.get("dist", "fixed")
+    if dist == "lognormal":
+        return random.lognormvariate(0, spec.get("sigma", 0.5)) * spec["median"]
+    if dist == "uniform":
+        return random.uniform(spec["min"], spec["max"])
+    if dist == "exponential":
+        return random.expovariate(1 / spec["mean"])
+    return spec.get("value", 0)
+
+
+async def simulate(upstream: str) -> bool:
+    """等待一个随机延迟，按错误率返回是否应模拟失败"""
+    await asyncio.sleep(sample_latency(upstream))
+    return random.random() < CONFIG[upstream].get("error_rate", 0)
+
+
+def _pair(token_address: str, volume: float) -> Dict[str, Any]:
+    return {
+        "chainId": "solana",
+        "dexId": "raydium",
+        "url": f"https://dexscreener.com/solana/{token_address}",
+        "pairAddress": f"pair-{token_address}-{int(volume)}",
+        "baseToken": {"address": token_address, "name": "Bench Token", "symbol": "BENCH"},
+        "quoteToken": {"address": "So11111111111111111111111111111111111111112", "symbol": "SOL"},
+        "priceNative": "0.000012",
+        "priceUsd": f"{random.uniform(0.001, 0.002):.6f}",
+        "txns": {
+            "h1": {"buys": random.randint(10, 200), "sells": random.randint(10, 200)},
+            "h6": {"buys": random.randint(100, 900), "sells": random.randint(100, 900)},
+            "h24": {"buys": random.randint(500, 5000), "sells": random.randint(500, 5000)}
+        },
+        "volume": {"h1": volume / 24, "h6": volume / 4, "h24": volume},
+        "priceChange": {"h1": round(random.uniform(-5, 5), 2), "h6": round(random.uniform(-10, 10), 2), "h24": round(random.uniform(-30, 30), 2)},
+        "liquidity": {"usd": 250000.0, "base": 1.5e8, "quote": 900.0},
+        "fdv": 1500000,
+        "marketCap": 1500000,
+        "pairCreatedAt": 1700000000000
+    }
+
+
+@app.get("/latest/dex/tokens/{token_addresses}")
+async def dexscreener_tokens(token_addresses: str):
+    if await simulate("dexscreener"):
+        return JSONResponse(status_code=500, content={"error": "simulated failure"})
+    pairs = []
+    for token_address in token_addresses.split(","):
+        pairs.extend(_pair(token_address, v) for v in (120000.0, 35000.0, 800.0))
+    return {"schemaVersion": "1.0.0", "pairs": pairs}
+
+
+@app.get("/defi/router/v1/sol/tx/get_swap_route")
+async def gmgn_swap_route(request: Request):
+    if await simulate("gmgn"):
+        return JSONResponse(status_code=500, content={"code": -1, "msg": "simulated failure"})
+    return {
+        "code": 0,
+        "data": {
+            "quote": {"inAmount": request.query_params.get("in_amount"), "outAmount": "123456789"},
+            "raw_tx": {
+                # 与真实接口相近大小的base64交易
+                "swapTransaction": "A" * 1600,
+                "lastValidBlockHeight": 250000000
+            }
+        }
+    }
+
+
+@app.get("/defi/token/sol/{token_address}/account/{wallet_address}")
+async def gmgn_token_account(token_address: str, wallet_address: str):
+    if await simulate("gmgn"):
+        return JSONResponse(status_code=500, content={"code": -1, "msg": "simulated failure"})
+    return {"code": 0, "data": {"balance": str(10 ** 15), "decimals": 6}}
+
+
+@app.post("/defi/router/v1/sol/tx/submit_signed_transaction")
+async def gmgn_submit():
+    if await simulate("gmgn"):
+        return JSONResponse(status_code=500, content={"code": -1, "msg": "simulated failure"})
+    return {"code": 0, "data": {"hash": f"bench{random.getrandbits(64):016x}"}}
+
+
+@app.get("/defi/router/v1/sol/tx/get_transaction_status")
+async def gmgn_transaction_status():
+    if await simulate("gmgn"):
+        return JSONResponse(status_code=500, content={"code": -1, "msg": "simulated failure"})
+    return {"code": 0, "data": {"success": random.random() < 0.5, "expired": False}}
+
+
+STRATEGY_TEXT = "建议在当前价格附近分批买入，入场区间 0.0012-0.0013，止盈 0.0016 / 0.0019，止损 0.0010，持仓 1-3 天，仓位 5%。"
+
+
+@app.post("/v1/chat/completions")
+async def ai_chat_completions(request: Request):
+    body = await request.json()
+    config = CONFIG["ai"]
+
+    if not body.get("stream"):
+        if await simulate("ai"):
+            return JSONResponse(status_code=503, content={"error": "simulated overload"})
+        return {
+            "id": "bench",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": STRATEGY_TEXT}, "finish_reason": "stop"}]
+        }
+
+    # 流式：首个token前等待 latency，之后按 chunk_interval 输出
+    if await simulate("ai"):
+        return JSONResponse(status_code=503, content={"error": "simulated overload"})
+
+    chunks = max(int(config.get("stream_chunks", 40)), 1)
+    interval = config.get("chunk_interval", 0.02)
+    piece = max(len(STRATEGY_TEXT) // chunks, 1)
+
+    async def stream():
+        for i in range(chunks):
+            content = STRATEGY_TEXT[i * piece:(i + 1) * piece] if i < chunks - 1 else STRATEGY_TEXT[i * piece:]
+            chunk = {"choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(interval)
+        yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
@@ -0,0 +1,346 @@
+"""server.py 压测工具。
+
+启动本地模拟上游（bench/fake_upstreams.py）和指向它们的 server.py，
+对各个接口做并发压测，输出 RPS 和 p50/p95/p99，并保存为JSON便于前后对比。
+
+    python -m bench.run                                  # 全部场景
+    python -m bench.run -s analyze -s trade_buy -c 64 -d 20
+    python -m bench.run --no-cache --ai-latency 2.0 --error-rate 0.02
+    python -m bench.run --compare bench/results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+WALLET = "BenchWa11et1111111111111111111111111111111"
+SOL = "So11111111111111111111111111111111111111112"
+
+
+def _token(i: int) -> str:
+    return f"BenchToken{i:032d}"
+
+
+def _analyze_body(i: int, tokens: int) -> Dict[str, Any]:
+    return {
+        "token_address": _token(i % tokens),
+        "messages": [{"role": "user", "content": "请给出交易策略"}],
+        "temperature": 0.7,
+        "max_tokens": 2048
+    }
+
+
+# 场景名 -> (方法, 路径, 请求体生成函数(i, tokens), 是否流式)
+SCENARIOS: Dict[str, Tuple[str, Callable[[int, int], str], Optional[Callable[[int, int], Any]], bool]] = {
+    "analyze": ("POST", lambda i, n: "/api/analyze", _analyze_body, False),
+    "analyze_stream": ("POST", lambda i, n: "/api/analyze/stream", _analyze_body, True),
+    "analyze_batch": ("POST", lambda i, n: "/api/analyze/batch", lambda i, n: {
+        **{k: v for k, v in _analyze_body(i, n).items() if k != "token_address"},
+        "token_addresses": [_token((i * 10 + k) % n) for k in range(10)]
+    }, True),
+    "trade_buy": ("POST", lambda i, n: "/api/trade", lambda i, n: {
+        "token_address": _token(i % n), "amount": 0.1, "slippage": 1.0,
+        "wallet_address": WALLET, "trade_mode": "buy"
+    }, False),
+    "trade_sell": ("POST", lambda i, n: "/api/trade", lambda i, n: {
+        "token_address": _token(i % n), "amount": 100, "slippage": 1.0,
+        "wallet_address": WALLET, "trade_mode": "sell"
+    }, False),
+    "trade_with_token": ("POST", lambda i, n: "/api/trade_with_token", lambda i, n: {
+        "token_address": _token(i % n), "amount": 100, "slippage": 1.0,
+        "wallet_address": WALLET
+    }, False),
+    "confirm_trade": ("POST", lambda i, n: "/api/confirm_trade", lambda i, n: {
+        "signed_transaction": "A" * 1600
+    }, False),
+    "transaction_status": ("GET", lambda i, n: f"/api/transaction_status?hash=benchhash{i}&last_valid_height=250000000", None, False),
+    "validate_tokens": ("POST", lambda i, n: "/api/tokens/validate", lambda i, n: {
+        "token_addresses": [_token((i * 20 + k) % n) for k in range(20)]
+    }, True),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready in {timeout}s")
+
+
+@contextmanager
+def _uvicorn(app: str, port: int, env: Dict[str, str], workers: int = 1) -> Iterator[str]:
+    command = [
+        sys.executable, "-m", "uvicorn", app,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning", "--no-access-log"
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(f"{base_url}/openapi.json", process)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3)
+    }
+
+
+async def _run_scenario(base_url: str, name: str, concurrency: int, duration: float, warmup: float, tokens: int) -> Dict[str, Any]:
+    method, path_for, body_for, _ = SCENARIOS[name]
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(10 ** 12))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=600.0, limits=limits) as client:
+        async def one(record: bool) -> None:
+            i = next(counter)
+            body = body_for(i, tokens) if body_for else None
+            started_at = time.perf_counter()
+            try:
+                async with client.stream(method, path_for(i, tokens), json=body) as response:
+                    ttfb = time.perf_counter() - started_at
+                    async for _ in response.aiter_raw():
+                        pass
+                    status = str(response.status_code)
+            except httpx.HTTPError as e:
+                ttfb = None
+                status = type(e).__name__
+            if not record:
+                return
+            latencies.append(time.perf_counter() - started_at)
+            if ttfb is not None:
+                ttfbs.append(ttfb)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        async def worker(until: float, record: bool) -> None:
+            while time.perf_counter() < until:
+                await one(record)
+
+        if warmup > 0:
+            until = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(until, False) for _ in range(concurrency)))
+
+        started_at = time.perf_counter()
+        until = started_at + duration
+        await asyncio.gather(*(worker(until, True) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+
+    total = len(latencies)
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else None,
+        "rps": round(total / elapsed, 2) if elapsed else None,
+        "statuses": statuses,
+        "latency_ms": _percentiles(latencies),
+        "ttfb_ms": _percentiles(ttfbs)
+    }
+
+
+def _fake_config(args: argparse.Namespace) -> Dict[str, Any]:
+    def latency(median: float) -> Dict[str, Any]:
+        return {"dist": args.latency_dist, "median": median, "sigma": args.latency_sigma,
+                "value": median, "mean": median, "min": median / 2, "max": median * 2}
+
+    return {
+        "dexscreener": {"latency": latency(args.dex_latency), "error_rate": args.error_rate},
+        "gmgn": {"latency": latency(args.gmgn_latency), "error_rate": args.error_rate},
+        "ai": {
+            "latency": latency(args.ai_latency),
+            "error_rate": args.error_rate,
+            "stream_chunks": args.ai_chunks,
+            "chunk_interval": args.ai_chunk_interval
+        }
+    }
+
+
+def _server_env(upstream_url: str, args: argparse.Namespace) -> Dict[str, str]:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    env = {
+        "GMGN_API_HOST": upstream_url,
+        "AI_API_URL": upstream_url,
+        "AI_API_KEY": "bench",
+        "AI_MODEL_ID": "bench-model",
+        "DEXSCREENER_API_URL": upstream_url,
+        "LOG_LEVEL": args.server_log_level,
+        # 压测客户端来自同一IP，默认关闭限流
+        "MAX_REQUESTS_PER_MINUTE": str(args.rate_limit),
+        # 压测产生的行情和策略记录写到结果目录，不混进项目目录下的历史库
+        "HISTORY_DB_PATH": os.path.join(RESULTS_DIR, "bench_history.db")
+    }
+    if args.workers > 1:
+        env.update({
+            "SERVER_WORKERS": str(args.workers),
+            "STATE_BACKEND": "sqlite",
+            "STATE_SQLITE_PATH": os.path.join(RESULTS_DIR, "bench_state.db")
+        })
+    if args.no_cache:
+        env.update({
+            "MARKET_CACHE_TTL": "0",
+            "STRATEGY_CACHE_TTL": "0",
+            "TOKEN_VALIDATION_POSITIVE_TTL": "0",
+            "TOKEN_VALIDATION_NEGATIVE_TTL": "0"
+        })
+    if args.hedge:
+        env.update({"HEDGE_ENABLED": "True", "HEDGE_BUDGET_RATIO": str(args.hedge)})
+    return env
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results: Dict[str, Any]) -> None:
+    print(f"{'scenario':<20}{'reqs':>8}{'err%':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}")
+    for name, r in results.items():
+        lat, ttfb = r["latency_ms"], r["ttfb_ms"]
+        print(f"{name:<20}{r['requests']:>8}{(r['error_rate'] or 0) * 100:>8.2f}{r['rps'] or 0:>10.1f}"
+              f"{lat['p50'] or 0:>10.1f}{lat['p95'] or 0:>10.1f}{lat['p99'] or 0:>10.1f}{ttfb['p50'] or 0:>10.1f}")
+
+
+def _print_comparison(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    def delta(old: Optional[float], new: Optional[float]) -> str:
+        if not old or new is None:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\ncompared with {baseline['meta'].get('git_commit')} @ {baseline['meta'].get('timestamp')}")
+    print(f"{'scenario':<20}" + "".join(f" {h:>28}" for h in ("rps", "p50 ms", "p95 ms", "p99 ms")))
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        cells = [f"{old['rps']}->{new['rps']} ({delta(old['rps'], new['rps'])})"]
+        for q in ("p50", "p95", "p99"):
+            o, n = old["latency_ms"][q], new["latency_ms"][q]
+            cells.append(f"{o}->{n} ({delta(o, n)})")
+        print(f"{name:<20}" + "".join(f" {c:>28}" for c in cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="WaveTrader load benchmark")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (repeatable, default: all)")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="warmup seconds per scenario (not recorded)")
+    parser.add_argument("--tokens", type=int, default=50, help="number of distinct token addresses to cycle through")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for server.py")
+    parser.add_argument("--target", help="benchmark an already running server instead of starting one (fake upstreams are not started)")
+    parser.add_argument("--no-cache", action="store_true", help="disable market/strategy/validation caches in server.py")
+    parser.add_argument("--server-log-level", default="WARNING")
+    parser.add_argument("--rate-limit", type=float, default=0, help="MAX_REQUESTS_PER_MINUTE for server.py (0 disables the limiter)")
+    parser.add_argument("--hedge", type=float, default=0, help="enable request hedging in server.py with this HEDGE_BUDGET_RATIO")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["lognormal", "uniform", "exponential", "fixed"])
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal sigma (tail heaviness)")
+    parser.add_argument("--dex-latency", type=float, default=0.05, help="DexScreener median latency (s)")
+    parser.add_argument("--gmgn-latency", type=float, default=0.08, help="GMGN median latency (s)")
+    parser.add_argument("--ai-latency", type=float, default=1.0, help="AI median latency / time to first token (s)")
+    parser.add_argument("--ai-chunks", type=int, default=40, help="chunks per streamed AI response")
+    parser.add_argument("--ai-chunk-interval", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("-o", "--output", help="result JSON path (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="baseline result JSON to compare against")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    scenarios = args.scenario or list(SCENARIOS)
+    fake_config = _fake_config(args)
+
+    async def run_all(base_url: str) -> Dict[str, Any]:
+        results = {}
+        for name in scenarios:
+            print(f"running {name} (concurrency={args.concurrency}, duration={args.duration}s)...", flush=True)
+            results[name] = await _run_scenario(base_url, name, args.concurrency, args.duration, args.warmup, args.tokens)
+        return results
+
+    if args.target:
+        results = asyncio.run(run_all(args.target.rstrip("/")))
+    else:
+        fake_env = {"BENCH_FAKE_CONFIG": json.dumps(fake_config)}
+        if args.seed is not None:
+            fake_env["PYTHONHASHSEED"] = str(args.seed)
+        with _uvicorn("bench.fake_upstreams:app", _free_port(), fake_env) as upstream_url:
+            with _uvicorn("server:app", _free_port(), _server_env(upstream_url, args), args.workers) as server_url:
+                results = asyncio.run(run_all(server_url))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "fake_upstreams": None if args.target else fake_config
+        },
+        "results": results
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print()
+    _print_results(results)
+    print(f"\nsaved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            _print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
+
+from app_logging import get_logger, log_event
+from state import StateBackend
+
+logger = get_logger("cache")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """带过期时间的LRU缓存，并发的同key未命中只触发一次上游请求。
+
+    传入 shared 后端时，本地未命中会先查共享存储，拉取到的新值也会写回，
+    使多个worker进程共用同一份结果（键需为字符串，值需可JSON序列化）。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 10.0,
+        shared: Optional[StateBackend] = None,
+        namespace: str = ""
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.namespace = namespace
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # 每个进行中的请求还有多少个等待者
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """同时写入本地和共享存储"""
+        ttl = self.ttl if ttl is None else ttl
+        self.set(key, value, ttl)
+        await self._shared_set(key, value, ttl)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: Union[float, Callable[[Any], float], None] = None
+    ) -> Any:
+        """命中直接返回；未命中时合并并发请求，只有一个协程真正调用fetch。
+
+        ttl 可以是按结果计算过期时间的函数，例如对正/负结果使用不同的TTL。
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, fetch, ttl))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t))
+
+        # shield: 单个调用方被取消时不影响其他等待者共享的请求；
+        # 最后一个等待者也被取消（客户端断开、超过截止时间）时没人需要结果，取消上游请求
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            value, _ = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                task.cancel()
+                # 之后到来的请求重新拉取，而不是等待这个已取消的任务
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+        return value
+
+    async def _load(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: Union[float, Callable[[Any], float], None]
+    ) -> Tuple[Any, float]:
+        """返回 (值, 剩余有效期)；其他进程已拉取过的值沿用其原本的过期时间"""
+        if self.shared is not None:
+            entry = await self._shared_get(key)
+            if entry is not None:
+                return entry["value"], entry["expires_at"] - time.time()
+        value = await fetch()
+        ttl = ttl(value) if callable(ttl) else ttl
+        ttl = self.ttl if ttl is None else ttl
+        await self._shared_set(key, value, ttl)
+        return value, ttl
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def _shared_get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.shared.get(self._shared_key(key))
+        except Exception as e:
+            # 共享存储不可用时退化为本地缓存
+            log_event("读取共享缓存失败", logging.WARNING, logger=logger, namespace=self.namespace, error=str(e))
+            return None
+
+    async def _shared_set(self, key: Hashable, value: Any, ttl: float) -> None:
+        if self.shared is None or ttl <= 0:
+            return
+        entry = {"value": value, "expires_at": time.time() + ttl}
+        try:
+            await self.shared.set(self._shared_key(key), entry, ttl)
+        except Exception as e:
+            log_event("写入共享缓存失败", logging.WARNING, logger=logger, namespace=self.namespace, error=str(e))
+
+    def _on_fetched(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        # 失败结果不缓存；这里读取异常以免所有等待者都已取消时出现未处理警告
+        if task.exception() is None:
+            value, ttl = task.result()
+            self.set(key, value, ttl)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+from metrics import REQUESTS_CANCELLED
+
+# 当前请求的截止时间（time.monotonic()），没有截止时间时为None
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+# 客户端已断开，按nginx的惯例记为499（不会真正发给客户端，只用于指标）
+CLIENT_CLOSED_REQUEST = 499
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(status_code=504, detail=detail)
+
+
+def remaining() -> Optional[float]:
+    """当前请求剩余的秒数，没有截止时间时返回None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(needed: float = 0.0) -> None:
+    """剩余时间不足 needed 秒时直接失败，例如没必要再等一次重试退避"""
+    left = remaining()
+    if left is not None and left <= needed:
+        raise DeadlineExceeded()
+
+
+class RequestLifecycleMiddleware:
+    """请求随客户端断开或超过截止时间而取消。
+
+    截止时间来自请求头（默认 X-Request-Timeout，单位秒），没有时使用 default_timeout，
+    并且不超过 max_timeout。处理请求的协程被取消后，其中等待的上游请求、重试退避
+    都会随之取消，连接和并发槽位立即释放。响应尚未开始时，超时返回504。
+    """
+
+    def __init__(
+        self,
+        app,
+        header: str = "x-request-timeout",
+        default_timeout: Optional[float] = None,
+        max_timeout: Optional[float] = None
+    ):
+        self.app = app
+        self.header = header.lower()
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+
+    def _timeout(self, headers: Headers) -> Optional[float]:
+        timeout = self.default_timeout
+        value = headers.get(self.header)
+        if value:
+            try:
+                timeout = float(value)
+            except ValueError:
+                pass
+        if self.max_timeout:
+            timeout = min(timeout, self.max_timeout) if timeout else self.max_timeout
+        return timeout if timeout and timeout > 0 else None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self._timeout(Headers(scope=scope))
+        # 由一个协程统一读取客户端消息：请求体转交给应用，读到断开时取消应用
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = False
+        response_started = False
+        response_complete = False
+
+        async def pump() -> None:
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    messages.put_nowait(message)
+                    return
+                messages.put_nowait(message)
+
+        async def wrapped_receive():
+            if disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def wrapped_send(message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        token = _deadline.set(time.monotonic() + timeout if timeout else None)
+        try:
+            app_task = asyncio.ensure_future(self.app(scope, wrapped_receive, wrapped_send))
+        finally:
+            _deadline.reset(token)
+        pump_task = asyncio.ensure_future(pump())
+        try:
+            done, _ = await asyncio.wait({app_task, pump_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if app_task not in done and response_complete:
+                # 响应已经完整发出：uvicorn 之后的 receive() 会立即返回断开，这不是取消，
+                # 截止时间也不再适用，等应用执行完后台任务等收尾工作
+                await asyncio.wait({app_task})
+            if app_task.done():
+                app_task.result()
+                return
+            reason = "disconnect" if pump_task in done else "deadline"
+            app_task.cancel()
+            # 用 wait 等待应用退出，不吞掉外层自身的取消
+            await asyncio.wait({app_task})
+            if not app_task.cancelled():
+                app_task.exception()
+        finally:
+            pump_task.cancel()
+            if not app_task.done():
+                # 外层被取消（例如服务关闭）时一并取消
+                app_task.cancel()
+
+        route = getattr(scope.get("route"), "path", None) or "other"
+        REQUESTS_CANCELLED.inc(route, reason)
+        if response_started:
+            return
+        status = CLIENT_CLOSED_REQUEST if reason == "disconnect" else 504
+        body = json.dumps({"detail": "Client closed request" if reason == "disconnect" else "Request deadline exceeded"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
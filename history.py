@@ -0,0 +1,263 @@
+"""行情采样和AI策略的本地历史库（只追加的SQLite，WAL模式）。
+
+写入先进入有界队列，由后台线程按批提交，不阻塞事件循环；
+读取给回测使用，每次调用新开连接，可以放在线程里与写入并行。
+"""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app_logging import get_logger, log_event
+
+logger = get_logger("history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ticks (
+    token TEXT NOT NULL,
+    ts REAL NOT NULL,
+    price REAL NOT NULL,
+    volume REAL
+);
+CREATE INDEX IF NOT EXISTS ticks_token_ts ON ticks (token, ts);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL,
+    ts REAL NOT NULL,
+    price REAL,
+    pair TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS strategies (
+    id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    snapshot_id INTEGER REFERENCES snapshots (id),
+    model TEXT,
+    direction INTEGER NOT NULL,
+    entry_low REAL,
+    entry_high REAL,
+    take_profits TEXT NOT NULL,
+    stop_loss REAL,
+    holding_seconds REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS strategies_token_created ON strategies (token, created_at);
+"""
+
+STRATEGY_COLUMNS = (
+    "id", "token", "created_at", "snapshot_id", "model", "direction",
+    "entry_low", "entry_high", "take_profits", "stop_loss", "holding_seconds", "text"
+)
+
+_STOP = object()
+
+
+def _price(value: Any) -> Optional[float]:
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+class HistoryStore:
+    """只追加的历史库：ticks（价格采样）、snapshots（分析时的完整交易对）、strategies（解析后的策略价位）"""
+
+    def __init__(self, path: str, batch_size: int = 500, queue_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """写完队列中剩余的数据再退出"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _enqueue(self, item: Tuple[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_pairs(self, pairs: Dict[str, Dict[str, Any]], ts: Optional[float] = None) -> None:
+        """把一次DexScreener查询到的主交易对记为价格采样"""
+        ts = ts or time.time()
+        rows = []
+        for token, pair in pairs.items():
+            price = _price(pair.get("priceUsd"))
+            if price is not None:
+                volume = _price((pair.get("volume") or {}).get("h1"))
+                rows.append((token, ts, price, volume))
+        self.record_ticks(rows)
+
+    def record_ticks(self, rows: List[Tuple[str, float, float, Optional[float]]]) -> None:
+        """追加 (代币, 时间戳, 价格, 成交量) 采样"""
+        if rows:
+            self._enqueue(("ticks", rows))
+
+    def record_strategy(
+        self,
+        token: str,
+        pair: Optional[Dict[str, Any]],
+        text: str,
+        levels: Dict[str, Any],
+        model: Optional[str] = None,
+        created_at: Optional[float] = None
+    ) -> None:
+        """记录一条策略及生成时的市场快照"""
+        self._enqueue(("strategy", (token, created_at or time.time(), pair, text, levels, model)))
+
+    def _writer(self) -> None:
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                # 攒一批后在同一个事务里提交
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if _STOP in batch:
+                    stopping = True
+                    batch = [item for item in batch if item is not _STOP]
+                try:
+                    with conn:
+                        for kind, payload in batch:
+                            if kind == "ticks":
+                                conn.executemany("INSERT INTO ticks VALUES (?, ?, ?, ?)", payload)
+                            else:
+                                self._insert_strategy(conn, *payload)
+                except sqlite3.Error as e:
+                    log_event("写入历史库失败", logging.WARNING, logger=logger, error=str(e), items=len(batch))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _insert_strategy(
+        conn: sqlite3.Connection,
+        token: str,
+        created_at: float,
+        pair: Optional[Dict[str, Any]],
+        text: str,
+        levels: Dict[str, Any],
+        model: Optional[str]
+    ) -> None:
+        snapshot_id = None
+        if pair is not None:
+            price = _price(pair.get("priceUsd"))
+            snapshot_id = conn.execute(
+                "INSERT INTO snapshots (token, ts, price, pair) VALUES (?, ?, ?, ?)",
+                (token, created_at, price, json.dumps(pair, ensure_ascii=False))
+            ).lastrowid
+            if price is not None:
+                # 分析时的价格本身也是一个采样点
+                conn.execute("INSERT INTO ticks VALUES (?, ?, ?, ?)", (token, created_at, price, None))
+        conn.execute(
+            "INSERT INTO strategies (token, created_at, snapshot_id, model, direction, entry_low, entry_high,"
+            " take_profits, stop_loss, holding_seconds, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                token, created_at, snapshot_id, model, levels["direction"],
+                levels.get("entry_low"), levels.get("entry_high"),
+                json.dumps(levels.get("take_profits") or []),
+                levels.get("stop_loss"), levels.get("holding_seconds"), text
+            )
+        )
+
+    # 以下读取方法是同步的，在线程中调用
+
+    def strategies(
+        self,
+        token_addresses: Optional[Sequence[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+        include_text: bool = True
+    ) -> List[Dict[str, Any]]:
+        columns = STRATEGY_COLUMNS if include_text else STRATEGY_COLUMNS[:-1]
+        where, params = self._filters(token_addresses, since, until, "created_at")
+        sql = f"SELECT {', '.join(columns)} FROM strategies{where} ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        result = []
+        for row in rows:
+            item = dict(zip(columns, row))
+            item["take_profits"] = json.loads(item["take_profits"])
+            result.append(item)
+        return result
+
+    def load_ticks(
+        self,
+        token_addresses: Optional[Sequence[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """按代币返回按时间排序的 (时间戳, 价格) 数组"""
+        where, params = self._filters(None, since, until, "ts")
+        where = where.replace(" WHERE ", " AND ", 1)
+        conn = self._connect()
+        try:
+            if token_addresses is None:
+                token_addresses = [row[0] for row in conn.execute("SELECT DISTINCT token FROM ticks")]
+            result = {}
+            for token in token_addresses:
+                # 按代币分别查询走 (token, ts) 索引，结果直接是有序的浮点数组
+                rows = conn.execute(f"SELECT ts, price FROM ticks WHERE token = ?{where} ORDER BY ts", [token, *params]).fetchall()
+                if rows:
+                    values = np.array(rows, dtype=np.float64)
+                    result[token] = (values[:, 0], values[:, 1])
+        finally:
+            conn.close()
+        return result
+
+    @staticmethod
+    def _filters(
+        token_addresses: Optional[Sequence[str]],
+        since: Optional[float],
+        until: Optional[float],
+        ts_column: str
+    ) -> Tuple[str, List[Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if token_addresses:
+            clauses.append(f"token IN ({', '.join('?' * len(token_addresses))})")
+            params.extend(token_addresses)
+        if since is not None:
+            clauses.append(f"{ts_column} >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{ts_column} <= ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
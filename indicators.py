@@ -0,0 +1,209 @@
+"""基于价格序列的技术指标。
+
+compute() 对整段序列做一次向量化计算；IndicatorState 在每个新采样到来时
+以O(1)增量更新，两者的定义一致（EMA/RSI 都以第一个值为初值递推）。
+周期以采样点为单位，实际时长取决于轮询间隔。
+"""
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+SMA_PERIOD = 20
+EMA_FAST = 12
+EMA_SLOW = 26
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+VWAP_PERIOD = 120
+
+
+@lru_cache(maxsize=256)
+def _ema_weights(n: int, alpha: float) -> np.ndarray:
+    """以 x[0] 为初值递推 n-1 次的EMA，等价于与该权重向量做点积"""
+    weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=np.float64)
+    weights[0] = (1 - alpha) ** (n - 1)
+    weights.flags.writeable = False
+    return weights
+
+
+def _rsi(avg_gain: float, avg_loss: float) -> float:
+    if avg_loss == 0:
+        return 50.0 if avg_gain == 0 else 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+def compute(prices: Any, volumes: Any = None) -> Dict[str, Optional[float]]:
+    """对价格（及成交量）序列计算全部指标，缺失值（NaN）会被跳过"""
+    prices = np.asarray(prices, dtype=np.float64)
+    valid = np.isfinite(prices)
+    if volumes is not None:
+        volumes = np.asarray(volumes, dtype=np.float64)[valid]
+    prices = prices[valid]
+    n = len(prices)
+    if n == 0:
+        return {"samples": 0}
+
+    deltas = np.diff(prices)
+    result: Dict[str, Optional[float]] = {
+        "samples": n,
+        "price": float(prices[-1]),
+        "sma": float(prices[-SMA_PERIOD:].mean()) if n >= SMA_PERIOD else None,
+        "ema_fast": float(prices @ _ema_weights(n, 2 / (EMA_FAST + 1))),
+        "ema_slow": float(prices @ _ema_weights(n, 2 / (EMA_SLOW + 1))),
+        "rsi": None,
+        "volatility": None,
+        "vwap": None,
+    }
+
+    if len(deltas) >= RSI_PERIOD:
+        weights = _ema_weights(len(deltas), 1 / RSI_PERIOD)
+        result["rsi"] = _rsi(float(np.maximum(deltas, 0) @ weights), float(np.maximum(-deltas, 0) @ weights))
+
+    # 没有高低价，用相邻采样的平均绝对变化近似ATR，表示为当前价格的百分比
+    if len(deltas) and prices[-1]:
+        result["volatility"] = float(np.abs(deltas[-ATR_PERIOD:]).mean() / prices[-1] * 100)
+
+    if volumes is not None:
+        p, v = prices[-VWAP_PERIOD:], volumes[-VWAP_PERIOD:]
+        v = np.where(np.isfinite(v) & (v > 0), v, 0.0)
+        total = v.sum()
+        if total > 0:
+            result["vwap"] = float(p @ v / total)
+
+    return result
+
+
+class IndicatorState:
+    """随新采样增量更新的指标，每次 update 为O(1)"""
+
+    __slots__ = (
+        "samples", "price", "ema_fast", "ema_slow", "avg_gain", "avg_loss",
+        "_window", "_window_sum", "_abs_deltas", "_abs_delta_sum", "_vwap", "_pv_sum", "_v_sum"
+    )
+
+    def __init__(self):
+        self.samples = 0
+        self.price: Optional[float] = None
+        self.ema_fast = 0.0
+        self.ema_slow = 0.0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self._window: deque = deque(maxlen=SMA_PERIOD)
+        self._window_sum = 0.0
+        self._abs_deltas: deque = deque(maxlen=ATR_PERIOD)
+        self._abs_delta_sum = 0.0
+        self._vwap: deque = deque(maxlen=VWAP_PERIOD)
+        self._pv_sum = 0.0
+        self._v_sum = 0.0
+
+    def update(self, price: float, volume: Optional[float] = None) -> None:
+        if price != price:  # NaN
+            return
+        previous = self.price
+        self.samples += 1
+        self.price = price
+
+        if len(self._window) == SMA_PERIOD:
+            self._window_sum -= self._window[0]
+        self._window.append(price)
+        self._window_sum += price
+
+        if previous is None:
+            self.ema_fast = self.ema_slow = price
+        else:
+            self.ema_fast += 2 / (EMA_FAST + 1) * (price - self.ema_fast)
+            self.ema_slow += 2 / (EMA_SLOW + 1) * (price - self.ema_slow)
+
+            delta = price - previous
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            if self.samples == 2:
+                self.avg_gain, self.avg_loss = gain, loss
+            else:
+                self.avg_gain += (gain - self.avg_gain) / RSI_PERIOD
+                self.avg_loss += (loss - self.avg_loss) / RSI_PERIOD
+
+            if len(self._abs_deltas) == ATR_PERIOD:
+                self._abs_delta_sum -= self._abs_deltas[0]
+            self._abs_deltas.append(abs(delta))
+            self._abs_delta_sum += abs(delta)
+
+        volume = volume if volume is not None and volume == volume and volume > 0 else 0.0
+        if len(self._vwap) == VWAP_PERIOD:
+            old_price, old_volume = self._vwap[0]
+            self._pv_sum -= old_price * old_volume
+            self._v_sum -= old_volume
+        self._vwap.append((price, volume))
+        self._pv_sum += price * volume
+        self._v_sum += volume
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        if not self.samples:
+            return {"samples": 0}
+        deltas = self.samples - 1
+        return {
+            "samples": self.samples,
+            "price": self.price,
+            "sma": self._window_sum / SMA_PERIOD if len(self._window) == SMA_PERIOD else None,
+            "ema_fast": self.ema_fast,
+            "ema_slow": self.ema_slow,
+            "rsi": _rsi(self.avg_gain, self.avg_loss) if deltas >= RSI_PERIOD else None,
+            "volatility": (
+                self._abs_delta_sum / len(self._abs_deltas) / self.price * 100
+                if self._abs_deltas and self.price else None
+            ),
+            "vwap": self._pv_sum / self._v_sum if self._v_sum > 0 else None,
+        }
+
+
+def buy_pressure(pair: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """各时间窗口内买入笔数占总成交笔数的比例"""
+    txns = pair.get("txns") or {}
+    result: Dict[str, Optional[float]] = {}
+    for window in ("m5", "h1", "h6", "h24"):
+        counts = txns.get(window) or {}
+        buys, sells = counts.get("buys") or 0, counts.get("sells") or 0
+        result[window] = buys / (buys + sells) if buys + sells else None
+    return result
+
+
+def _fmt(value: Optional[float], digits: int = 8) -> str:
+    return "Unknown" if value is None else f"{value:.{digits}g}"
+
+
+def _pct(value: Optional[float]) -> str:
+    return "Unknown" if value is None else f"{value * 100:.1f}%"
+
+
+def format_summary(
+    summary: Optional[Dict[str, Optional[float]]],
+    pressure: Dict[str, Optional[float]],
+    interval: Optional[float] = None
+) -> str:
+    """生成写入system prompt的紧凑指标摘要"""
+    lines = [
+        "买卖力量（买入笔数占比）:",
+        f"- 5分钟: {_pct(pressure.get('m5'))} / 1小时: {_pct(pressure.get('h1'))}"
+        f" / 6小时: {_pct(pressure.get('h6'))} / 24小时: {_pct(pressure.get('h24'))}",
+    ]
+    if not summary or summary.get("samples", 0) < 2:
+        return "\n".join(lines)
+
+    span = f"，约 {summary['samples'] * interval / 60:.0f} 分钟" if interval else ""
+    price = summary["price"]
+    vwap = summary.get("vwap")
+    vs_vwap = f"（当前价格{'高于' if price >= vwap else '低于'}VWAP {abs(price / vwap - 1) * 100:.2f}%）" if vwap else ""
+    if summary["ema_fast"] == summary["ema_slow"]:
+        trend = "持平"
+    else:
+        trend = "多头排列" if summary["ema_fast"] > summary["ema_slow"] else "空头排列"
+    lines[:0] = [
+        f"技术指标（最近 {summary['samples']} 个采样{span}，周期按采样点计）:",
+        f"- RSI({RSI_PERIOD}): {_fmt(summary.get('rsi'), 4)}",
+        f"- SMA({SMA_PERIOD}): {_fmt(summary.get('sma'))}",
+        f"- EMA({EMA_FAST}/{EMA_SLOW}): {_fmt(summary['ema_fast'])} / {_fmt(summary['ema_slow'])}（{trend}）",
+        f"- VWAP: {_fmt(vwap)}{vs_vwap}",
+        f"- 波动率(ATR近似, {ATR_PERIOD}): {_fmt(summary.get('volatility'), 3)}%",
+        "",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app_logging import get_logger, log_event
+from state import StateBackend
+
+logger = get_logger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, payload: Any):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+
+    @property
+    def done(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """固定数量的后台worker执行任务，完成的结果保留一段时间供轮询。
+
+    传入 store 时任务状态会同步写入共享存储，任意worker进程都能查询
+    其他进程提交的任务（任务本身仍由提交它的进程执行）。
+    """
+
+    # 未完成任务在共享存储中的保留时间，防止进程退出后留下永不过期的记录
+    PENDING_TTL = 3600.0
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = 4,
+        queue_size: int = 100,
+        retention: float = 600.0,
+        store: Optional[StateBackend] = None
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.retention = retention
+        self.store = store
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def submit(self, payload: Any) -> Job:
+        """队列已满时抛出 asyncio.QueueFull"""
+        self._prune()
+        job = Job(payload)
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        await self._publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is not None and self._expired(job, time.time()):
+            del self._jobs[job_id]
+            return None
+        return job
+
+    async def lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态，本进程没有时再查共享存储"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.store is None:
+            return None
+        try:
+            return await self.store.get(self._store_key(job_id))
+        except Exception as e:
+            log_event("读取任务状态失败", logging.WARNING, logger=logger, job_id=job_id, error=str(e))
+            return None
+
+    async def cancel(self, job_id: str) -> Optional[bool]:
+        """取消本进程的任务：排队中的直接标记失败，执行中的取消其上游调用。
+
+        任务不存在返回None，已经结束返回False。
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.done:
+            return False
+        job.cancelled = True
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self._finish_cancelled(job)
+            await self._publish(job)
+        return True
+
+    def _finish_cancelled(self, job: Job) -> None:
+        job.state = FAILED
+        job.error = {"status_code": 499, "detail": "Job cancelled by client"}
+        job.payload = None
+        job.finished_at = time.time()
+
+    def _store_key(self, job_id: str) -> str:
+        return f"job:{job_id}"
+
+    async def _publish(self, job: Job) -> None:
+        if self.store is None:
+            return
+        ttl = self.retention if job.done else self.PENDING_TTL
+        try:
+            await self.store.set(self._store_key(job.id), job.to_dict(), ttl)
+        except Exception as e:
+            log_event("写入任务状态失败", logging.WARNING, logger=logger, job_id=job.id, error=str(e))
+
+    def _expired(self, job: Job, now: float) -> bool:
+        return job.done and now - job.finished_at > self.retention
+
+    def _prune(self) -> None:
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if self._expired(j, now)]:
+            del self._jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job.cancelled:
+                # 排队期间已被取消
+                self._queue.task_done()
+                continue
+            job.state = RUNNING
+            job.started_at = time.time()
+            await self._publish(job)
+            # 在子任务中执行，取消单个任务时worker本身继续运行
+            job.task = asyncio.ensure_future(self.handler(job.payload))
+            try:
+                try:
+                    await asyncio.wait({job.task})
+                except asyncio.CancelledError:
+                    # worker 被停止
+                    job.task.cancel()
+                    job.state = FAILED
+                    job.error = {"status_code": 503, "detail": "Job cancelled"}
+                    raise
+                if job.task.cancelled():
+                    self._finish_cancelled(job)
+                else:
+                    job.result = job.task.result()
+                    job.state = SUCCEEDED
+            except Exception as e:
+                job.state = FAILED
+                job.error = {
+                    "status_code": getattr(e, "status_code", 500),
+                    "detail": getattr(e, "detail", str(e))
+                }
+            finally:
+                # 结果不再需要原始请求体，释放内存
+                job.payload = None
+                job.finished_at = time.time()
+                job.task = None
+                self._queue.task_done()
+            await self._publish(job)
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from array import array
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+
+from app_logging import get_logger, log_event
+from indicators import IndicatorState
+
+logger = get_logger("market_feed")
+
+# 每次轮询为每个代币记录的字段
+SAMPLE_FIELDS = (
+    "ts",
+    "price_usd",
+    "price_native",
+    "volume_h1",
+    "volume_h24",
+    "liquidity_usd",
+    "buys_h1",
+    "sells_h1",
+    "buys_h24",
+    "sells_h24",
+)
+
+
+class SeriesBuffer:
+    """固定容量的多列环形缓冲区，每列是一个 array('d')，内存占用与运行时长无关"""
+
+    def __init__(self, fields: Sequence[str], capacity: int):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._columns = {field: array("d", bytes(8 * capacity)) for field in self.fields}
+        self._head = 0  # 下一次写入的位置
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, values: Dict[str, float]) -> None:
+        for field, column in self._columns.items():
+            column[self._head] = values.get(field, float("nan"))
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def column(self, field: str, limit: Optional[int] = None) -> array:
+        """按时间顺序返回某一列最近 limit 个值（副本）"""
+        column = self._columns[field]
+        if self._size < self.capacity:
+            values = column[:self._size]
+        else:
+            values = column[self._head:] + column[:self._head]
+        return values[-limit:] if limit else values
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        if not self._size:
+            return None
+        index = (self._head - 1) % self.capacity
+        return {field: column[index] for field, column in self._columns.items()}
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def pair_sample(pair: Dict[str, Any], ts: float) -> Dict[str, float]:
+    """从DexScreener交易对数据中取出需要记录的数值"""
+    txns = pair.get("txns") or {}
+    volume = pair.get("volume") or {}
+    return {
+        "ts": ts,
+        "price_usd": _number(pair.get("priceUsd")),
+        "price_native": _number(pair.get("priceNative")),
+        "volume_h1": _number(volume.get("h1")),
+        "volume_h24": _number(volume.get("h24")),
+        "liquidity_usd": _number((pair.get("liquidity") or {}).get("usd")),
+        "buys_h1": _number((txns.get("h1") or {}).get("buys")),
+        "sells_h1": _number((txns.get("h1") or {}).get("sells")),
+        "buys_h24": _number((txns.get("h24") or {}).get("buys")),
+        "sells_h24": _number((txns.get("h24") or {}).get("sells")),
+    }
+
+
+class _TrackedToken:
+    __slots__ = ("series", "indicators", "pair", "updated_at")
+
+    def __init__(self, capacity: int):
+        self.series = SeriesBuffer(SAMPLE_FIELDS, capacity)
+        self.indicators = IndicatorState()
+        self.pair: Optional[Dict[str, Any]] = None
+        self.updated_at = 0.0
+
+
+class MarketPoller:
+    """后台定时批量刷新关注代币的DexScreener数据。
+
+    每个代币保留最新的完整交易对（供分析请求直接读取）、定长的历史序列
+    以及随采样增量更新的技术指标。
+    """
+
+    def __init__(
+        self,
+        fetch_main_pairs: Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]],
+        interval: float = 15.0,
+        capacity: int = 720,
+        max_tokens: int = 500,
+        max_age: Optional[float] = None
+    ):
+        self.fetch_main_pairs = fetch_main_pairs
+        self.interval = interval
+        self.capacity = capacity
+        self.max_tokens = max_tokens
+        # 超过该时间没有刷新的快照视为过期，分析请求改为实时获取
+        self.max_age = max_age if max_age is not None else interval * 2
+        self._tokens: Dict[str, _TrackedToken] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    @property
+    def tokens(self) -> List[str]:
+        return list(self._tokens)
+
+    def track(self, token_addresses: Iterable[str]) -> List[str]:
+        """加入轮询列表，返回新加入的地址；超过 max_tokens 时抛出 ValueError"""
+        added = [a for a in dict.fromkeys(token_addresses) if a and a not in self._tokens]
+        if len(self._tokens) + len(added) > self.max_tokens:
+            raise ValueError(f"At most {self.max_tokens} tokens can be tracked")
+        for address in added:
+            self._tokens[address] = _TrackedToken(self.capacity)
+        if added:
+            self._wakeup.set()
+        return added
+
+    def untrack(self, token_address: str) -> bool:
+        return self._tokens.pop(token_address, None) is not None
+
+    def is_tracking(self, token_address: str) -> bool:
+        return token_address in self._tokens
+
+    def snapshot(self, token_address: str) -> Optional[Dict[str, Any]]:
+        """返回未过期的最新交易对数据"""
+        tracked = self._tokens.get(token_address)
+        if tracked is None or tracked.pair is None:
+            return None
+        if time.time() - tracked.updated_at > self.max_age:
+            return None
+        return tracked.pair
+
+    def series(self, token_address: str) -> Optional[SeriesBuffer]:
+        tracked = self._tokens.get(token_address)
+        return tracked.series if tracked is not None else None
+
+    def indicators(self, token_address: str) -> Optional[Dict[str, Optional[float]]]:
+        tracked = self._tokens.get(token_address)
+        return tracked.indicators.summary() if tracked is not None else None
+
+    async def refresh(self) -> None:
+        token_addresses = self.tokens
+        if not token_addresses:
+            return
+        started_at = time.monotonic()
+        pairs = await self.fetch_main_pairs(token_addresses)
+        now = time.time()
+        for address, pair in pairs.items():
+            tracked = self._tokens.get(address)
+            if tracked is None:
+                continue
+            tracked.pair = pair
+            tracked.updated_at = now
+            sample = pair_sample(pair, now)
+            tracked.series.append(sample)
+            tracked.indicators.update(sample["price_usd"], sample["volume_h1"])
+        log_event(
+            "刷新关注代币行情",
+            logging.DEBUG,
+            logger=logger,
+            tokens=len(token_addresses),
+            updated=len(pairs),
+            latency=time.monotonic() - started_at
+        )
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                log_event("刷新关注代币行情失败", logging.WARNING, logger=logger, error=str(e))
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
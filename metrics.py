@@ -0,0 +1,245 @@
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from timing import record as record_phase
+
+# 覆盖从毫秒级的行情接口到最长600秒的AI调用
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield from super().render()
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, size: int):
+        # 每个桶只记录落在本桶的次数，输出时再累加
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """固定桶直方图：每个标签组合预分配计数数组，observe 只做二分查找和整数自增"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = _HistogramChild(len(self.buckets))
+        child.counts[bisect_left(self.buckets, value)] += 1
+        child.sum += value
+
+    def render(self) -> Iterable[str]:
+        yield from super().render()
+        for labels, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {repr(child.sum)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "wavetrader_http_request_duration_seconds", "HTTP request latency by route", ["route"]
+))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "wavetrader_http_requests_total", "HTTP responses by route, method and status code", ["route", "method", "status"]
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "wavetrader_http_requests_in_flight", "HTTP requests currently being handled"
+))
+UPSTREAM_DURATION = REGISTRY.register(Histogram(
+    "wavetrader_upstream_request_duration_seconds", "Upstream call latency", ["upstream"]
+))
+UPSTREAM_RESPONSES = REGISTRY.register(Counter(
+    "wavetrader_upstream_responses_total", "Upstream responses by status code (error = no response)", ["upstream", "status"]
+))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "wavetrader_upstream_requests_in_flight", "Upstream calls currently in progress", ["upstream"]
+))
+AI_RETRIES = REGISTRY.register(Counter(
+    "wavetrader_ai_retries_total", "AI request retries by reason", ["reason"]
+))
+AI_BACKOFF_SECONDS = REGISTRY.register(Counter(
+    "wavetrader_ai_backoff_seconds_total", "Total time spent sleeping between AI retries"
+))
+
+UPSTREAM_CONCURRENCY_LIMIT = REGISTRY.register(Gauge(
+    "wavetrader_upstream_concurrency_limit", "Current adaptive concurrency limit per upstream", ["upstream"]
+))
+UPSTREAM_REJECTED = REGISTRY.register(Counter(
+    "wavetrader_upstream_rejected_total", "Upstream calls rejected without being sent", ["upstream", "reason"]
+))
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "wavetrader_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)", ["upstream"]
+))
+UPSTREAM_HEDGES = REGISTRY.register(Counter(
+    "wavetrader_upstream_hedges_total", "Hedged upstream requests by outcome (sent, won, no_budget)", ["upstream", "outcome"]
+))
+UPSTREAM_HEDGE_DELAY = REGISTRY.register(Gauge(
+    "wavetrader_upstream_hedge_delay_seconds", "Current delay before a hedged request is sent", ["upstream"]
+))
+AI_PROVIDER_LATENCY = REGISTRY.register(Gauge(
+    "wavetrader_ai_provider_latency_ewma_seconds", "Recent successful AI request latency per provider (EWMA)", ["provider"]
+))
+AI_PROVIDER_ERROR_RATE = REGISTRY.register(Gauge(
+    "wavetrader_ai_provider_error_rate", "Recent AI request failure rate per provider (EWMA)", ["provider"]
+))
+AI_FAILOVERS = REGISTRY.register(Counter(
+    "wavetrader_ai_failovers_total", "AI requests moved to another provider after a failure", ["provider", "reason"]
+))
+AI_RACES = REGISTRY.register(Counter(
+    "wavetrader_ai_races_total", "Raced AI requests by winning provider", ["provider"]
+))
+REQUESTS_CANCELLED = REGISTRY.register(Counter(
+    "wavetrader_http_requests_cancelled_total", "Requests cancelled because the client disconnected or the deadline passed", ["route", "reason"]
+))
+RATE_LIMITED = REGISTRY.register(Counter(
+    "wavetrader_rate_limited_total", "Client requests rejected by the rate limiter", ["route"]
+))
+
+
+class upstream_timer:
+    """记录一次上游调用的耗时、状态码和并发数
+
+    用法:
+        with upstream_timer("dexscreener") as timer:
+            response = await client.get(url)
+            timer.status = response.status_code
+        timer.latency  # 耗时（秒）
+    """
+
+    __slots__ = ("upstream", "status", "started_at", "latency")
+
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        self.status: Optional[int] = None
+        self.started_at = 0.0
+        self.latency = 0.0
+
+    def __enter__(self) -> "upstream_timer":
+        UPSTREAM_IN_FLIGHT.inc(self.upstream)
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.latency = time.perf_counter() - self.started_at
+        UPSTREAM_IN_FLIGHT.dec(self.upstream)
+        UPSTREAM_DURATION.observe(self.latency, self.upstream)
+        UPSTREAM_RESPONSES.inc(self.upstream, str(self.status) if self.status is not None else "error")
+        # 同时计入当前请求的 Server-Timing
+        record_phase(self.upstream, self.latency)
+
+
+class MetricsMiddleware:
+    """纯ASGI中间件，按路由模板（而不是原始路径）统计请求耗时和状态码"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # 静态文件和未匹配的路径统一归类，避免标签数量无限增长
+            route_label = getattr(route, "path", None) or "other"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started_at, route_label)
+            HTTP_REQUESTS.inc(route_label, scope["method"], str(status))
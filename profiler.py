@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """项目内文件用相对路径，第三方库只保留包名和文件名"""
+    if filename.startswith(_ROOT + os.sep):
+        return os.path.relpath(filename, _ROOT)
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def _is_idle(frame) -> bool:
+    # 事件循环空闲时停在 selector 的 select/poll 上
+    return frame.f_code.co_filename.endswith("selectors.py")
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def _sample(
+    thread_id: int,
+    seconds: float,
+    interval: float,
+    include_idle: bool,
+    stop: threading.Event
+) -> Dict[str, Any]:
+    stacks: Counter = Counter()
+    samples = 0
+    idle = 0
+    started_at = time.monotonic()
+    deadline = started_at + seconds
+    while not stop.is_set() and time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples += 1
+            if _is_idle(frame):
+                idle += 1
+                if include_idle:
+                    stacks[_fold(frame)] += 1
+            else:
+                stacks[_fold(frame)] += 1
+        del frame
+        stop.wait(interval)
+    return {
+        "stacks": stacks,
+        "samples": samples,
+        "idle_samples": idle,
+        "duration": time.monotonic() - started_at
+    }
+
+
+def collapsed(stacks: Counter) -> str:
+    """折叠栈格式（每行 "栈帧;栈帧;... 次数"），可直接交给 flamegraph.pl、speedscope 等工具"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class SamplingProfiler:
+    """在后台线程中定期采样事件循环线程的Python调用栈，不需要重启或预先埋点。
+
+    采样只反映占用事件循环的代码（CPU热点、同步阻塞）；等待上游的耗时
+    不占用事件循环，看 Server-Timing 中的阶段耗时。同一时间只运行一次采样。
+    """
+
+    def __init__(self):
+        self._running = False
+
+    async def profile(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        include_idle: bool = False
+    ) -> Dict[str, Any]:
+        """采样当前事件循环 seconds 秒，返回各调用栈的采样次数"""
+        if self._running:
+            raise ProfilerBusy("A profile is already running")
+        self._running = True
+        thread_id = threading.get_ident()
+        stop = threading.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, _sample, thread_id, seconds, interval, include_idle, stop)
+        finally:
+            # 请求被取消时让采样线程尽快退出
+            stop.set()
+            self._running = False
@@ -0,0 +1,182 @@
+import asyncio
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from metrics import AI_PROVIDER_ERROR_RATE, AI_PROVIDER_LATENCY
+
+_NAME = re.compile(r"^[a-z0-9_]+$")
+
+
+class Provider:
+    """一个OpenAI兼容的AI接口及其近期的耗时、错误率统计"""
+
+    def __init__(
+        self,
+        name: str,
+        api_url: Optional[str],
+        api_key: Optional[str],
+        model: Optional[str],
+        weight: float = 1.0,
+        max_concurrency: int = 20,
+        upstream: Optional[str] = None
+    ):
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid AI provider name '{name}', use lowercase letters, digits and '_'")
+        if weight <= 0:
+            raise ValueError(f"AI provider '{name}' weight must be positive")
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        # 对应的共享HTTP客户端（各自的并发上限和熔断）
+        self.upstream = upstream or f"ai_{name}"
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # 成功请求耗时的EWMA（秒）
+        self.error_rate = 0.0  # 失败率的EWMA，随时间衰减
+        self.updated_at = 0.0
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def completions_url(self) -> str:
+        base_url = self.api_url.rstrip('/')
+        if not base_url.endswith('/v1'):
+            base_url += '/v1'
+        return f"{base_url}/chat/completions"
+
+
+class ProviderFailure(Exception):
+    """单个提供方的可重试失败（5xx、429、网络错误、超时、熔断、无效响应），换下一个提供方继续"""
+
+    def __init__(
+        self,
+        provider: Provider,
+        reason: str,
+        status_code: int = 500,
+        detail: str = "",
+        headers: Optional[Dict[str, str]] = None
+    ):
+        super().__init__(detail or reason)
+        self.provider = provider
+        self.reason = reason
+        self.status_code = status_code
+        self.detail = detail or reason
+        self.headers = headers
+
+
+class ProviderPool:
+    """按近期耗时和错误率挑选AI提供方。
+
+    得分 = 耗时EWMA x (1 + error_penalty x 错误率) x (进行中请求数 + 1) / 权重，越小越优先。
+    错误率按 error_half_life 秒的半衰期衰减，出过错的提供方过一段时间会重新分到流量；
+    还没有耗时样本的提供方按当前最快的耗时计算，以便尽快得到样本。
+    已达到并发上限的提供方排在最后。
+    """
+
+    def __init__(
+        self,
+        providers: Iterable[Provider],
+        alpha: float = 0.3,
+        error_penalty: float = 10.0,
+        error_half_life: float = 60.0,
+        key: Optional[str] = None
+    ):
+        self.providers: List[Provider] = list(providers)
+        if not self.providers:
+            raise ValueError("At least one AI provider is required")
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.error_half_life = error_half_life
+        # 策略缓存键的一部分：同一个池内各提供方的结果可以互相复用
+        self.key = key or "pool:" + ",".join(p.name for p in self.providers)
+
+    def __len__(self) -> int:
+        return len(self.providers)
+
+    def error_rate(self, provider: Provider, now: Optional[float] = None) -> float:
+        if not provider.error_rate:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return provider.error_rate * 0.5 ** ((now - provider.updated_at) / self.error_half_life)
+
+    def score(self, provider: Provider, now: Optional[float] = None, floor: Optional[float] = None) -> float:
+        if floor is None:
+            floor = min((p.latency for p in self.providers if p.latency is not None), default=0.0)
+        latency = max(provider.latency if provider.latency is not None else floor, floor, 1e-3)
+        penalty = 1 + self.error_penalty * self.error_rate(provider, now)
+        return latency * penalty * (provider.in_flight + 1) / provider.weight
+
+    def ranked(self, exclude: Iterable[Provider] = ()) -> List[Provider]:
+        """按优先级排好的提供方列表"""
+        excluded = set(id(p) for p in exclude)
+        now = time.monotonic()
+        floor = min((p.latency for p in self.providers if p.latency is not None), default=0.0)
+        candidates = [p for p in self.providers if id(p) not in excluded]
+        return sorted(
+            candidates,
+            key=lambda p: (p.in_flight >= p.max_concurrency, self.score(p, now, floor))
+        )
+
+    def record(self, provider: Provider, latency: Optional[float], ok: bool) -> None:
+        now = time.monotonic()
+        error_rate = self.error_rate(provider, now)
+        provider.error_rate = error_rate + self.alpha * ((0.0 if ok else 1.0) - error_rate)
+        provider.updated_at = now
+        if ok and latency is not None:
+            provider.latency = latency if provider.latency is None else provider.latency + self.alpha * (latency - provider.latency)
+            AI_PROVIDER_LATENCY.set(provider.name, value=provider.latency)
+        AI_PROVIDER_ERROR_RATE.set(provider.name, value=provider.error_rate)
+
+    def call(self, provider: Provider, measure_latency: bool = True) -> "provider_call":
+        return provider_call(self, provider, measure_latency)
+
+    def status(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "name": p.name,
+                "upstream": p.upstream,
+                "model": p.model,
+                "weight": p.weight,
+                "max_concurrency": p.max_concurrency,
+                "in_flight": p.in_flight,
+                "latency_ewma": round(p.latency, 4) if p.latency is not None else None,
+                "error_rate": round(self.error_rate(p, now), 4),
+                "score": round(self.score(p, now), 4)
+            }
+            for p in self.ranked()
+        ]
+
+
+class provider_call:
+    """统计一次提供方调用：进行中请求数，以及结束时的耗时和成败。
+
+    调用方把 ok 设为 True/False；保持 None（例如4xx这类请求本身的问题）或被取消时不计入统计。
+    """
+
+    __slots__ = ("pool", "provider", "measure_latency", "ok", "started_at")
+
+    def __init__(self, pool: ProviderPool, provider: Provider, measure_latency: bool = True):
+        self.pool = pool
+        self.provider = provider
+        self.measure_latency = measure_latency
+        self.ok: Optional[bool] = None
+        self.started_at = 0.0
+
+    def __enter__(self) -> "provider_call":
+        self.provider.in_flight += 1
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.provider.in_flight -= 1
+        if exc_type is asyncio.CancelledError or self.ok is None:
+            return
+        latency = time.perf_counter() - self.started_at if self.measure_latency else None
+        self.pool.record(self.provider, latency, self.ok)
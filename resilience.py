@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, TypeVar
+
+import httpx
+from fastapi import HTTPException
+
+from app_logging import get_logger, log_event
+from cache import TTLCache
+from metrics import CIRCUIT_STATE, UPSTREAM_CONCURRENCY_LIMIT, UPSTREAM_HEDGE_DELAY, UPSTREAM_HEDGES, UPSTREAM_REJECTED
+from state import StateBackend
+from timing import phase
+
+logger = get_logger("resilience")
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailable(HTTPException):
+    """上游熔断或排队已满时快速失败，返回503而不是占着协程等待"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: Optional[float] = None):
+        headers = {"Retry-After": str(max(int(retry_after + 0.999), 1))} if retry_after is not None else None
+        super().__init__(
+            status_code=503,
+            detail=f"Upstream '{upstream}' is temporarily unavailable ({reason})",
+            headers=headers
+        )
+        self.upstream = upstream
+        self.reason = reason
+
+
+class RateLimiter:
+    """按 (客户端, 路由) 的令牌桶限流。
+
+    每分钟补充 rate_per_minute 个令牌，桶容量为 burst。传入共享后端时改用
+    跨进程的固定窗口计数（每分钟最多 rate_per_minute 次）。
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: Optional[float] = None,
+        shared: Optional[StateBackend] = None,
+        max_clients: int = 100000
+    ):
+        self.rate = rate_per_minute / 60
+        self.limit = rate_per_minute
+        self.capacity = burst or rate_per_minute
+        self.shared = shared
+        # 闲置到桶被补满的时间后，条目过期即等同于一个满桶
+        refill_time = self.capacity / self.rate if self.rate > 0 else 60.0
+        self._buckets = TTLCache(maxsize=max_clients, ttl=refill_time)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    async def hit(self, client: str, route: str) -> Optional[float]:
+        """消耗一个令牌；被限流时返回建议的重试等待秒数，否则返回None"""
+        if not self.enabled:
+            return None
+        if self.shared is not None:
+            try:
+                return await self._hit_shared(client, route)
+            except Exception as e:
+                log_event("共享限流计数失败，改用本地令牌桶", logging.WARNING, logger=logger, error=str(e))
+        return self._hit_local((client, route))
+
+    def _hit_local(self, key: Any) -> Optional[float]:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key) or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            return (1 - tokens) / self.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return None
+
+    async def _hit_shared(self, client: str, route: str) -> Optional[float]:
+        now = time.time()
+        window = int(now // 60)
+        count = await self.shared.incr(f"ratelimit:{client}:{route}:{window}", 1, ttl=61)
+        if count > self.limit:
+            return 60 - now % 60
+        return None
+
+
+class AdaptiveLimiter:
+    """按AIMD自适应调整的上游并发上限。
+
+    请求成功且耗时不超过 latency_target 时上限缓慢增加（每轮约+1），
+    失败、超时或变慢时按 decrease_ratio 成倍收缩。超出上限的请求排队等待，
+    队列已满或等待超过 queue_timeout 时直接拒绝。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        latency_target: Optional[float] = None,
+        decrease_ratio: float = 0.7,
+        max_queue: int = 100,
+        queue_timeout: float = 10.0
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_ratio = decrease_ratio
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        UPSTREAM_CONCURRENCY_LIMIT.set(name, value=self.limit)
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            UPSTREAM_REJECTED.inc(self.name, "queue_full")
+            raise UpstreamUnavailable(self.name, "too many pending requests", retry_after=1)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            with phase(f"{self.name}_queue"):
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                return
+            UPSTREAM_REJECTED.inc(self.name, "queue_timeout")
+            raise UpstreamUnavailable(self.name, "timed out waiting for a free slot", retry_after=1)
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                # 槽位已经转交给本请求，取消时要还回去
+                self.release()
+            raise
+
+    def _abandon(self, waiter: asyncio.Future) -> bool:
+        """放弃排队；如果槽位已经分配给了该等待者则返回False"""
+        if waiter.done():
+            return False
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        return True
+
+    def release(self, latency: Optional[float] = None, ok: Optional[bool] = None) -> None:
+        """归还槽位；提供 ok 时用这次请求的结果调整并发上限"""
+        self.in_flight -= 1
+        if ok is not None:
+            if not ok or (self.latency_target and latency is not None and latency > self.latency_target):
+                self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            UPSTREAM_CONCURRENCY_LIMIT.set(self.name, value=self.limit)
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断，reset_timeout 秒内直接拒绝；
+    之后放行一个探测请求，成功则恢复，失败则继续熔断"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        CIRCUIT_STATE.set(name, value=0)
+
+    def before_request(self) -> None:
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                UPSTREAM_REJECTED.inc(self.name, "circuit_open")
+                raise UpstreamUnavailable(self.name, "circuit open", retry_after=remaining)
+            self._set_state(HALF_OPEN)
+        if self._probing:
+            UPSTREAM_REJECTED.inc(self.name, "circuit_open")
+            raise UpstreamUnavailable(self.name, "circuit half-open", retry_after=1)
+        self._probing = True
+
+    def cancel_probe(self) -> None:
+        """请求没有真正发出（排队被拒或被取消）时释放探测名额"""
+        self._probing = False
+
+    def record(self, ok: bool) -> None:
+        self._probing = False
+        if ok:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            log_event("上游熔断状态变化", logging.WARNING, logger=logger, upstream=self.name, state=state, failures=self.failures)
+        self.state = state
+        CIRCUIT_STATE.set(self.name, value=_STATE_VALUES[state])
+
+
+def _is_failure(status: int) -> bool:
+    return status >= 500 or status == 429
+
+
+class _GuardedStream(httpx.AsyncByteStream):
+    """响应体读完或关闭时才归还并发槽位（流式AI响应会一直占用）"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class GuardedTransport(httpx.AsyncBaseTransport):
+    """在httpx传输层统一套上熔断和并发限制，所有经过该客户端的请求自动生效"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: AdaptiveLimiter, breaker: CircuitBreaker):
+        self._transport = transport
+        self.limiter = limiter
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.breaker.before_request()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            self.breaker.cancel_probe()
+            raise
+
+        started_at = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except asyncio.CancelledError:
+            self.breaker.cancel_probe()
+            self.limiter.release()
+            raise
+        except Exception:
+            self.breaker.record(False)
+            self.limiter.release(time.perf_counter() - started_at, ok=False)
+            raise
+
+        latency = time.perf_counter() - started_at
+        ok = not _is_failure(response.status_code)
+        self.breaker.record(ok)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.limiter.release(latency, ok=ok)
+
+        if response.is_closed:
+            # 响应体已经完整读入（例如测试用的MockTransport）
+            release()
+        else:
+            response.stream = _GuardedStream(response.stream, release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _attempt_failed(task: asyncio.Future) -> bool:
+    if task.exception() is not None:
+        return True
+    status = getattr(task.result(), "status_code", None)
+    return status is not None and _is_failure(status)
+
+
+class Hedger:
+    """对幂等的GET请求做对冲：第一次请求在 delay 内没有返回时再发一次，
+    取先成功的结果并取消另一个；抛出异常或返回5xx/429算失败，两次都失败才返回失败。
+
+    delay 取最近请求耗时的 percentile 分位数（样本不足时用 initial_delay）。
+    每个请求为预算增加 budget_ratio 个令牌，对冲一次消耗一个，
+    单个请求最多对冲一次，因此上游负载最多为原来的 1 + budget_ratio 倍。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 0.9,
+        initial_delay: float = 0.5,
+        min_delay: float = 0.02,
+        budget_ratio: float = 0.1,
+        max_budget: float = 10.0,
+        window: int = 200,
+        min_samples: int = 20
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget_ratio = min(max(budget_ratio, 0.0), 1.0)
+        self.max_budget = max_budget
+        self.min_samples = min_samples
+        self.delay = max(initial_delay, min_delay)
+        self.budget = 0.0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._pending_samples = 0
+        UPSTREAM_HEDGE_DELAY.set(name, value=self.delay)
+
+    def _observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._pending_samples += 1
+        # 每积累一批样本才重新排序计算分位数
+        if self.percentile and len(self._latencies) >= self.min_samples and self._pending_samples >= 10:
+            self._pending_samples = 0
+            ordered = sorted(self._latencies)
+            index = min(int(len(ordered) * self.percentile), len(ordered) - 1)
+            self.delay = max(ordered[index], self.min_delay)
+            UPSTREAM_HEDGE_DELAY.set(self.name, value=self.delay)
+
+    def _take_budget(self) -> bool:
+        if self.budget < 1:
+            return False
+        self.budget -= 1
+        return True
+
+    async def run(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        self.budget = min(self.max_budget, self.budget + self.budget_ratio)
+        started_at = time.perf_counter()
+        primary = asyncio.ensure_future(attempt())
+        attempts = {primary: started_at}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay)
+            if done:
+                self._observe(time.perf_counter() - started_at)
+                return primary.result()
+
+            if not self._take_budget():
+                UPSTREAM_HEDGES.inc(self.name, "no_budget")
+                result = await primary
+                self._observe(time.perf_counter() - started_at)
+                return result
+
+            UPSTREAM_HEDGES.inc(self.name, "sent")
+            hedge = asyncio.ensure_future(attempt())
+            attempts[hedge] = time.perf_counter()
+            pending = set(attempts)
+            failed: Optional[asyncio.Future] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if _attempt_failed(task):
+                        # 一个失败（异常或5xx/429）时继续等另一个
+                        failed = failed or task
+                        continue
+                    self._observe(time.perf_counter() - attempts[task])
+                    if task is hedge:
+                        UPSTREAM_HEDGES.inc(self.name, "won")
+                    return task.result()
+            # 都失败时返回先结束的那个失败
+            return failed.result()
+        finally:
+            now = time.perf_counter()
+            for task, task_started_at in attempts.items():
+                if not task.done():
+                    task.cancel()
+                    # 被取消的请求至少耗时这么久，计入样本避免低估尾延迟
+                    self._observe(now - task_started_at)
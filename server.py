@@ -1,19 +1,396 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.requests import HTTPConnection
 import httpx
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
+from contextlib import asynccontextmanager
 import asyncio
 import base64
+import hashlib
+import hmac
 import json
+import logging
+import math
+import time
+
+from app_logging import log_event, setup_logging
+from assets import AssetFiles, AssetStore, JSONCompressionMiddleware, asset_response
+from backtest import DEFAULT_HOLDING_SECONDS, parse_strategy, replay, result_rows
+from cache import TTLCache
+from deadline import RequestLifecycleMiddleware, check_deadline
+from history import HistoryStore
+from jobs import FAILED, SUCCEEDED, JobManager
+from indicators import buy_pressure, compute as compute_indicators, format_summary
+from market_feed import MarketPoller
+from metrics import AI_BACKOFF_SECONDS, AI_FAILOVERS, AI_RACES, AI_RETRIES, RATE_LIMITED, REGISTRY, MetricsMiddleware, upstream_timer
+from profiler import ProfilerBusy, SamplingProfiler, collapsed
+from providers import Provider, ProviderFailure, ProviderPool
+from resilience import AdaptiveLimiter, CircuitBreaker, GuardedTransport, Hedger, RateLimiter, UpstreamUnavailable
+from sse import HEARTBEAT, format_sse, with_heartbeat
+from state import create_backend
+from timing import ServerTimingMiddleware, phase, record as record_phase
+from tx_tracker import TrackerFull, TransactionTracker
 
 load_dotenv()
 
-app = FastAPI(title="WaveTrader")
+SOL_ADDRESS = "So11111111111111111111111111111111111111112"
+
+# 从.env文件加载配置
+GMGN_API_HOST = os.getenv("GMGN_API_HOST")
+DEXSCREENER_API_URL = os.getenv("DEXSCREENER_API_URL", "https://api.dexscreener.com").rstrip("/")
+AI_MODEL_ID = os.getenv("AI_MODEL_ID")
+AI_API_URL = os.getenv("AI_API_URL")
+AI_API_KEY = os.getenv("AI_API_KEY")
+
+# 上游HTTP连接池配置
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "False").lower() == "true"
+
+# 各上游的超时时间（秒）
+UPSTREAM_TIMEOUTS = {
+    "dexscreener": float(os.getenv("DEXSCREENER_TIMEOUT", "5")),
+    "gmgn": float(os.getenv("GMGN_TIMEOUT", "5")),
+    "ai": float(os.getenv("AI_TIMEOUT", "600")),
+}
+
+# 上游自适应并发限制：超出上限的请求排队，排队满或超时直接返回503
+UPSTREAM_CONCURRENCY_INITIAL = int(os.getenv("UPSTREAM_CONCURRENCY_INITIAL", "20"))
+UPSTREAM_CONCURRENCY_MIN = int(os.getenv("UPSTREAM_CONCURRENCY_MIN", "2"))
+UPSTREAM_CONCURRENCY_MAX = int(os.getenv("UPSTREAM_CONCURRENCY_MAX", str(HTTP_MAX_CONNECTIONS)))
+UPSTREAM_QUEUE_SIZE = int(os.getenv("UPSTREAM_QUEUE_SIZE", "100"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
+
+# 耗时超过该值视为上游过载并收缩并发上限（0 表示只按失败调整）
+UPSTREAM_LATENCY_TARGETS = {
+    "dexscreener": float(os.getenv("DEXSCREENER_LATENCY_TARGET", "2")),
+    "gmgn": float(os.getenv("GMGN_LATENCY_TARGET", "2")),
+    "ai": float(os.getenv("AI_LATENCY_TARGET", "0")),
+}
+# 单个上游的并发上限，未列出的使用 UPSTREAM_CONCURRENCY_MAX
+UPSTREAM_CONCURRENCY_CAPS: Dict[str, int] = {}
+
+# AI提供方池：AI_PROVIDERS 为逗号分隔的名称，每个提供方以 AI_PROVIDER_<名称>_URL/KEY/MODEL/WEIGHT/MAX_CONCURRENCY/TIMEOUT 配置，
+# 请求发给近期耗时和错误率最优的提供方，失败时换下一个；未设置时只使用 AI_API_URL / AI_API_KEY / AI_MODEL_ID
+AI_PROVIDERS = [n.strip().lower() for n in os.getenv("AI_PROVIDERS", "").split(",") if n.strip()]
+AI_PROVIDER_EWMA_ALPHA = float(os.getenv("AI_PROVIDER_EWMA_ALPHA", "0.3"))
+AI_PROVIDER_ERROR_PENALTY = float(os.getenv("AI_PROVIDER_ERROR_PENALTY", "10"))
+AI_PROVIDER_ERROR_HALF_LIFE = float(os.getenv("AI_PROVIDER_ERROR_HALF_LIFE", "60"))
+# 允许请求设置 race=true，同时发给最优的两个提供方并取先返回的结果（成本翻倍）
+AI_RACE_ENABLED = os.getenv("AI_RACE_ENABLED", "False").lower() == "true"
+
+def load_ai_providers() -> List[Provider]:
+    if not AI_PROVIDERS:
+        return [Provider("default", AI_API_URL, AI_API_KEY, AI_MODEL_ID, max_concurrency=UPSTREAM_CONCURRENCY_MAX, upstream="ai")]
+    providers = []
+    for name in AI_PROVIDERS:
+        prefix = f"AI_PROVIDER_{name.upper()}_"
+        api_url = os.getenv(prefix + "URL")
+        if not api_url:
+            raise ValueError(f"{prefix}URL is required for AI provider '{name}'")
+        provider = Provider(
+            name,
+            api_url,
+            os.getenv(prefix + "KEY"),
+            os.getenv(prefix + "MODEL", AI_MODEL_ID),
+            weight=float(os.getenv(prefix + "WEIGHT", "1")),
+            max_concurrency=int(os.getenv(prefix + "MAX_CONCURRENCY", str(UPSTREAM_CONCURRENCY_MAX)))
+        )
+        # 每个提供方一个独立的客户端，并发限制和熔断互不影响
+        UPSTREAM_TIMEOUTS[provider.upstream] = float(os.getenv(prefix + "TIMEOUT", str(UPSTREAM_TIMEOUTS["ai"])))
+        UPSTREAM_LATENCY_TARGETS[provider.upstream] = UPSTREAM_LATENCY_TARGETS["ai"]
+        UPSTREAM_CONCURRENCY_CAPS[provider.upstream] = provider.max_concurrency
+        providers.append(provider)
+    return providers
+
+ai_pool = ProviderPool(
+    load_ai_providers(),
+    alpha=AI_PROVIDER_EWMA_ALPHA,
+    error_penalty=AI_PROVIDER_ERROR_PENALTY,
+    error_half_life=AI_PROVIDER_ERROR_HALF_LIFE
+)
+
+# 熔断配置：连续失败达到阈值后在 CIRCUIT_RESET_TIMEOUT 秒内直接拒绝
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+upstream_limiters = {
+    upstream: AdaptiveLimiter(
+        upstream,
+        initial=UPSTREAM_CONCURRENCY_INITIAL,
+        min_limit=min(UPSTREAM_CONCURRENCY_MIN, UPSTREAM_CONCURRENCY_CAPS.get(upstream, UPSTREAM_CONCURRENCY_MAX)),
+        max_limit=UPSTREAM_CONCURRENCY_CAPS.get(upstream, UPSTREAM_CONCURRENCY_MAX),
+        latency_target=UPSTREAM_LATENCY_TARGETS[upstream] or None,
+        max_queue=UPSTREAM_QUEUE_SIZE,
+        queue_timeout=UPSTREAM_QUEUE_TIMEOUT
+    )
+    for upstream in UPSTREAM_TIMEOUTS
+}
+circuit_breakers = {
+    upstream: CircuitBreaker(
+        upstream,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT
+    )
+    for upstream in UPSTREAM_TIMEOUTS
+}
+
+# 请求对冲：幂等GET在 HEDGE_PERCENTILE 分位耗时内未返回时再发一次，取先返回的结果
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "False").lower() == "true"
+HEDGE_UPSTREAMS = [u.strip() for u in os.getenv("HEDGE_UPSTREAMS", "dexscreener,gmgn_account,gmgn_route").split(",") if u.strip()]
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "0.5"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+# 每个请求积累的对冲预算，0.1 表示对冲请求最多占上游请求的10%（上限1，即最多翻倍）
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+
+upstream_hedgers = {
+    upstream: Hedger(
+        upstream,
+        percentile=HEDGE_PERCENTILE,
+        initial_delay=HEDGE_DELAY,
+        min_delay=HEDGE_MIN_DELAY,
+        budget_ratio=HEDGE_BUDGET_RATIO
+    )
+    for upstream in HEDGE_UPSTREAMS
+} if HEDGE_ENABLED else {}
+
+# 多进程部署配置：SERVER_WORKERS>1 时应使用可跨进程共享的状态后端（sqlite）
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "wavetrader_state.db")
+
+# 市场快照、策略缓存和分析任务状态共用的存储
+state_backend = create_backend(STATE_BACKEND, sqlite_path=STATE_SQLITE_PATH)
+# 进程内后端与本地缓存重复，只有共享后端才挂到缓存上
+shared_state = state_backend if state_backend.shared else None
+
+# 客户端限流：按 (客户端IP, 路由) 的令牌桶，0 表示不限流
+MAX_REQUESTS_PER_MINUTE = float(os.getenv("MAX_REQUESTS_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "0")) or None
+
+rate_limiter = RateLimiter(MAX_REQUESTS_PER_MINUTE, burst=RATE_LIMIT_BURST, shared=shared_state)
+
+# 市场快照缓存配置
+DEXSCREENER_BATCH_SIZE = 30  # DexScreener 单次最多查询30个地址
+MARKET_CACHE_TTL = float(os.getenv("MARKET_CACHE_TTL", "10"))
+MARKET_CACHE_MAX_ENTRIES = int(os.getenv("MARKET_CACHE_MAX_ENTRIES", "1024"))
+
+# 按代币地址缓存已选出的主交易对
+market_cache = TTLCache(
+    maxsize=MARKET_CACHE_MAX_ENTRIES,
+    ttl=MARKET_CACHE_TTL,
+    shared=shared_state,
+    namespace="market"
+)
+
+# 关注代币后台轮询配置：快照供分析请求直接读取，历史序列保存在定长环形缓冲区
+MARKET_POLL_TOKENS = [a.strip() for a in os.getenv("MARKET_POLL_TOKENS", "").split(",") if a.strip()]
+MARKET_POLL_INTERVAL = float(os.getenv("MARKET_POLL_INTERVAL", "15"))
+MARKET_POLL_MAX_TOKENS = int(os.getenv("MARKET_POLL_MAX_TOKENS", "500"))
+MARKET_SERIES_CAPACITY = int(os.getenv("MARKET_SERIES_CAPACITY", "720"))
+
+# 历史库：记录行情采样和生成的策略供回测使用，路径为空时不记录
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "wavetrader_history.db")
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+BACKTEST_DEFAULT_HOLDING = float(os.getenv("BACKTEST_DEFAULT_HOLDING", str(DEFAULT_HOLDING_SECONDS)))
+BACKTEST_MAX_STRATEGIES = int(os.getenv("BACKTEST_MAX_STRATEGIES", "100000"))
+
+history_store = HistoryStore(HISTORY_DB_PATH, queue_size=HISTORY_QUEUE_SIZE) if HISTORY_DB_PATH else None
+
+# 异步分析任务配置
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+ANALYSIS_JOB_QUEUE_SIZE = int(os.getenv("ANALYSIS_JOB_QUEUE_SIZE", "100"))
+ANALYSIS_JOB_RETENTION = float(os.getenv("ANALYSIS_JOB_RETENTION", "600"))
+
+# 批量分析配置
+ANALYSIS_BATCH_MAX_TOKENS = int(os.getenv("ANALYSIS_BATCH_MAX_TOKENS", "50"))
+ANALYSIS_BATCH_CONCURRENCY = int(os.getenv("ANALYSIS_BATCH_CONCURRENCY", "4"))
+
+# 策略结果缓存配置
+STRATEGY_CACHE_TTL = float(os.getenv("STRATEGY_CACHE_TTL", "300"))
+STRATEGY_CACHE_MAX_ENTRIES = int(os.getenv("STRATEGY_CACHE_MAX_ENTRIES", "256"))
+
+# 按AI请求体哈希缓存生成的策略
+strategy_cache = TTLCache(
+    maxsize=STRATEGY_CACHE_MAX_ENTRIES,
+    ttl=STRATEGY_CACHE_TTL,
+    shared=shared_state,
+    namespace="strategy"
+)
+
+# 流式分析配置
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "32"))
+
+# 交易确认跟踪配置
+TX_POLL_INTERVAL = float(os.getenv("TX_POLL_INTERVAL", "1"))
+TX_POLL_MAX_INTERVAL = float(os.getenv("TX_POLL_MAX_INTERVAL", "5"))
+TX_POLL_BACKOFF = float(os.getenv("TX_POLL_BACKOFF", "1.5"))
+TX_POLL_CONCURRENCY = int(os.getenv("TX_POLL_CONCURRENCY", "10"))
+TX_TRACK_TIMEOUT = float(os.getenv("TX_TRACK_TIMEOUT", "60"))
+# 同时轮询的交易总数上限，以及每个WebSocket连接同时订阅的交易数上限
+TX_TRACK_MAX_PENDING = int(os.getenv("TX_TRACK_MAX_PENDING", "1000"))
+TX_WS_MAX_SUBSCRIPTIONS = int(os.getenv("TX_WS_MAX_SUBSCRIPTIONS", "20"))
+
+# 代币可交易性批量检查配置
+TOKEN_VALIDATION_CONCURRENCY = int(os.getenv("TOKEN_VALIDATION_CONCURRENCY", "16"))
+TOKEN_VALIDATION_MAX_BATCH = int(os.getenv("TOKEN_VALIDATION_MAX_BATCH", "500"))
+TOKEN_VALIDATION_POSITIVE_TTL = float(os.getenv("TOKEN_VALIDATION_POSITIVE_TTL", "600"))
+TOKEN_VALIDATION_NEGATIVE_TTL = float(os.getenv("TOKEN_VALIDATION_NEGATIVE_TTL", "60"))
+
+token_validation_cache = TTLCache(
+    maxsize=10000,
+    ttl=TOKEN_VALIDATION_POSITIVE_TTL,
+    shared=shared_state,
+    namespace="tradable"
+)
+token_validation_semaphore = asyncio.Semaphore(TOKEN_VALIDATION_CONCURRENCY)
+
+# 代币元数据（精度）缓存：精度不会变化，只按LRU淘汰
+TOKEN_METADATA_MAX_ENTRIES = int(os.getenv("TOKEN_METADATA_MAX_ENTRIES", "10000"))
+
+token_metadata_cache = TTLCache(maxsize=TOKEN_METADATA_MAX_ENTRIES, ttl=float("inf"))
+
+# 请求截止时间（秒）：客户端可用 X-Request-Timeout 请求头指定，0 表示不设默认值/不设上限
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "0"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "0"))
+
+# 请求阶段耗时：写入 Server-Timing 响应头，总耗时超过阈值（秒）的请求以INFO记录各阶段耗时
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "True").lower() == "true"
+SERVER_TIMING_LOG_THRESHOLD = float(os.getenv("SERVER_TIMING_LOG_THRESHOLD", "1.0"))
+
+# 管理接口（采样分析等）的访问令牌，未设置时管理接口不可用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+loop_profiler = SamplingProfiler()
+
+# 响应压缩：超过该大小的JSON响应按 Accept-Encoding 用 br/gzip 压缩，0 表示关闭
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# 日志配置：日志经有界队列由后台线程写出，响应体按规则截断/采样
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BODY_MAX_CHARS = int(os.getenv("LOG_BODY_MAX_CHARS", "512"))
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", "1.0"))
+
+log_pipeline = setup_logging(
+    level=LOG_LEVEL,
+    queue_size=LOG_QUEUE_SIZE,
+    fmt=LOG_FORMAT,
+    body_max_chars=LOG_BODY_MAX_CHARS,
+    body_sample_rate=LOG_BODY_SAMPLE_RATE
+)
+
+# 按上游共享的长连接客户端，由lifespan创建和关闭
+http_clients: Dict[str, httpx.AsyncClient] = {}
+# 请求自带 api_url/api_key 时使用的客户端：不挂熔断和并发限制，
+# 个别调用方的错误地址或用尽的配额不会影响其他用户共用的 "ai" 上游
+AI_CUSTOM_UPSTREAM = "ai_custom"
+
+def _http2_supported() -> bool:
+    """HTTP/2 需要额外安装 h2 包"""
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        log_event("HTTP2_ENABLED=True 但未安装 h2，回退到 HTTP/1.1", logging.WARNING)
+        return False
+
+def get_client(upstream: str) -> httpx.AsyncClient:
+    """获取指定上游的共享客户端"""
+    client = http_clients.get(upstream)
+    if client is None:
+        raise RuntimeError(f"HTTP client for '{upstream}' is not initialized")
+    return client
+
+async def upstream_get(upstream: str, client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    """发送GET请求，该上游开启了对冲时交给对应的 Hedger"""
+    hedger = upstream_hedgers.get(upstream)
+    if hedger is None:
+        return await client.get(url, **kwargs)
+    return await hedger.run(lambda: client.get(url, **kwargs))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_pipeline.start()
+    if SERVER_WORKERS > 1 and not state_backend.shared:
+        log_event(
+            "多worker部署使用了进程内状态后端，缓存和任务状态不会在worker间共享",
+            logging.WARNING,
+            state_backend=STATE_BACKEND,
+            workers=SERVER_WORKERS
+        )
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    http2 = _http2_supported()
+    for upstream, timeout in UPSTREAM_TIMEOUTS.items():
+        # 熔断和并发限制挂在传输层，所有经过该客户端的请求统一生效
+        transport = GuardedTransport(
+            httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+            upstream_limiters[upstream],
+            circuit_breakers[upstream]
+        )
+        http_clients[upstream] = httpx.AsyncClient(transport=transport, timeout=timeout)
+    http_clients[AI_CUSTOM_UPSTREAM] = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+        timeout=UPSTREAM_TIMEOUTS["ai"]
+    )
+    if history_store is not None:
+        history_store.start()
+    analysis_jobs.start()
+    tx_tracker.start()
+    market_poller.start()
+    try:
+        yield
+    finally:
+        await market_poller.stop()
+        await tx_tracker.stop()
+        await analysis_jobs.stop()
+        for client in http_clients.values():
+            await client.aclose()
+        http_clients.clear()
+        await state_backend.close()
+        if history_store is not None:
+            history_store.stop()
+        log_pipeline.stop()
+
+async def enforce_rate_limit(connection: HTTPConnection):
+    """按客户端和路由模板限流，超出时返回429"""
+    if connection.scope["type"] != "http":
+        return
+    route = getattr(connection.scope.get("route"), "path", connection.url.path)
+    client = connection.client.host if connection.client else "unknown"
+    retry_after = await rate_limiter.hit(client, route)
+    if retry_after is not None:
+        RATE_LIMITED.inc(route)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))}
+        )
+
+app = FastAPI(title="WaveTrader", lifespan=lifespan, dependencies=[Depends(enforce_rate_limit)])
+
+# 客户端断开或超过截止时间时取消请求处理（包括其中的上游调用）
+app.add_middleware(
+    RequestLifecycleMiddleware,
+    default_timeout=REQUEST_TIMEOUT_DEFAULT or None,
+    max_timeout=REQUEST_TIMEOUT_MAX or None
+)
 
 # CORS middleware configuration
 app.add_middleware(
@@ -24,11 +401,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if COMPRESSION_MIN_SIZE > 0:
+    app.add_middleware(JSONCompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# 按路由统计请求耗时和状态码
+app.add_middleware(MetricsMiddleware)
+
+# 按阶段统计单个请求的耗时（Server-Timing 响应头 + 日志）
+app.add_middleware(
+    ServerTimingMiddleware,
+    expose_header=SERVER_TIMING_ENABLED,
+    log_threshold=SERVER_TIMING_LOG_THRESHOLD
+)
+
+# 静态文件和语言包在启动时读入内存并预压缩，带指纹的URL可长期缓存
+assets = AssetStore({"/static": "static", "/locales": "locales"})
+assets.build()
+index_page = assets.render_html("/static/index.html")
+
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", AssetFiles(assets, "/static"), name="static")
 
 # Mount locales
-app.mount("/locales", StaticFiles(directory="locales"), name="locales")
+app.mount("/locales", AssetFiles(assets, "/locales"), name="locales")
 
 # Load translations
 translations = {}
@@ -36,12 +431,6 @@ for locale in ['en', 'zh']:
     with open(f'locales/{locale}.json', 'r', encoding='utf-8') as f:
         translations[locale] = json.load(f)
 
-# 从.env文件加载配置
-GMGN_API_HOST = os.getenv("GMGN_API_HOST")
-AI_MODEL_ID = os.getenv("AI_MODEL_ID")
-AI_API_URL = os.getenv("AI_API_URL")
-AI_API_KEY = os.getenv("AI_API_KEY")
-
 class Message(BaseModel):
     role: str
     content: str
@@ -61,6 +450,22 @@ class AnalyzeRequest(BaseModel):
     stop: Optional[List[str]] = None
     n: Optional[int] = 1
     tools: Optional[List[Dict[str, Any]]] = None
+    bypass_cache: bool = False  # 跳过策略缓存，强制重新生成
+    race: bool = False  # 同时请求两个提供方取先返回的结果，需开启 AI_RACE_ENABLED
+
+class BatchAnalyzeRequest(BaseModel):
+    token_addresses: List[str]
+    messages: List[Message]
+    model: Optional[str] = None
+    api_url: Optional[str] = None
+    api_key: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: Optional[int] = 4096
+    top_p: Optional[float] = 0.7
+    presence_penalty: Optional[float] = 0
+    frequency_penalty: Optional[float] = 0
+    stream: bool = True  # true 时以SSE按完成顺序返回每个代币的策略
+    bypass_cache: bool = False
 
 class TradeParams(BaseModel):
     token_address: str
@@ -78,10 +483,66 @@ class TokenTradeParams(BaseModel):
 
 class SignedTransaction(BaseModel):
     signed_transaction: str
+    last_valid_height: Optional[int] = None  # 提供时提交后自动跟踪确认状态
+
+class TokenValidationRequest(BaseModel):
+    token_addresses: List[str]
+
+class TrackTokens(BaseModel):
+    token_addresses: List[str]
+
+class BacktestRequest(BaseModel):
+    token_addresses: Optional[List[str]] = None
+    since: Optional[float] = None  # 策略生成时间范围（Unix时间戳）
+    until: Optional[float] = None
+    default_holding_seconds: Optional[float] = None
+    include_results: bool = False
+    limit: int = 100  # include_results 时最多返回的策略条数
+
+class TrackTransaction(BaseModel):
+    hash: str
+    last_valid_height: int
 
 @app.get("/")
-async def read_root():
-    return FileResponse("static/index.html")
+async def read_root(request: Request):
+    return asset_response(index_page, request.headers)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+async def require_admin(request: Request):
+    """管理接口需要 ADMIN_TOKEN（Authorization: Bearer 或 X-Admin-Token），未配置时返回404"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("x-admin-token", "")
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        supplied = authorization[7:].strip()
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_event_loop(seconds: float = 10.0, interval: float = 0.005, idle: bool = False):
+    """对本worker的事件循环采样 seconds 秒，返回折叠栈格式，可直接生成火焰图"""
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+    if not 0.001 <= interval <= 1:
+        raise HTTPException(status_code=400, detail="interval must be between 0.001 and 1")
+    try:
+        profile = await loop_profiler.profile(seconds, interval, include_idle=idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        collapsed(profile["stacks"]),
+        headers={
+            "X-Profile-Samples": str(profile["samples"]),
+            "X-Profile-Idle-Samples": str(profile["idle_samples"]),
+            "X-Profile-Duration": f"{profile['duration']:.3f}",
+            "X-Profile-Pid": str(os.getpid())
+        }
+    )
 
 @app.get("/api/config")
 async def get_config():
@@ -91,62 +552,160 @@ async def get_config():
         "api_key": AI_API_KEY
     }
 
-@app.post("/api/analyze")
-async def analyze_chart(request: AnalyzeRequest):
-    try:
-        # 使用环境变量中的配置，如果请求中没有提供
-        model = request.model or AI_MODEL_ID
-        api_url = request.api_url or AI_API_URL
-        api_key = request.api_key or AI_API_KEY
+@app.get("/api/ai/providers")
+async def get_ai_providers():
+    """AI提供方按当前优先级排序，附近期耗时、错误率和熔断状态（不含密钥）"""
+    providers = ai_pool.status()
+    for provider in providers:
+        provider["circuit"] = circuit_breakers[provider["upstream"]].state
+    return {"status": "success", "race_enabled": AI_RACE_ENABLED, "providers": providers}
 
-        if not api_key:
-            raise HTTPException(status_code=500, detail="API key not configured")
+async def fetch_pairs(token_addresses: List[str]) -> List[Dict[str, Any]]:
+    """从DexScreener获取一个或多个代币的交易对，多个地址以逗号拼接在一次请求里"""
+    # 使用和图表相同的地址格式
+    dexscreener_url = f"{DEXSCREENER_API_URL}/latest/dex/tokens/{','.join(token_addresses)}"
+    headers = {}  # DexScreener API 不需要特殊的headers
+    
+    client = get_client("dexscreener")
+    with upstream_timer("dexscreener") as timer:
+        dex_response = await upstream_get("dexscreener", client, dexscreener_url, headers=headers)
+        timer.status = dex_response.status_code
+    log_event(
+        "DexScreener API响应",
+        upstream="dexscreener",
+        url=dexscreener_url,
+        status=dex_response.status_code,
+        latency=timer.latency,
+        body=lambda: dex_response.text
+    )
+    
+    if dex_response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Failed to fetch DexScreener data")
+        
+    return dex_response.json().get('pairs') or []
+
+def select_main_pair(pairs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """获取最活跃（24小时交易量最大）的交易对"""
+    return max(pairs, key=lambda x: float(x.get('volume', {}).get('h24', 0) or 0))
+
+async def fetch_main_pair(token_address: str) -> Dict[str, Any]:
+    """从DexScreener获取代币交易量最大的交易对"""
+    pairs = await fetch_pairs([token_address])
+    if not pairs:
+        log_event("没有找到交易对数据", logging.WARNING, upstream="dexscreener", token_address=token_address)
+        raise HTTPException(status_code=404, detail="No trading pairs found")
+    main_pair = select_main_pair(pairs)
+    if history_store is not None:
+        history_store.record_pairs({token_address: main_pair})
+    return main_pair
+
+async def fetch_main_pairs(token_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+    """批量获取多个代币的主交易对，每次请求最多 DEXSCREENER_BATCH_SIZE 个地址，返回 地址 -> 交易对"""
+    batches = [
+        token_addresses[i:i + DEXSCREENER_BATCH_SIZE]
+        for i in range(0, len(token_addresses), DEXSCREENER_BATCH_SIZE)
+    ]
+    wanted = set(token_addresses)
+    pairs_by_token: Dict[str, List[Dict[str, Any]]] = {}
+    quoted_by_token: Dict[str, List[Dict[str, Any]]] = {}
+    for pairs in await asyncio.gather(*(fetch_pairs(batch) for batch in batches)):
+        for pair in pairs:
+            # 多地址查询时按基础代币归类，代币只作为报价币出现的交易对作为备选
+            address = pair.get('baseToken', {}).get('address')
+            if address in wanted:
+                pairs_by_token.setdefault(address, []).append(pair)
+            quote_address = pair.get('quoteToken', {}).get('address')
+            if quote_address in wanted:
+                quoted_by_token.setdefault(quote_address, []).append(pair)
+    for address, pairs in quoted_by_token.items():
+        if address not in pairs_by_token:
+            pairs_by_token[address] = pairs
+    # 批量响应里仍然没有的（例如交易对太多被截断）再单独查询，和单个代币的查询结果保持一致
+    misses = [address for address in dict.fromkeys(token_addresses) if address not in pairs_by_token]
+    if misses and len(token_addresses) > 1:
+        for address, pairs in zip(misses, await asyncio.gather(*(fetch_pairs([a]) for a in misses))):
+            if pairs:
+                pairs_by_token[address] = pairs
+    main_pairs = {address: select_main_pair(pairs) for address, pairs in pairs_by_token.items()}
+    if history_store is not None:
+        history_store.record_pairs(main_pairs)
+    return main_pairs
+
+async def prefetch_market_data(token_addresses: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """批量获取不在后台轮询中的代币的主交易对，返回 (地址 -> 交易对, 没有找到交易对的地址)。
+
+    结果同时写入市场快照缓存，但调用方应直接使用返回的交易对：逐个分析可能
+    排在较慢的AI调用之后，届时缓存多半已经过期。
+    """
+    pairs: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for address in token_addresses:
+        if market_poller.snapshot(address) is not None:
+            continue
+        pair = market_cache.get(address)
+        if pair is None:
+            missing.append(address)
+        else:
+            pairs[address] = pair
+    if not missing:
+        return pairs, []
+    main_pairs = await fetch_main_pairs(missing)
+    for address, pair in main_pairs.items():
+        await market_cache.put(address, pair)
+    pairs.update(main_pairs)
+    return pairs, [address for address in missing if address not in main_pairs]
+
+# 后台轮询关注代币，分析请求优先读取本地快照
+market_poller = MarketPoller(
+    fetch_main_pairs,
+    interval=MARKET_POLL_INTERVAL,
+    capacity=MARKET_SERIES_CAPACITY,
+    max_tokens=MARKET_POLL_MAX_TOKENS
+)
+market_poller.track(MARKET_POLL_TOKENS)
+
+async def get_main_pair(token_address: str) -> Dict[str, Any]:
+    """优先读取后台轮询的快照，其次读取市场快照缓存，未命中时合并并发请求"""
+    token_address = token_address.strip()
+    pair = market_poller.snapshot(token_address)
+    if pair is not None:
+        return pair
+    return await market_cache.get_or_fetch(
+        token_address,
+        lambda: fetch_main_pair(token_address)
+    )
+
+async def build_market_context(
+    token_address: str,
+    pair: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """获取市场数据并生成system prompt中的市场信息，同时返回所用的主交易对。
 
-        # 收集市场数据
-        market_info = []
+    pair 为调用方已经获取的主交易对（例如批量分析预先批量查询的结果），没有时按常规读取。
+    """
+    # 收集市场数据
+    market_info = []
+    
+    # 从DexScreener获取详细价格数据（优先读取缓存）
+    try:
+        main_pair = pair if pair is not None else await get_main_pair(token_address)
         
-        # 从DexScreener获取详细价格数据
-        try:
-            # 使用和图表相同的地址格式
-            dexscreener_url = f"https://api.dexscreener.com/latest/dex/tokens/{request.token_address}"
-            headers = {}  # DexScreener API 不需要特殊的headers
-            
-            async with httpx.AsyncClient() as client:
-                dex_response = await client.get(dexscreener_url, headers=headers)
-                print("DexScreener API请求URL:", dexscreener_url)
-                print("DexScreener API响应:", dex_response.text)
-                
-                if dex_response.status_code != 200:
-                    print(f"DexScreener API请求失败: {dex_response.status_code}")
-                    raise HTTPException(status_code=500, detail="Failed to fetch DexScreener data")
-                    
-                dex_data = dex_response.json()
-                if not dex_data.get('pairs'):
-                    print("没有找到交易对数据")
-                    raise HTTPException(status_code=404, detail="No trading pairs found")
-                    
-                # 获取最活跃的交易对
-                pairs = dex_data['pairs']
-                # 按交易量排序
-                pairs.sort(key=lambda x: float(x.get('volume', {}).get('h24', 0) or 0), reverse=True)
-                main_pair = pairs[0]
-                
-                # 获取代币基本信息
-                base_token = main_pair.get('baseToken', {})
-                market_info.append(f"""
+        # 获取代币基本信息
+        base_token = main_pair.get('baseToken', {})
+        market_info.append(f"""
 基本代币信息:
 - 名称: {base_token.get('name', 'Unknown')}
 - 符号: {base_token.get('symbol', 'Unknown')}
-- 合约地址: {request.token_address}
+- 合约地址: {token_address}
 """)
-                
-                # 获取交易数据
-                txns = main_pair.get('txns', {})
-                volume = main_pair.get('volume', {})
-                price_change = main_pair.get('priceChange', {})
-                liquidity = main_pair.get('liquidity', {})
-
-                market_info.append(f"""
+        
+        # 获取交易数据
+        txns = main_pair.get('txns', {})
+        volume = main_pair.get('volume', {})
+        price_change = main_pair.get('priceChange', {})
+        liquidity = main_pair.get('liquidity', {})
+
+        market_info.append(f"""
 市场数据 (交易所: {main_pair.get('dexId')}):
 - 当前价格: 
   * USD: ${main_pair.get('priceUsd', 'Unknown')}
@@ -177,17 +736,27 @@ async def analyze_chart(request: AnalyzeRequest):
 - 创建时间: {main_pair.get('pairCreatedAt', 'Unknown')}
 - 交易对链接: {main_pair.get('url', 'Unknown')}""")
 
-        except Exception as e:
-            print(f"获取DexScreener数据失败: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to fetch market data: {str(e)}")
+        # 关注代币有后台轮询积累的序列，可以附上技术指标；其他代币只有买卖力量
+        market_info.append("\n" + format_summary(
+            market_poller.indicators(token_address),
+            buy_pressure(main_pair),
+            MARKET_POLL_INTERVAL
+        ))
 
-        # 将市场数据添加到system prompt
-        market_context = "\n".join(market_info)
-        
-        # 更新system prompt
-        system_message = {
-            "role": "system",
-            "content": f"""你是一位专业的加密货币交易分析师，专注于提供具体的交易建议。基于市场数据，你需要给出明确的：
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        log_event("获取DexScreener数据失败", logging.WARNING, upstream="dexscreener", error=str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to fetch market data: {str(e)}")
+
+    return "\n".join(market_info), main_pair
+
+def build_ai_request(request: AnalyzeRequest, model: str, market_context: str) -> Dict[str, Any]:
+    """构建标准的OpenAI API请求格式"""
+    # 更新system prompt
+    system_message = {
+        "role": "system",
+        "content": f"""你是一位专业的加密货币交易分析师，专注于提供具体的交易建议。基于市场数据，你需要给出明确的：
 1. 当前是适合买入还是卖出的时机
 2. 具体的入场价格区间
 3. 明确的止盈价格位置（可以设置多个目标位）
@@ -198,129 +767,278 @@ async def analyze_chart(request: AnalyzeRequest):
 请确保你的建议具体、可操作，包含具体的数字和百分比。
 
 市场数据:\n{market_context}"""
-        }
+    }
 
-        # 构建消息列表
-        messages = [system_message]
-        for msg in request.messages:
-            if msg.role != "system":  # 跳过用户提供的system消息
-                messages.append(msg.dict())
-        
-        # 构建请求头
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # 构建标准的OpenAI API请求格式
-        ai_request = {
-            "model": model,
-            "messages": messages,
-            "temperature": request.temperature,
-            "max_tokens": request.max_tokens,
-            "top_p": request.top_p,
-            "frequency_penalty": request.frequency_penalty,
-            "presence_penalty": request.presence_penalty,
-            "stream": request.stream,
-            "n": request.n
-        }
-        
-        # 移除所有None值的参数
-        ai_request = {k: v for k, v in ai_request.items() if v is not None}
-        
-        # 添加重试逻辑
-        max_retries = 3
-        retry_delay = 2  # 初始延迟2秒
-        
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=600.0) as client:
-                    base_url = api_url.rstrip('/')
-                    if not base_url.endswith('/v1'):
-                        base_url += '/v1'
-                        
-                    print(f"尝试第 {attempt + 1} 次发送AI请求")
-                    print("AI API URL:", f"{base_url}/chat/completions")
-                    
-                    response = await client.post(
-                        f"{base_url}/chat/completions",
-                        headers=headers,
-                        json=ai_request,
-                        timeout=600.0
-                    )
-                    
-                    print(f"第 {attempt + 1} 次尝试 - 状态码:", response.status_code)
-                    print(f"第 {attempt + 1} 次尝试 - 响应内容:", response.text)
-                    
-                    if response.status_code == 200:
-                        try:
-                            ai_response = response.json()
-                            if 'choices' in ai_response and ai_response['choices']:
-                                message = ai_response['choices'][0].get('message', {})
-                                if isinstance(message, dict):
-                                    content = message.get('content')
-                                else:
-                                    content = message
-                                
-                                if content:
-                                    return {
-                                        "status": "success",
-                                        "strategy": content.replace('\n', '<br>')
-                                    }
-                            
-                            print(f"第 {attempt + 1} 次尝试 - 无效的响应格式:", ai_response)
-                            
-                        except json.JSONDecodeError as e:
-                            print(f"第 {attempt + 1} 次尝试 - JSON解析错误:", str(e))
-                        
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_delay)
-                            retry_delay *= 2
-                            continue
-                            
-                    elif response.status_code >= 500:
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_delay)
-                            retry_delay *= 2
-                            continue
-                        raise HTTPException(
-                            status_code=response.status_code,
-                            detail=f"AI API server error after {max_retries} attempts"
-                        )
-                    else:
-                        raise HTTPException(
-                            status_code=response.status_code,
-                            detail=f"AI API error: {response.text}"
-                        )
-                        
-            except httpx.RequestError as e:
-                print(f"第 {attempt + 1} 次尝试网络错误:", str(e))
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 2
-                    continue
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Network error when calling AI API: {str(e)}"
-                )
-                
-            except Exception as e:
-                print(f"第 {attempt + 1} 次尝试出错:", str(e))
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 2
-                    continue
-                raise
-                
+    # 构建消息列表
+    messages = [system_message]
+    for msg in request.messages:
+        if msg.role != "system":  # 跳过用户提供的system消息
+            messages.append(msg.dict())
+    
+    # 构建标准的OpenAI API请求格式
+    ai_request = {
+        "model": model,
+        "messages": messages,
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens,
+        "top_p": request.top_p,
+        "frequency_penalty": request.frequency_penalty,
+        "presence_penalty": request.presence_penalty,
+        "stream": request.stream,
+        "n": request.n
+    }
+    
+    # 移除所有None值的参数
+    ai_request = {k: v for k, v in ai_request.items() if v is not None}
+    return ai_request
+
+def strategy_cache_key(target: str, ai_request: Dict[str, Any]) -> str:
+    """以路由目标（提供方池或请求指定的接口）和完整的AI请求体（模型、消息、采样参数）计算缓存键"""
+    payload = json.dumps({"api_url": target, "request": ai_request}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def resolve_ai_pool(request: AnalyzeRequest) -> ProviderPool:
+    """请求自带 api_url/api_key 时只使用该接口，否则使用配置的提供方池"""
+    if request.api_url or request.api_key:
+        api_key = request.api_key or AI_API_KEY
+        if not api_key:
+            raise HTTPException(status_code=500, detail="API key not configured")
+        provider = Provider("custom", request.api_url or AI_API_URL, api_key, AI_MODEL_ID, upstream=AI_CUSTOM_UPSTREAM)
+        return ProviderPool([provider], key=provider.api_url)
+    if not AI_PROVIDERS and not AI_API_KEY:
+        raise HTTPException(status_code=500, detail="API key not configured")
+    return ai_pool
+
+def provider_request(provider: Provider, ai_request: Dict[str, Any]) -> Dict[str, Any]:
+    """请求未指定模型时使用提供方自己的模型"""
+    return {**ai_request, "model": ai_request.get("model") or provider.model}
+
+async def retry_backoff(delay: float, reason: str) -> None:
+    """重试前等待，并记录重试次数和等待时间；等待完已超过请求截止时间则不再重试"""
+    check_deadline(delay)
+    AI_RETRIES.inc(reason)
+    AI_BACKOFF_SECONDS.inc(amount=delay)
+    with phase("ai_retry_backoff"):
+        await asyncio.sleep(delay)
+
+def log_provider_failure(failure: ProviderFailure, attempt: int) -> None:
+    log_event(
+        "AI提供方请求失败",
+        logging.WARNING,
+        upstream=failure.provider.upstream,
+        provider=failure.provider.name,
+        reason=failure.reason,
+        status=failure.status_code,
+        attempt=attempt,
+        error=failure.detail
+    )
+
+def parse_strategy_content(response: httpx.Response, attempt: int) -> Optional[str]:
+    """从AI响应中取出策略文本，格式不对时返回None"""
+    try:
+        ai_response = response.json()
+    except json.JSONDecodeError as e:
+        log_event("AI API JSON解析错误", logging.WARNING, upstream="ai", attempt=attempt, error=str(e))
+        return None
+    if 'choices' in ai_response and ai_response['choices']:
+        message = ai_response['choices'][0].get('message', {})
+        if isinstance(message, dict):
+            content = message.get('content')
+        else:
+            content = message
+        if content:
+            return content
+    log_event("AI API无效的响应格式", logging.WARNING, upstream="ai", attempt=attempt)
+    return None
+
+async def call_ai_provider(
+    pool: ProviderPool,
+    provider: Provider,
+    ai_request: Dict[str, Any],
+    attempt: int
+) -> Dict[str, Any]:
+    """向一个提供方请求一次策略；5xx、429、网络错误、超时、熔断和无效响应抛出 ProviderFailure，
+    其他4xx重试也不会成功，直接抛出 HTTPException"""
+    client = get_client(provider.upstream)
+    completions_url = provider.completions_url()
+    body = provider_request(provider, ai_request)
+
+    with pool.call(provider) as call:
+        try:
+            with upstream_timer(provider.upstream) as timer:
+                response = await client.post(completions_url, headers=provider.headers(), json=body)
+                timer.status = response.status_code
+        except UpstreamUnavailable as e:
+            # 熔断或排队已满时请求并没有发出，熔断本身已经反映了失败，不再计入错误率
+            raise ProviderFailure(provider, "unavailable", e.status_code, e.detail, e.headers)
+        except httpx.RequestError as e:
+            call.ok = False
+            reason = "timeout" if isinstance(e, httpx.TimeoutException) else "network_error"
+            raise ProviderFailure(provider, reason, 500, f"Network error when calling AI API: {str(e)}")
+
+        log_event(
+            "AI API响应",
+            upstream=provider.upstream,
+            provider=provider.name,
+            url=completions_url,
+            status=response.status_code,
+            latency=timer.latency,
+            attempt=attempt,
+            body=lambda: response.text
+        )
+
+        if response.status_code == 200:
+            content = parse_strategy_content(response, attempt)
+            call.ok = content is not None
+            if content is None:
+                raise ProviderFailure(provider, "invalid_response", 500, "Invalid response format from AI API")
+            return {
+                "status": "success",
+                "strategy": content.replace('\n', '<br>'),
+                "provider": provider.name,
+                "model": body.get("model")
+            }
+        if response.status_code >= 500 or response.status_code == 429:
+            call.ok = False
+            raise ProviderFailure(provider, "server_error", response.status_code, f"AI API server error ({response.status_code})")
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to get valid response from AI API after {max_retries} attempts"
+            status_code=response.status_code,
+            detail=f"AI API error: {response.text}"
         )
+
+async def race_ai_providers(
+    pool: ProviderPool,
+    providers: List[Provider],
+    ai_request: Dict[str, Any],
+    attempt: int
+) -> Dict[str, Any]:
+    """同时请求多个提供方，返回最先成功的结果并取消其余请求；全部失败时抛出最后一个失败"""
+    tasks = [asyncio.ensure_future(call_ai_provider(pool, p, ai_request, attempt)) for p in providers]
+    failure = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except ProviderFailure as e:
+                log_provider_failure(e, attempt)
+                failure = e
+                continue
+            AI_RACES.inc(result["provider"])
+            return result
+        raise failure
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def request_strategy(pool: ProviderPool, ai_request: Dict[str, Any], race: bool = False) -> Dict[str, Any]:
+    """按提供方池的排序依次请求，失败时立即换下一个提供方；一轮全部失败后退避重试，最多3轮。
+
+    race=True 时第一轮同时请求排名前两位的提供方。所有提供方都处于熔断时直接返回503。
+    """
+    max_retries = 3
+    retry_delay = 2  # 初始延迟2秒
+    attempt = 0
+
+    for round_index in range(max_retries):
+        failures: List[ProviderFailure] = []
+        tried: List[Provider] = []
+        if race and round_index == 0 and len(pool) > 1:
+            tried = pool.ranked()[:2]
+            attempt += 1
+            try:
+                return await race_ai_providers(pool, tried, ai_request, attempt)
+            except ProviderFailure as e:
+                failures.append(e)
+
+        candidates = pool.ranked(exclude=tried)
+        for index, provider in enumerate(candidates):
+            attempt += 1
+            try:
+                return await call_ai_provider(pool, provider, ai_request, attempt)
+            except ProviderFailure as e:
+                log_provider_failure(e, attempt)
+                failures.append(e)
+                if index + 1 < len(candidates):
+                    AI_FAILOVERS.inc(provider.name, e.reason)
+
+        failure = failures[-1]
+        if all(f.reason == "unavailable" for f in failures):
+            # 全部熔断或排队已满，快速失败而不是占着协程等待
+            raise HTTPException(status_code=failure.status_code, detail=failure.detail, headers=failure.headers)
+        if round_index < max_retries - 1:
+            await retry_backoff(retry_delay, failure.reason)
+            retry_delay *= 2
+
+    raise HTTPException(
+        status_code=failure.status_code,
+        detail=f"{failure.detail} after {attempt} attempts"
+    )
+
+def record_strategy(token_address: str, pair: Optional[Dict[str, Any]], text: str, model: Optional[str]) -> None:
+    """把新生成的策略解析出价位后写入历史库，pair 为生成策略时提供给AI的市场快照"""
+    if history_store is None or not text:
+        return
+    token_address = token_address.strip()
+    try:
+        reference_price = float(pair["priceUsd"]) if pair and pair.get("priceUsd") else None
+    except (TypeError, ValueError):
+        reference_price = None
+    levels = parse_strategy(text, reference_price)
+    history_store.record_strategy(token_address, pair, text, levels, model)
+
+async def generate_strategy(
+    token_address: str,
+    pair: Dict[str, Any],
+    pool: ProviderPool,
+    ai_request: Dict[str, Any],
+    race: bool = False
+) -> Dict[str, Any]:
+    """调用AI生成策略并记录到历史库（缓存命中的结果不会重复记录）"""
+    result = await request_strategy(pool, ai_request, race)
+    record_strategy(token_address, pair, result.get("strategy", ""), result.get("model"))
+    return result
+
+@app.post("/api/analyze")
+async def analyze_chart(request: AnalyzeRequest):
+    # stream=true 时以SSE逐段返回
+    if request.stream:
+        return await analyze_chart_stream(request)
+    return await run_analysis(request)
+
+async def run_analysis(request: AnalyzeRequest, pair: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """非流式分析，pair 为已经获取的主交易对（见 build_market_context）"""
+    try:
+        # 请求没有指定接口时由提供方池选择；未指定模型时使用所选提供方的模型
+        pool = resolve_ai_pool(request)
+        race = request.race and AI_RACE_ENABLED
+
+        # 收集市场数据并构建AI请求
+        with phase("market"):
+            market_context, main_pair = await build_market_context(request.token_address, pair)
+        with phase("prompt"):
+            ai_request = build_ai_request(request, request.model, market_context)
+        
+        # 相同的请求体直接复用缓存结果，并发的相同请求共享一次上游调用
+        cache_key = strategy_cache_key(pool.key, ai_request)
+        # strategy 包含命中缓存或等待其他请求共享的AI调用，实际调用时另有各提供方的阶段
+        with phase("strategy"):
+            if request.bypass_cache:
+                result = await generate_strategy(request.token_address, main_pair, pool, ai_request, race)
+                await strategy_cache.put(cache_key, result)
+                return result
+            return await strategy_cache.get_or_fetch(
+                cache_key,
+                lambda: generate_strategy(request.token_address, main_pair, pool, ai_request, race)
+            )
             
     except Exception as e:
-        print("分析过程中出错:", str(e))
-        print("错误类型:", type(e).__name__)
-        print("错误详情:", str(e))
+        log_event(
+            "分析过程中出错",
+            logging.ERROR,
+            endpoint="/api/analyze",
+            error_type=type(e).__name__,
+            error=str(e)
+        )
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(
@@ -328,174 +1046,609 @@ async def analyze_chart(request: AnalyzeRequest):
             detail=f"Error during analysis: {str(e)}"
         )
 
-async def validate_token(token_address: str, client: httpx.AsyncClient) -> bool:
-    """验证代币是否可交易"""
+async def open_ai_stream(pool: ProviderPool, ai_request: Dict[str, Any]) -> Tuple[httpx.Response, Provider]:
+    """按提供方池的排序发起流式请求，拿到200响应前失败（5xx、429、网络错误、熔断）时换下一个提供方。
+
+    流式调用只统计成败，耗时不计入提供方的耗时EWMA。
+    """
+    candidates = pool.ranked()
+    failures: List[ProviderFailure] = []
+    for index, provider in enumerate(candidates):
+        client = get_client(provider.upstream)
+        body = provider_request(provider, ai_request)
+        with pool.call(provider, measure_latency=False) as call:
+            try:
+                # 流式调用只统计到收到响应头的耗时
+                with upstream_timer("ai_stream") as timer:
+                    upstream = await client.send(
+                        client.build_request("POST", provider.completions_url(), headers=provider.headers(), json=body),
+                        stream=True
+                    )
+                    timer.status = upstream.status_code
+            except UpstreamUnavailable as e:
+                failure = ProviderFailure(provider, "unavailable", e.status_code, e.detail, e.headers)
+            except httpx.RequestError as e:
+                call.ok = False
+                reason = "timeout" if isinstance(e, httpx.TimeoutException) else "network_error"
+                failure = ProviderFailure(provider, reason, 500, f"Network error when calling AI API: {str(e)}")
+            else:
+                if upstream.status_code == 200:
+                    call.ok = True
+                    return upstream, provider
+                error_text = (await upstream.aread()).decode(errors="replace")
+                await upstream.aclose()
+                if upstream.status_code < 500 and upstream.status_code != 429:
+                    raise HTTPException(status_code=upstream.status_code, detail=f"AI API error: {error_text}")
+                call.ok = False
+                failure = ProviderFailure(provider, "server_error", upstream.status_code, f"AI API error: {error_text}")
+
+        log_provider_failure(failure, index + 1)
+        failures.append(failure)
+        if index + 1 < len(candidates):
+            AI_FAILOVERS.inc(provider.name, failure.reason)
+
+    failure = failures[-1]
+    raise HTTPException(status_code=failure.status_code, detail=failure.detail, headers=failure.headers)
+
+@app.post("/api/analyze/stream")
+async def analyze_chart_stream(request: AnalyzeRequest):
+    """以Server-Sent Events转发AI的流式输出"""
+    pool = resolve_ai_pool(request)
+
+    with phase("market"):
+        market_context, main_pair = await build_market_context(request.token_address)
+    with phase("prompt"):
+        ai_request = build_ai_request(request, request.model, market_context)
+    ai_request["stream"] = True
+
+    # 先拿到上游状态码，失败时仍以普通HTTP错误返回
+    started_at = time.monotonic()
+    upstream, provider = await open_ai_stream(pool, ai_request)
+    model = request.model or provider.model
+
+    return StreamingResponse(
+        _relay_ai_stream(
+            upstream,
+            started_at,
+            on_complete=lambda text: record_strategy(request.token_address, main_pair, text, model)
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-AI-Provider": provider.name},
+        background=BackgroundTask(upstream.aclose)
+    )
+
+async def _iter_sse_data(upstream: httpx.Response):
+    """逐条读取上游SSE的data字段，直到 [DONE]"""
+    async for line in upstream.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        yield data
+
+async def _relay_ai_stream(
+    upstream: httpx.Response,
+    started_at: float,
+    on_complete: Optional[Callable[[str], None]] = None
+):
+    parts: List[str] = []
+    chunks = 0
+    characters = 0
+    first_token_latency = None
+    finish_reason = None
+    usage = None
+
+    try:
+        try:
+            async for data in with_heartbeat(_iter_sse_data(upstream), SSE_HEARTBEAT_INTERVAL, SSE_QUEUE_SIZE):
+                if data is HEARTBEAT:
+                    yield format_sse("heartbeat", {"elapsed": round(time.monotonic() - started_at, 3)})
+                    continue
+
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    log_event("无法解析的流式数据", logging.WARNING, upstream="ai", body=data)
+                    continue
+
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+                content = (choices[0].get("delta") or {}).get("content")
+                if not content:
+                    continue
+
+                if first_token_latency is None:
+                    first_token_latency = round(time.monotonic() - started_at, 3)
+                    record_phase("ai_first_token", first_token_latency)
+                chunks += 1
+                characters += len(content)
+                parts.append(content)
+                yield format_sse("delta", {"content": content})
+
+        except Exception as e:
+            log_event("转发AI流式响应时出错", logging.ERROR, endpoint="/api/analyze/stream", error=str(e))
+            yield format_sse("error", {"status_code": 500, "detail": str(e)})
+            return
+
+        # 流式响应头已经发出，生成耗时只出现在日志中
+        record_phase("ai_generation", time.monotonic() - started_at)
+        if on_complete is not None:
+            on_complete("".join(parts))
+        yield format_sse("done", {
+            "status": "success",
+            "finish_reason": finish_reason,
+            "chunks": chunks,
+            "characters": characters,
+            "first_token_latency": first_token_latency,
+            "elapsed": round(time.monotonic() - started_at, 3),
+            "usage": usage
+        })
+    finally:
+        # 读到 [DONE] 就返回，响应体可能还没读完；关闭以归还连接和并发槽位
+        await upstream.aclose()
+
+# 分析任务在后台worker中执行，轮询只需查表
+analysis_jobs = JobManager(
+    analyze_chart,
+    workers=ANALYSIS_JOB_WORKERS,
+    queue_size=ANALYSIS_JOB_QUEUE_SIZE,
+    retention=ANALYSIS_JOB_RETENTION,
+    # 只有多进程共享的状态后端才需要同步任务状态，单进程时本地的任务表就够了
+    store=shared_state
+)
+
+@app.post("/api/analyze/jobs")
+async def submit_analysis_job(request: AnalyzeRequest):
+    """提交分析任务，立即返回任务ID"""
+    try:
+        # 任务结果需要完整文本，不走流式
+        job = await analysis_jobs.submit(request.copy(update={"stream": False}))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Analysis queue is full, please retry later")
+    return {"status": "success", "job_id": job.id, "state": job.state}
+
+@app.get("/api/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """查询分析任务状态，完成后包含结果"""
+    job = await analysis_jobs.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {"status": "success", **job}
+
+@app.delete("/api/analyze/jobs/{job_id}")
+async def cancel_analysis_job(job_id: str):
+    """取消分析任务，执行中的任务会立即中止上游AI请求"""
+    cancelled = await analysis_jobs.cancel(job_id)
+    if cancelled is None:
+        if await analysis_jobs.lookup(job_id) is not None:
+            # 任务由其他worker进程执行，只能在提交它的进程中取消
+            raise HTTPException(status_code=409, detail="Job is owned by another worker")
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {"status": "success", "job_id": job_id, "cancelled": cancelled}
+
+@app.get("/api/analyze/jobs/{job_id}/result")
+async def get_analysis_job_result(job_id: str):
+    """获取分析结果：未完成返回202，失败时返回原始错误"""
+    job = await analysis_jobs.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job["state"] not in (SUCCEEDED, FAILED):
+        return JSONResponse(status_code=202, content={"status": "pending", "state": job["state"]})
+    if job["error"]:
+        raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+    return job["result"]
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(request: BatchAnalyzeRequest):
+    """批量分析关注列表：合并DexScreener查询，再以有限并发逐个生成策略"""
+    token_addresses = list(dict.fromkeys(a.strip() for a in request.token_addresses if a.strip()))
+    if not token_addresses:
+        raise HTTPException(status_code=400, detail="token_addresses is required")
+    if len(token_addresses) > ANALYSIS_BATCH_MAX_TOKENS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many tokens, at most {ANALYSIS_BATCH_MAX_TOKENS} per request"
+        )
+
+    # 批量获取失败时不中断，逐个分析时会各自重新获取
+    try:
+        pairs, missing = await prefetch_market_data(token_addresses)
+        no_pairs = set(missing)
+    except Exception as e:
+        log_event("批量获取市场数据失败", logging.WARNING, endpoint="/api/analyze/batch", error=str(e))
+        pairs, no_pairs = {}, set()
+
+    fields = request.dict(exclude={"token_addresses", "stream"})
+    semaphore = asyncio.Semaphore(ANALYSIS_BATCH_CONCURRENCY)
+
+    async def analyze_one(token_address: str) -> Dict[str, Any]:
+        if token_address in no_pairs:
+            return {"token_address": token_address, "status": "error", "status_code": 404, "detail": "No trading pairs found"}
+        async with semaphore:
+            try:
+                result = await run_analysis(
+                    AnalyzeRequest(token_address=token_address, stream=False, **fields),
+                    pairs.get(token_address)
+                )
+            except HTTPException as e:
+                return {"token_address": token_address, "status": "error", "status_code": e.status_code, "detail": e.detail}
+        return {"token_address": token_address, **result}
+
+    if not request.stream:
+        results = await asyncio.gather(*(analyze_one(a) for a in token_addresses))
+        return {"status": "success", "results": results}
+
+    async def results():
+        tasks = [asyncio.ensure_future(analyze_one(a)) for a in token_addresses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def events():
+        started_at = time.monotonic()
+        succeeded = 0
+        async for result in with_heartbeat(results(), SSE_HEARTBEAT_INTERVAL):
+            if result is HEARTBEAT:
+                yield format_sse("heartbeat", {"elapsed": round(time.monotonic() - started_at, 3)})
+                continue
+            if result["status"] == "success":
+                succeeded += 1
+                yield format_sse("strategy", result)
+            else:
+                yield format_sse("error", result)
+        yield format_sse("done", {
+            "status": "success",
+            "total": len(token_addresses),
+            "succeeded": succeeded,
+            "failed": len(token_addresses) - succeeded,
+            "elapsed": round(time.monotonic() - started_at, 3)
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/market/tracked")
+async def get_tracked_tokens():
+    """后台轮询中的代币列表"""
+    return {"status": "success", "interval": MARKET_POLL_INTERVAL, "token_addresses": market_poller.tokens}
+
+@app.post("/api/market/tracked")
+async def track_tokens(request: TrackTokens):
+    """加入后台轮询列表"""
+    try:
+        added = market_poller.track(a.strip() for a in request.token_addresses if a.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "added": added}
+
+@app.delete("/api/market/tracked/{token_address}")
+async def untrack_token(token_address: str):
+    if not market_poller.untrack(token_address):
+        raise HTTPException(status_code=404, detail="Token is not being tracked")
+    return {"status": "success"}
+
+@app.get("/api/market/{token_address}/series")
+async def get_market_series(token_address: str, limit: Optional[int] = None):
+    """返回后台轮询记录的历史序列（按时间顺序，每个字段一列）"""
+    series = market_poller.series(token_address)
+    if series is None:
+        raise HTTPException(status_code=404, detail="Token is not being tracked")
+    columns = {field: series.column(field, limit) for field in series.fields}
+    return {
+        "status": "success",
+        "token_address": token_address,
+        "samples": len(columns["ts"]),
+        "indicators": compute_indicators(columns["price_usd"], columns["volume_h1"]),
+        # NaN 不是合法的JSON，缺失值返回 null
+        "series": {field: [v if v == v else None for v in values] for field, values in columns.items()}
+    }
+
+@app.get("/api/history/strategies")
+async def get_strategy_history(token_address: Optional[str] = None, limit: int = 50):
+    """历史库中记录的策略及解析出的价位，按生成时间倒序"""
+    if history_store is None:
+        raise HTTPException(status_code=404, detail="Strategy history is disabled")
+    strategies = await asyncio.to_thread(
+        history_store.strategies,
+        [token_address] if token_address else None,
+        limit=min(max(limit, 1), 1000)
+    )
+    return {"status": "success", "strategies": strategies}
+
+def run_backtest(request: BacktestRequest) -> Dict[str, Any]:
+    """读取历史策略和价格采样并回放（同步，在线程中执行）"""
+    strategies = history_store.strategies(
+        request.token_addresses,
+        since=request.since,
+        until=request.until,
+        limit=BACKTEST_MAX_STRATEGIES,
+        include_text=False
+    )
+    holding = request.default_holding_seconds or BACKTEST_DEFAULT_HOLDING
+    if strategies:
+        # 只需要覆盖最早策略到最晚策略加持仓时间的采样
+        since = min(s["created_at"] for s in strategies)
+        until = max(s["created_at"] + (s["holding_seconds"] or holding) for s in strategies)
+        ticks = history_store.load_ticks(sorted({s["token"] for s in strategies}), since, until)
+    else:
+        ticks = {}
+    outcome = replay(strategies, ticks, default_holding=holding)
+    response = {"status": "success", "summary": outcome["summary"]}
+    if request.include_results:
+        response["results"] = result_rows(strategies[:max(request.limit, 0)], outcome["results"])
+    return response
+
+@app.post("/api/backtest")
+async def backtest_strategies(request: BacktestRequest):
+    """用记录的价格序列回放历史策略，统计入场、止盈、止损和收益"""
+    if history_store is None:
+        raise HTTPException(status_code=404, detail="Strategy history is disabled")
+    return await asyncio.to_thread(run_backtest, request)
+
+async def validate_token(token_address: str, client: Optional[httpx.AsyncClient] = None) -> Optional[bool]:
+    """验证代币是否可交易。
+
+    只有GMGN正常返回且没有交易路由时才判定为不可交易；非200状态（5xx、429）、
+    网络错误和无法解析的响应都返回None，表示暂时无法判断。
+    """
+    client = client or get_client("gmgn")
     try:
         # 直接检查是否有可用的交易路由
         quote_url = f"{GMGN_API_HOST}/defi/router/v1/sol/tx/get_swap_route"
         params = {
-            "token_in_address": "So11111111111111111111111111111111111111112",
+            "token_in_address": SOL_ADDRESS,
             "token_out_address": token_address,
             "in_amount": "1000000",  # 使用一个小额测试
             "from_address": "11111111111111111111111111111111",  # 使用一个虚拟地址测试
             "slippage": "1.0"
         }
         
-        quote_response = await client.get(quote_url, params=params)
-        print(f"验证代币 {token_address} 路由响应:", quote_response.text)
+        with upstream_timer("gmgn_route") as timer:
+            quote_response = await client.get(quote_url, params=params)
+            timer.status = quote_response.status_code
+        log_event(
+            "验证代币路由响应",
+            upstream="gmgn_route",
+            token_address=token_address,
+            status=quote_response.status_code,
+            latency=timer.latency,
+            body=lambda: quote_response.text
+        )
         
         if quote_response.status_code != 200:
-            print(f"代币 {token_address} 路由检查失败")
-            return False
+            return None
             
         quote_data = quote_response.json()
         if not quote_data.get("data") or not quote_data["data"].get("raw_tx"):
-            print(f"代币 {token_address} 没有可用的交易路由")
+            log_event("代币没有可用的交易路由", upstream="gmgn_route", token_address=token_address)
             return False
             
         return True
         
+    except UpstreamUnavailable:
+        # 上游不可用时无法判断，不能当作不可交易缓存下来
+        raise
     except Exception as e:
-        print(f"验证代币 {token_address} 时出错:", str(e))
-        return False
+        log_event("验证代币时出错", logging.WARNING, upstream="gmgn_route", token_address=token_address, error=str(e))
+        return None
+
+def _validation_ttl(tradable: Optional[bool]) -> float:
+    # 无法判断的结果不缓存，下次重新检查
+    if tradable is None:
+        return 0
+    return TOKEN_VALIDATION_POSITIVE_TTL if tradable else TOKEN_VALIDATION_NEGATIVE_TTL
+
+async def validate_token_cached(token_address: str) -> Optional[bool]:
+    """带缓存的代币可交易性检查，可交易/不可交易结果使用不同的TTL，无法判断（None）时不缓存"""
+    async def check():
+        async with token_validation_semaphore:
+            return await validate_token(token_address)
+
+    return await token_validation_cache.get_or_fetch(
+        token_address,
+        check,
+        ttl=_validation_ttl
+    )
+
+@app.post("/api/tokens/validate")
+async def validate_tokens(request: TokenValidationRequest):
+    """批量检查代币是否可交易，以SSE按完成顺序返回每个代币的结果"""
+    token_addresses = list(dict.fromkeys(a.strip() for a in request.token_addresses if a.strip()))
+    if not token_addresses:
+        raise HTTPException(status_code=400, detail="token_addresses is required")
+    if len(token_addresses) > TOKEN_VALIDATION_MAX_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many tokens, at most {TOKEN_VALIDATION_MAX_BATCH} per request"
+        )
+
+    async def check(token_address: str):
+        try:
+            return token_address, await validate_token_cached(token_address)
+        except UpstreamUnavailable:
+            return token_address, None
+
+    async def verdicts():
+        started_at = time.monotonic()
+        tradable_count = 0
+        unknown_count = 0
+        tasks = [asyncio.ensure_future(check(a)) for a in token_addresses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                token_address, tradable = await next_done
+                # tradable 为 None 表示上游暂时不可用或出错，结果未知
+                tradable_count += bool(tradable)
+                unknown_count += tradable is None
+                yield format_sse("verdict", {"token_address": token_address, "tradable": tradable})
+            yield format_sse("done", {
+                "status": "success",
+                "total": len(token_addresses),
+                "tradable": tradable_count,
+                "unknown": unknown_count,
+                "elapsed": round(time.monotonic() - started_at, 3)
+            })
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        verdicts(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def fetch_token_account(token_address: str, wallet_address: str, endpoint: str) -> Dict[str, Any]:
+    """获取钱包的代币账户（余额和精度），顺便缓存代币精度"""
+    token_info_url = f"{GMGN_API_HOST}/defi/token/sol/{token_address}/account/{wallet_address}"
+    client = get_client("gmgn")
+    with upstream_timer("gmgn_account") as timer:
+        token_response = await upstream_get("gmgn_account", client, token_info_url)
+        timer.status = token_response.status_code
+    log_event(
+        "代币账户信息响应",
+        endpoint=endpoint,
+        upstream="gmgn_account",
+        status=token_response.status_code,
+        latency=timer.latency,
+        body=lambda: token_response.text
+    )
+
+    if token_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get token account info")
+
+    token_data = token_response.json()
+    if not token_data.get("data") or not token_data["data"].get("balance"):
+        raise HTTPException(status_code=400, detail="Token account not found or zero balance")
+
+    account = token_data["data"]
+    # 代币精度不会变化，永久缓存（按LRU淘汰）
+    token_metadata_cache.set(token_address, {"decimals": account.get("decimals", 9)})
+    return account
+
+def check_token_balance(account: Dict[str, Any], amount_tokens: int) -> None:
+    """检查余额是否足够"""
+    decimals = account.get("decimals", 9)
+    balance = int(account["balance"])
+    if balance < amount_tokens:
+        raise HTTPException(status_code=400, detail=f"Insufficient token balance. Available: {balance / (10 ** decimals)}")
+
+def swap_params(trade_params: TradeParams, in_amount: int) -> Dict[str, str]:
+    """构建交易路由的查询参数"""
+    return {
+        "token_in_address": trade_params.token_address if trade_params.trade_mode == "sell" else SOL_ADDRESS,
+        "token_out_address": SOL_ADDRESS if trade_params.trade_mode == "sell" else trade_params.token_address,
+        "in_amount": str(in_amount),
+        "from_address": trade_params.wallet_address,
+        "slippage": str(trade_params.slippage)
+    }
+
+async def request_swap_route(params: Dict[str, str], endpoint: str) -> Dict[str, Any]:
+    """向GMGN请求交易路由，返回待签名的交易"""
+    quote_url = f"{GMGN_API_HOST}/defi/router/v1/sol/tx/get_swap_route"
+    client = get_client("gmgn")
+    with upstream_timer("gmgn_route") as timer:
+        quote_response = await upstream_get("gmgn_route", client, quote_url, params=params)
+        timer.status = quote_response.status_code
+    log_event(
+        "交易路由响应",
+        endpoint=endpoint,
+        upstream="gmgn_route",
+        params=params,
+        status=quote_response.status_code,
+        latency=timer.latency,
+        body=lambda: quote_response.text
+    )
+
+    if quote_response.status_code != 200:
+        raise HTTPException(
+            status_code=quote_response.status_code, 
+            detail=f"Failed to get trade quote: {quote_response.text}"
+        )
+
+    quote_data = quote_response.json()
+    if not quote_data.get("data") or not quote_data["data"].get("raw_tx"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid response format: {quote_data}"
+        )
+
+    raw_tx = quote_data["data"]["raw_tx"]
+    if not raw_tx.get("swapTransaction"):
+        raise HTTPException(
+            status_code=400,
+            detail="No swap transaction in response"
+        )
+
+    return {
+        "status": "success",
+        "transaction": raw_tx["swapTransaction"],
+        "lastValidBlockHeight": raw_tx.get("lastValidBlockHeight")
+    }
+
+async def quote_trade(trade_params: TradeParams, endpoint: str) -> Dict[str, Any]:
+    """买入按SOL数量直接询价；卖出需要代币精度和余额检查。
+
+    已知精度时余额检查和询价并发进行，余额不足则取消询价；
+    首次卖出某个代币时先查询账户拿到精度，之后的卖出都走并发路径。
+    """
+    if not trade_params.wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address is required")
+
+    if trade_params.trade_mode != "sell":
+        # 买入操作，使用 SOL 数量
+        amount_lamports = int(trade_params.amount * 1e9)  # 转换为 lamports
+        return await request_swap_route(swap_params(trade_params, amount_lamports), endpoint)
+
+    metadata = token_metadata_cache.get(trade_params.token_address)
+    if metadata is None:
+        account = await fetch_token_account(trade_params.token_address, trade_params.wallet_address, endpoint)
+        amount_tokens = int(trade_params.amount * (10 ** account.get("decimals", 9)))
+        check_token_balance(account, amount_tokens)
+        return await request_swap_route(swap_params(trade_params, amount_tokens), endpoint)
+
+    # 计算代币数量（考虑精度）
+    amount_tokens = int(trade_params.amount * (10 ** metadata["decimals"]))
+    quote_task = asyncio.ensure_future(request_swap_route(swap_params(trade_params, amount_tokens), endpoint))
+    try:
+        account = await fetch_token_account(trade_params.token_address, trade_params.wallet_address, endpoint)
+        check_token_balance(account, amount_tokens)
+    except BaseException:
+        quote_task.cancel()
+        # 报价可能已经失败结束（cancel 不起作用），也可能还在收尾；等它结束并取走结果或异常再返回错误
+        await asyncio.gather(quote_task, return_exceptions=True)
+        raise
+    return await quote_task
 
 @app.post("/api/trade")
 async def execute_trade(trade_params: TradeParams):
     """执行交易"""
     try:
-        if not trade_params.wallet_address:
-            raise HTTPException(status_code=400, detail="Wallet address is required")
-
-        async with httpx.AsyncClient() as client:
-            # 如果是卖出操作，先检查代币账户
-            if trade_params.trade_mode == "sell":
-                # 获取代币精度和账户信息
-                token_info_url = f"{GMGN_API_HOST}/defi/token/sol/{trade_params.token_address}/account/{trade_params.wallet_address}"
-                token_response = await client.get(token_info_url)
-                print("代币账户信息响应:", token_response.text)
-                
-                if token_response.status_code != 200:
-                    raise HTTPException(status_code=400, detail="Failed to get token account info")
-                
-                token_data = token_response.json()
-                if not token_data.get("data") or not token_data["data"].get("balance"):
-                    raise HTTPException(status_code=400, detail="Token account not found or zero balance")
-                
-                # 获取代币精度
-                decimals = token_data["data"].get("decimals", 9)
-                # 计算代币数量（考虑精度）
-                amount_tokens = int(trade_params.amount * (10 ** decimals))
-                
-                # 检查余额是否足够
-                balance = int(token_data["data"]["balance"])
-                if balance < amount_tokens:
-                    raise HTTPException(status_code=400, detail=f"Insufficient token balance. Available: {balance / (10 ** decimals)}")
-            else:
-                # 买入操作，使用 SOL 数量
-                amount_tokens = int(trade_params.amount * 1e9)  # 转换为 lamports
-
-            # 构建交易URL
-            quote_url = f"{GMGN_API_HOST}/defi/router/v1/sol/tx/get_swap_route"
-            params = {
-                "token_in_address": trade_params.token_address if trade_params.trade_mode == "sell" else "So11111111111111111111111111111111111111112",
-                "token_out_address": "So11111111111111111111111111111111111111112" if trade_params.trade_mode == "sell" else trade_params.token_address,
-                "in_amount": str(amount_tokens),
-                "from_address": trade_params.wallet_address,
-                "slippage": str(trade_params.slippage)
-            }
-            
-            print("请求URL:", quote_url)
-            print("请求参数:", params)
-            
-            quote_response = await client.get(quote_url, params=params)
-            print("API响应状态码:", quote_response.status_code)
-            print("API响应内容:", quote_response.text)
-            
-            if quote_response.status_code != 200:
-                raise HTTPException(
-                    status_code=quote_response.status_code, 
-                    detail=f"Failed to get trade quote: {quote_response.text}"
-                )
-            
-            quote_data = quote_response.json()
-            if not quote_data.get("data") or not quote_data["data"].get("raw_tx"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid response format: {quote_data}"
-                )
-
-            raw_tx = quote_data["data"]["raw_tx"]
-            if not raw_tx.get("swapTransaction"):
-                raise HTTPException(
-                    status_code=400,
-                    detail="No swap transaction in response"
-                )
-            
-            return {
-                "status": "success",
-                "transaction": raw_tx["swapTransaction"],
-                "lastValidBlockHeight": raw_tx.get("lastValidBlockHeight")
-            }
-            
+        return await quote_trade(trade_params, "/api/trade")
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
-        print("执行交易时出错:", str(e))
+        log_event("执行交易时出错", logging.ERROR, endpoint="/api/trade", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/trade_with_token")
 async def execute_trade_with_token(trade_params: TradeParams):
     """使用代币数量交易"""
     try:
-        if not trade_params.wallet_address:
-            raise HTTPException(status_code=400, detail="Wallet address is required")
-
-        async with httpx.AsyncClient() as client:
-            # 构建交易URL
-            quote_url = f"{GMGN_API_HOST}/defi/router/v1/sol/tx/get_swap_route"
-            params = {
-                "token_in_address": trade_params.token_address if trade_params.trade_mode == "sell" else "So11111111111111111111111111111111111111112",
-                "token_out_address": "So11111111111111111111111111111111111111112" if trade_params.trade_mode == "sell" else trade_params.token_address,
-                "in_amount": str(int(trade_params.amount * 1e9)),  # 统一使用 lamports
-                "from_address": trade_params.wallet_address,
-                "slippage": str(trade_params.slippage)
-            }
-            
-            print("请求URL:", quote_url)
-            print("请求参数:", params)
-            
-            quote_response = await client.get(quote_url, params=params)
-            print("API响应状态码:", quote_response.status_code)
-            print("API响应内容:", quote_response.text)
-            
-            if quote_response.status_code != 200:
-                raise HTTPException(
-                    status_code=quote_response.status_code, 
-                    detail=f"Failed to get trade quote: {quote_response.text}"
-                )
-            
-            quote_data = quote_response.json()
-            print("解析后的响应数据:", quote_data)
-            
-            if not quote_data.get("data") or not quote_data["data"].get("raw_tx"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid response format: {quote_data}"
-                )
-
-            raw_tx = quote_data["data"]["raw_tx"]
-            if not raw_tx.get("swapTransaction"):
-                raise HTTPException(
-                    status_code=400,
-                    detail="No swap transaction in response"
-                )
-            
-            return {
-                "status": "success",
-                "transaction": raw_tx["swapTransaction"],
-                "lastValidBlockHeight": raw_tx.get("lastValidBlockHeight")
-            }
-            
+        return await quote_trade(trade_params, "/api/trade_with_token")
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
-        print("执行代币交易时出错:", str(e))
+        log_event("执行代币交易时出错", logging.ERROR, endpoint="/api/trade_with_token", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/confirm_trade")
@@ -511,61 +1664,229 @@ async def confirm_trade(signed_tx: SignedTransaction):
             "signed_tx": signed_tx.signed_transaction
         }
         
-        async with httpx.AsyncClient() as client:
+        client = get_client("gmgn")
+        with upstream_timer("gmgn_submit") as timer:
             response = await client.post(
                 submit_url,
                 headers=headers,
                 json=body
             )
+            timer.status = response.status_code
+        
+        log_event(
+            "提交交易响应",
+            endpoint="/api/confirm_trade",
+            upstream="gmgn_submit",
+            status=response.status_code,
+            latency=timer.latency,
+            body=lambda: response.text
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code, 
+                detail="Failed to submit transaction"
+            )
+        
+        result = response.json()
+        
+        # 检查交易状态
+        tx_hash = result.get("data", {}).get("hash")
+        if not tx_hash:
+            raise HTTPException(
+                status_code=500,
+                detail="No transaction hash returned"
+            )
+        
+        if signed_tx.last_valid_height is not None:
+            try:
+                tx_tracker.register(tx_hash, signed_tx.last_valid_height)
+            except TrackerFull:
+                # 交易已经提交，跟踪不上只影响推送，客户端仍可自行查询
+                log_event("交易跟踪已满，未登记", logging.WARNING, hash=tx_hash)
             
-            print("提交交易响应:", response.text)
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code, 
-                    detail="Failed to submit transaction"
-                )
-            
-            result = response.json()
-            
-            # 检查交易状态
-            tx_hash = result.get("data", {}).get("hash")
-            if not tx_hash:
-                raise HTTPException(
-                    status_code=500,
-                    detail="No transaction hash returned"
-                )
-                
-            return {"status": "success", "tx_hash": tx_hash}
-            
+        return {"status": "success", "tx_hash": tx_hash}
+        
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def fetch_transaction_status(hash: str, last_valid_height: int) -> Dict[str, Any]:
+    """从GMGN查询交易状态"""
+    # 构建完整的URL（包含查询参数）
+    status_url = f"{GMGN_API_HOST}/defi/router/v1/sol/tx/get_transaction_status"
+    params = {
+        "hash": hash,
+        "last_valid_height": str(last_valid_height)
+    }
+    
+    client = get_client("gmgn")
+    with upstream_timer("gmgn_status") as timer:
+        status_response = await client.get(status_url, params=params)
+        timer.status = status_response.status_code
+    log_event(
+        "查询交易状态响应",
+        upstream="gmgn_status",
+        hash=hash,
+        status=status_response.status_code,
+        latency=timer.latency,
+        body=lambda: status_response.text
+    )
+    
+    if status_response.status_code != 200:
+        raise HTTPException(
+            status_code=status_response.status_code,
+            detail="Failed to get transaction status"
+        )
+    
+    return status_response.json()
+
 @app.get("/api/transaction_status")
 async def get_transaction_status(hash: str, last_valid_height: int):
     try:
-        # 构建完整的URL（包含查询参数）
-        status_url = f"{GMGN_API_HOST}/defi/router/v1/sol/tx/get_transaction_status"
-        params = {
-            "hash": hash,
-            "last_valid_height": str(last_valid_height)
-        }
-        
-        async with httpx.AsyncClient() as client:
-            status_response = await client.get(status_url, params=params)
-            print("查询交易状态响应:", status_response.text)
-            
-            if status_response.status_code != 200:
-                raise HTTPException(
-                    status_code=status_response.status_code,
-                    detail="Failed to get transaction status"
-                )
-            
-            return status_response.json()
-            
+        return await fetch_transaction_status(hash, last_valid_height)
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 所有待确认交易由同一个后台轮询器查询，结果推送给订阅者
+tx_tracker = TransactionTracker(
+    fetch_transaction_status,
+    poll_interval=TX_POLL_INTERVAL,
+    max_interval=TX_POLL_MAX_INTERVAL,
+    backoff=TX_POLL_BACKOFF,
+    timeout=TX_TRACK_TIMEOUT,
+    concurrency=TX_POLL_CONCURRENCY,
+    max_pending=TX_TRACK_MAX_PENDING
+)
+
+def register_transaction(tx_hash: str, last_valid_height: int) -> None:
+    try:
+        tx_tracker.register(tx_hash, last_valid_height)
+    except TrackerFull as e:
+        raise HTTPException(status_code=503, detail=f"{e}, please retry later")
+
+@app.post("/api/transactions/track")
+async def track_transaction(tx: TrackTransaction):
+    """登记待确认交易，由服务端统一轮询"""
+    register_transaction(tx.hash, tx.last_valid_height)
+    return {"status": "success", "hash": tx.hash}
+
+@app.get("/api/transactions/{tx_hash}/events")
+async def transaction_events(tx_hash: str, last_valid_height: Optional[int] = None):
+    """以SSE推送交易的最终状态（success / expired / timeout）"""
+    if last_valid_height is not None:
+        register_transaction(tx_hash, last_valid_height)
+    elif not tx_tracker.is_tracking(tx_hash):
+        raise HTTPException(status_code=404, detail="Transaction is not being tracked")
+
+    queue = tx_tracker.subscribe(tx_hash)
+
+    async def event_stream():
+        try:
+            async for event in with_heartbeat(_iter_queue(queue), SSE_HEARTBEAT_INTERVAL):
+                if event is HEARTBEAT:
+                    yield format_sse("heartbeat", {})
+                    continue
+                yield format_sse(event["state"], event)
+                return
+        finally:
+            tx_tracker.unsubscribe(tx_hash, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _iter_queue(queue: asyncio.Queue):
+    while True:
+        yield await queue.get()
+
+@app.websocket("/ws/transactions")
+async def transaction_events_ws(websocket: WebSocket):
+    """WebSocket订阅：客户端发送 {"hash": ..., "last_valid_height": ...}，服务端推送最终状态。
+
+    每个连接同时最多订阅 TX_WS_MAX_SUBSCRIPTIONS 笔未结束的交易。
+    """
+    await websocket.accept()
+    subscriptions: Dict[str, asyncio.Queue] = {}
+    forwarders: Set[asyncio.Task] = set()
+
+    async def forward(tx_hash: str, queue: asyncio.Queue):
+        event = await queue.get()
+        tx_tracker.unsubscribe(tx_hash, queue)
+        # 推送后允许再次订阅，再次订阅时直接返回缓存的最终状态
+        if subscriptions.get(tx_hash) is queue:
+            del subscriptions[tx_hash]
+        await websocket.send_json(event)
+
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                message = json.loads(frame.get("text") or frame.get("bytes") or "")
+            except ValueError:
+                await websocket.send_json({"state": "error", "detail": "Message must be a JSON object"})
+                continue
+            if not isinstance(message, dict):
+                await websocket.send_json({"state": "error", "detail": "Message must be a JSON object"})
+                continue
+            tx_hash = message.get("hash")
+            if not tx_hash or not isinstance(tx_hash, str):
+                await websocket.send_json({"state": "error", "detail": "hash is required"})
+                continue
+            last_valid_height = message.get("last_valid_height")
+            if last_valid_height is not None:
+                try:
+                    last_valid_height = int(last_valid_height)
+                except (TypeError, ValueError):
+                    await websocket.send_json({
+                        "hash": tx_hash,
+                        "state": "error",
+                        "detail": "last_valid_height must be an integer"
+                    })
+                    continue
+            if tx_hash not in subscriptions and len(subscriptions) >= TX_WS_MAX_SUBSCRIPTIONS:
+                await websocket.send_json({
+                    "hash": tx_hash,
+                    "state": "error",
+                    "detail": f"Too many subscriptions, at most {TX_WS_MAX_SUBSCRIPTIONS} per connection"
+                })
+                continue
+            if last_valid_height is not None:
+                try:
+                    tx_tracker.register(tx_hash, last_valid_height)
+                except TrackerFull as e:
+                    await websocket.send_json({"hash": tx_hash, "state": "error", "detail": f"{e}, please retry later"})
+                    continue
+            elif not tx_tracker.is_tracking(tx_hash):
+                # 和SSE接口的404一致：既没有登记过也没有给出 last_valid_height，永远等不到结果
+                await websocket.send_json({"hash": tx_hash, "state": "error", "detail": "Transaction is not being tracked"})
+                continue
+            if tx_hash in subscriptions:
+                continue
+            queue = tx_tracker.subscribe(tx_hash)
+            subscriptions[tx_hash] = queue
+            task = asyncio.create_task(forward(tx_hash, queue))
+            forwarders.add(task)
+            task.add_done_callback(forwarders.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(forwarders):
+            task.cancel()
+        for tx_hash, queue in subscriptions.items():
+            tx_tracker.unsubscribe(tx_hash, queue)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("server:app", host="127.0.0.1", port=8000, reload=True) 
\ No newline at end of file
+    if SERVER_WORKERS > 1:
+        # 多进程模式不支持自动重载
+        uvicorn.run("server:app", host="127.0.0.1", port=8000, workers=SERVER_WORKERS)
+    else:
+        uvicorn.run("server:app", host="127.0.0.1", port=8000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,53 @@
+import asyncio
+import json
+from contextlib import suppress
+from typing import Any, AsyncIterator
+
+# with_heartbeat 在上游长时间无数据时产出该标记
+HEARTBEAT = object()
+_END = object()
+
+
+def format_sse(event: str, data: Any) -> str:
+    """序列化为一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def with_heartbeat(
+    source: AsyncIterator[Any],
+    interval: float,
+    queue_size: int = 32
+) -> AsyncIterator[Any]:
+    """转发source的数据，空闲超过interval秒时插入HEARTBEAT。
+
+    读取和转发之间是有界队列：下游消费慢时队列写满，读取协程随之暂停，
+    上游连接也就不再被读取（背压），内存占用不会随响应长度增长。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put((item, None))
+        except Exception as e:
+            await queue.put((_END, e))
+            return
+        await queue.put((_END, None))
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(queue.get(), interval)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
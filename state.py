@@ -0,0 +1,173 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+
+class StateBackend:
+    """进程间共享状态的接口。
+
+    键为字符串，值为可JSON序列化的对象，ttl 单位为秒（None 表示不过期）。
+    Redis 之类的外部存储实现这几个方法即可接入（GET / SET EX / DEL / INCRBYFLOAT + EXPIRE NX）。
+    """
+
+    # 数据是否对其他worker进程可见；进程内后端不需要再叠加一层本地缓存
+    shared = False
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        """原子自增并返回新值；ttl 只在键首次创建时生效，适合固定窗口计数"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """单进程内存后端，用于单worker部署"""
+
+    # 每写入这么多次清理一次过期数据（过期的键只在读取时才会删除）
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], Any]] = {}
+        self._writes = 0
+
+    def _live(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def _maybe_purge(self) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            now = time.time()
+            for key in [k for k, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]:
+                del self._data[key]
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(key)
+        return None if entry is None else entry[1]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._maybe_purge()
+        self._data[key] = (time.time() + ttl if ttl is not None else None, value)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        entry = self._live(key)
+        if entry is None:
+            self._maybe_purge()
+            entry = (time.time() + ttl if ttl is not None else None, 0)
+        value = entry[1] + amount
+        self._data[key] = (entry[0], value)
+        return value
+
+
+class SQLiteBackend(StateBackend):
+    """本机多进程共享的SQLite后端（WAL模式，读写互不阻塞）。
+
+    每个进程持有一个连接，所有操作在单独的线程里串行执行，不阻塞事件循环。
+    """
+
+    shared = True
+
+    # 每写入这么多次清理一次过期数据
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str = "wavetrader_state.db", busy_timeout: float = 5.0):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-sqlite")
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._writes = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _get(self, key: str) -> Any:
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at)
+        )
+        self._maybe_purge()
+
+    def _incr(self, key: str, amount: float, ttl: Optional[float]) -> float:
+        now = time.time()
+        # IMMEDIATE 事务先拿写锁，保证多进程下读-改-写是原子的
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                value, expires_at = amount, (now + ttl if ttl is not None else None)
+            else:
+                value, expires_at = json.loads(row[0]) + amount, row[1]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._maybe_purge()
+        return value
+
+    def _maybe_purge(self) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    async def get(self, key: str) -> Any:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._run(lambda: self._conn.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    async def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        return await self._run(self._incr, key, amount, ttl)
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=False)
+
+
+def create_backend(kind: str, sqlite_path: str = "wavetrader_state.db") -> StateBackend:
+    kind = kind.lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown STATE_BACKEND '{kind}', expected 'memory' or 'sqlite'")
@@ -176,13 +176,8 @@ async function generateStrategy() {
             }
         ];
 
-        // 设置更长的超时时间
-        const timeoutPromise = new Promise((_, reject) => {
-            setTimeout(() => reject(new Error(i18n.t('app.errors.request_timeout'))), 600000); // 10分钟超时
-        });
-
-        // 创建实际的请求
-        const fetchPromise = fetch('/api/analyze', {
+        // 提交后台分析任务，之后只轮询任务状态，不会重复触发AI调用
+        const submitResponse = await fetch('/api/analyze/jobs', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -194,29 +189,24 @@ async function generateStrategy() {
             })
         });
 
-        // 使用Promise.race来处理超时
-        const response = await Promise.race([fetchPromise, timeoutPromise]);
-
-        // 检查响应状态
-        if (!response.ok) {
-            const errorText = await response.text();
+        if (!submitResponse.ok) {
+            const errorText = await submitResponse.text();
             console.error(i18n.t('app.errors.api_response_error'), errorText);
             throw new Error(errorText || i18n.t('app.errors.strategy_generation_failed'));
         }
 
-        // 读取响应内容
-        const data = await response.json();
+        const { job_id: jobId } = await submitResponse.json();
+        pendingAnalysisJob = jobId;
+        let data;
+        try {
+            data = await waitForAnalysisJob(jobId, strategyOutput);
+        } finally {
+            pendingAnalysisJob = null;
+        }
         console.log(i18n.t('app.logs.api_response_data'), data);
 
         if (data.strategy) {
-            // 使用 marked 将 markdown 转换为 HTML
-            strategyOutput.style.whiteSpace = 'pre-wrap';
-            strategyOutput.className = 'bg-gray-700 p-6 rounded-lg min-h-[300px] text-lg markdown-body';
-            const formattedStrategy = data.strategy
-                .replace(/<br>/g, '\n')
-                .replace(/\*\*/g, '__')
-                .replace(/- /g, '* ');
-            strategyOutput.innerHTML = marked.parse(formattedStrategy);
+            renderStrategy(strategyOutput, data.strategy);
         } else {
             throw new Error(i18n.t('app.errors.invalid_response_format'));
         }
@@ -224,58 +214,77 @@ async function generateStrategy() {
         console.error(i18n.t('app.errors.strategy_generation_error'), error);
         if (error.message === i18n.t('app.errors.request_timeout')) {
             strategyOutput.innerHTML = i18n.t('app.errors.strategy_timeout');
-            // 继续轮询检查结果
-            let retryCount = 0;
-            const checkResult = async () => {
-                try {
-                    const response = await fetch('/api/analyze', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({
-                            token_address: tokenAddress,
-                            ...params,
-                            messages: messages
-                        })
-                    });
-
-                    if (response.ok) {
-                        const data = await response.json();
-                        if (data.strategy) {
-                            strategyOutput.style.whiteSpace = 'pre-wrap';
-                            strategyOutput.className = 'bg-gray-700 p-6 rounded-lg min-h-[300px] text-lg markdown-body';
-                            const formattedStrategy = data.strategy
-                                .replace(/<br>/g, '\n')
-                                .replace(/\*\*/g, '__')
-                                .replace(/- /g, '* ');
-                            strategyOutput.innerHTML = marked.parse(formattedStrategy);
-                            return;
-                        }
-                    }
-
-                    if (retryCount++ < 60) { // 最多重试60次，每10秒一次
-                        strategyOutput.innerHTML = `${i18n.t('app.strategy.loading')} (${retryCount}/60)`;
-                        setTimeout(checkResult, 10000);
-                    } else {
-                        strategyOutput.innerHTML = i18n.t('app.errors.strategy_timeout');
-                    }
-                } catch (error) {
-                    console.error('检查结果时出错:', error);
-                    if (retryCount++ < 60) {
-                        setTimeout(checkResult, 10000);
-                    } else {
-                        strategyOutput.innerHTML = i18n.t('app.errors.strategy_timeout');
-                    }
-                }
-            };
-            setTimeout(checkResult, 10000);
         } else {
             strategyOutput.innerHTML = `${i18n.t('app.errors.strategy_generation_error')}: ${error.message}`;
         }
     }
 }
 
+// 正在等待结果的分析任务，离开页面时取消以释放服务端的AI调用
+let pendingAnalysisJob = null;
+
+function cancelAnalysisJob(jobId) {
+    // keepalive: 页面卸载后请求仍会发出
+    return fetch(`/api/analyze/jobs/${jobId}`, { method: 'DELETE', keepalive: true })
+        .catch(error => console.error('取消分析任务失败:', error));
+}
+
+window.addEventListener('pagehide', () => {
+    if (pendingAnalysisJob) {
+        cancelAnalysisJob(pendingAnalysisJob);
+    }
+});
+
+// 轮询分析任务，直到完成或超时（每2秒一次，最多10分钟）
+async function waitForAnalysisJob(jobId, strategyOutput) {
+    const pollInterval = 2000;
+    const maxPolls = 300;
+
+    for (let poll = 1; poll <= maxPolls; poll++) {
+        await new Promise(resolve => setTimeout(resolve, pollInterval));
+
+        let response;
+        try {
+            response = await fetch(`/api/analyze/jobs/${jobId}`);
+        } catch (error) {
+            console.error('检查结果时出错:', error);
+            continue;
+        }
+        if (response.status === 404) {
+            // 任务不存在或结果已过期
+            throw new Error(i18n.t('app.errors.strategy_generation_failed'));
+        }
+        if (!response.ok) {
+            continue;
+        }
+
+        const job = await response.json();
+
+        if (job.state === 'succeeded') {
+            return job.result;
+        }
+        if (job.state === 'failed') {
+            throw new Error((job.error && job.error.detail) || i18n.t('app.errors.strategy_generation_failed'));
+        }
+        strategyOutput.innerHTML = `${i18n.t('app.strategy.loading')} (${Math.round(poll * pollInterval / 1000)}s)`;
+    }
+
+    // 不再等待结果，通知服务端停止
+    cancelAnalysisJob(jobId);
+    throw new Error(i18n.t('app.errors.request_timeout'));
+}
+
+function renderStrategy(strategyOutput, strategy) {
+    // 使用 marked 将 markdown 转换为 HTML
+    strategyOutput.style.whiteSpace = 'pre-wrap';
+    strategyOutput.className = 'bg-gray-700 p-6 rounded-lg min-h-[300px] text-lg markdown-body';
+    const formattedStrategy = strategy
+        .replace(/<br>/g, '\n')
+        .replace(/\*\*/g, '__')
+        .replace(/- /g, '* ');
+    strategyOutput.innerHTML = marked.parse(formattedStrategy);
+}
+
 // Initialize Solana wallet connection
 async function initWallet() {
     try {
@@ -512,7 +521,8 @@ async function executeTrade() {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    signed_transaction: serializedTransaction
+                    signed_transaction: serializedTransaction,
+                    last_valid_height: data.lastValidBlockHeight
                 })
             });
 
@@ -528,38 +538,26 @@ async function executeTrade() {
             // 显示交易成功消息
             alert('交易已提交! 交易哈希: ' + confirmData.tx_hash);
             
-            // 开始轮询交易状态
-            let maxRetries = 60; // 最多等待60秒
-            const checkStatus = async () => {
-                try {
-                    const statusResponse = await fetch(
-                        `/api/transaction_status?hash=${confirmData.tx_hash}&last_valid_height=${data.lastValidBlockHeight}`
-                    );
-                    
-                    if (statusResponse.ok) {
-                        const statusData = await statusResponse.json();
-                        console.log('交易状态:', statusData);
-                        if (statusData.data.success) {
-                            alert('交易已确认成功!');
-                            return;
-                        } else if (statusData.data.expired) {
-                            alert('交易已过期');
-                            return;
-                        }
-                    }
-                    
-                    if (--maxRetries > 0) {
-                        setTimeout(checkStatus, 1000);
-                    } else {
-                        alert('交易状态查询超时，请手动检查交易状态');
-                    }
-                } catch (error) {
-                    console.error('检查交易状态时出错:', error);
-                }
+            // 订阅服务端推送的交易确认结果
+            const events = new EventSource(
+                `/api/transactions/${confirmData.tx_hash}/events?last_valid_height=${data.lastValidBlockHeight}`
+            );
+            events.addEventListener('success', () => {
+                events.close();
+                alert('交易已确认成功!');
+            });
+            events.addEventListener('expired', () => {
+                events.close();
+                alert('交易已过期');
+            });
+            events.addEventListener('timeout', () => {
+                events.close();
+                alert('交易状态查询超时，请手动检查交易状态');
+            });
+            events.onerror = (error) => {
+                console.error('检查交易状态时出错:', error);
             };
             
-            checkStatus();
-            
         } catch (error) {
             console.error('交易签名错误:', error);
             throw new Error('交易签名失败: ' + error.message);
@@ -583,6 +581,54 @@ function appendMessage(role, content) {
     messageDiv.appendChild(messageBubble);
     chatHistory.appendChild(messageDiv);
     chatHistory.scrollTop = chatHistory.scrollHeight;
+    return messageBubble;
+}
+
+// 读取 /api/analyze/stream 的SSE事件，每收到一段内容调用一次 onDelta
+async function streamAnalysis(body, onDelta) {
+    const response = await fetch('/api/analyze/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+
+    if (!response.ok) {
+        throw new Error(await response.text());
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+
+            const payload = data ? JSON.parse(data) : {};
+            if (event === 'delta') {
+                onDelta(payload.content);
+            } else if (event === 'error') {
+                throw new Error(payload.detail);
+            } else if (event === 'done') {
+                return payload;
+            }
+        }
+    }
 }
 
 async function sendMessage() {
@@ -604,29 +650,29 @@ async function sendMessage() {
     }
     
     try {
-        const response = await fetch('/api/analyze', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                token_address: currentTokenAddress,
-                ...modelParams,
-                messages: [
-                    {
-                        role: "system",
-                        content: "你是一位专业的加密货币交易分析助手。你可以访问来自GMGN和DexScreener的实时市场数据，包括价格、交易量、流动性等关键指标。请基于这些数据为用户提供专业的交易分析和建议。在回答问题时，要结合短期和长期的市场趋势，并始终强调风险管理的重要性。"
-                    },
-                    {
-                        role: "user",
-                        content: message
-                    }
-                ]
-            })
+        const bubble = appendMessage('assistant', '');
+        const chatHistory = document.getElementById('chatHistory');
+        let reply = '';
+
+        await streamAnalysis({
+            token_address: currentTokenAddress,
+            ...modelParams,
+            stream: true,
+            messages: [
+                {
+                    role: "system",
+                    content: "你是一位专业的加密货币交易分析助手。你可以访问来自GMGN和DexScreener的实时市场数据，包括价格、交易量、流动性等关键指标。请基于这些数据为用户提供专业的交易分析和建议。在回答问题时，要结合短期和长期的市场趋势，并始终强调风险管理的重要性。"
+                },
+                {
+                    role: "user",
+                    content: message
+                }
+            ]
+        }, (content) => {
+            reply += content;
+            bubble.innerText = reply;
+            chatHistory.scrollTop = chatHistory.scrollHeight;
         });
-        
-        const data = await response.json();
-        appendMessage('assistant', data.strategy.replace(/<br>/g, '\n'));
     } catch (error) {
         console.error('发送消息时出错:', error);
         appendMessage('assistant', '抱歉，处理您的消息时出现错误。');
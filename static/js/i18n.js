@@ -7,7 +7,8 @@ class I18n {
 
     async loadTranslations() {
         try {
-            const response = await fetch(`/locales/${this.currentLocale}.json`);
+            const path = `/locales/${this.currentLocale}.json`;
+            const response = await fetch((window.ASSET_MANIFEST || {})[path] || path);
             this.translations = await response.json();
             this.updatePageContent();
         } catch (error) {
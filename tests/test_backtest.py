@@ -0,0 +1,126 @@
+import numpy as np
+
+from backtest import LONG, SHORT, parse_strategy, replay, result_rows
+
+MARKDOWN_STRATEGY = """### 1. 当前是适合买入还是卖出的时机
+- **建议买入**，短线有反弹动能
+### 2. 具体的入场价格区间
+- 0.0012 - 0.0013
+### 3. 明确的止盈价格位置（可以设置多个目标位）
+- 第一目标：0.0016
+- 第二目标：0.0019
+### 4. 止损
+0.0010（跌破支撑离场）
+### 5. 预计的持仓时间
+1-3 天
+### 6. 建议的仓位大小
+不超过 5%
+"""
+
+SINGLE_LINE_STRATEGY = "建议在当前价格附近分批买入，入场区间 0.0012-0.0013，止盈 0.0016 / 0.0019，止损 0.0010，持仓 1-3 天，仓位 5%。"
+
+EXPECTED = {
+    "direction": LONG,
+    "entry_low": 0.0012,
+    "entry_high": 0.0013,
+    "take_profits": [0.0016, 0.0019],
+    "stop_loss": 0.0010,
+    "holding_seconds": 3 * 86400,
+}
+
+
+def test_numbered_markdown_headings_with_values_on_next_line():
+    assert parse_strategy(MARKDOWN_STRATEGY) == EXPECTED
+
+
+def test_single_line_strategy_split_on_chinese_punctuation():
+    assert parse_strategy(SINGLE_LINE_STRATEGY) == EXPECTED
+
+
+def test_numbered_list_under_headings_and_short_direction():
+    text = """1. 操作建议：做空
+2. 入场区间：
+   - 1.52
+   - 1.55
+3. 止盈：
+   1. 1.40
+   2. 1.30
+4. 止损：1.62
+5. 持有 6 小时"""
+    assert parse_strategy(text) == {
+        "direction": SHORT,
+        "entry_low": 1.52,
+        "entry_high": 1.55,
+        "take_profits": [1.40, 1.30],
+        "stop_loss": 1.62,
+        "holding_seconds": 6 * 3600,
+    }
+
+
+def test_percent_levels_relative_to_entry():
+    strategy = parse_strategy("入场价 100，止盈 +10%，止损 5%")
+    assert strategy["entry_high"] == 100
+    assert strategy["take_profits"] == [100 * 1.1]
+    assert strategy["stop_loss"] == 95
+
+
+def test_percent_levels_fall_back_to_reference_price():
+    strategy = parse_strategy("止盈 20%\n止损 10%", reference_price=2.0)
+    assert strategy["entry_low"] is None and strategy["entry_high"] is None
+    assert strategy["take_profits"] == [2.4]
+    assert strategy["stop_loss"] == 1.8
+
+
+def _strategy(token, created_at, **levels):
+    strategy = dict(parse_strategy(SINGLE_LINE_STRATEGY), token=token, created_at=created_at)
+    strategy.update(levels)
+    return strategy
+
+
+def test_replay_outcomes():
+    ts = np.arange(10, dtype=np.float64) * 60
+    ticks = {
+        "up": (ts, np.array([0.0014, 0.00125, 0.0014, 0.0017, 0.0020, 0.0020, 0.0020, 0.0020, 0.0020, 0.0020])),
+        "down": (ts, np.array([0.0013, 0.0012, 0.0011, 0.0009, 0.0009, 0.0009, 0.0009, 0.0009, 0.0009, 0.0009])),
+        "never": (ts, np.full(10, 0.0015)),
+    }
+    strategies = [
+        _strategy("up", 0.0),
+        _strategy("down", 0.0),
+        _strategy("never", 0.0),
+        # 持仓窗口内既没止盈也没止损，按窗口最后一个价格平仓
+        _strategy("down", 0.0, holding_seconds=120, stop_loss=0.0005),
+        _strategy("missing", 0.0),
+    ]
+
+    outcome = replay(strategies, ticks)
+    results = outcome["results"]
+    assert list(results["reason"]) == ["take_profit", "stop_loss", "no_entry", "time", "no_data"]
+    assert results["entry_price"][0] == 0.00125
+    assert results["exit_price"][0] == 0.0017
+    assert results["targets_hit"][0] == 1
+    assert results["exit_price"][1] == 0.0009
+    assert results["exit_price"][3] == 0.0011
+
+    summary = outcome["summary"]
+    assert summary["strategies"] == 5
+    assert summary["with_data"] == 4
+    assert summary["entered"] == 3
+    assert summary["take_profit_rate"] == round(1 / 3, 4)
+
+    rows = result_rows(strategies, results)
+    assert rows[0]["outcome"] == "take_profit"
+    assert rows[2]["entry_price"] is None
+    assert rows[4]["return"] is None
+
+
+def test_replay_batches_match_single_batch():
+    ts = np.arange(50, dtype=np.float64)
+    rng = np.random.default_rng(0)
+    price = 0.00125 + np.cumsum(rng.normal(0, 0.00002, 50))
+    strategies = [_strategy("t", float(i), holding_seconds=20) for i in range(30)]
+    single = replay(strategies, {"t": (ts, price)})["results"]
+    batched = replay(strategies, {"t": (ts, price)}, max_batch_ticks=7)["results"]
+    assert list(single["reason"]) == list(batched["reason"])
+    np.testing.assert_array_equal(single["ticks"], batched["ticks"])
+    np.testing.assert_allclose(single["return"], batched["return"], equal_nan=True)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from deadline import RequestLifecycleMiddleware, check_deadline
+from metrics import REQUESTS_CANCELLED
+
+
+def cancelled(route: str, reason: str) -> float:
+    return REQUESTS_CANCELLED._values.get((route, reason), 0)
+
+
+def build_app(events):
+    app = FastAPI()
+
+    async def chunks(count: int, delay: float):
+        try:
+            for i in range(count):
+                await asyncio.sleep(delay)
+                yield f"chunk{i}\n"
+        finally:
+            events.append("stream closed")
+
+    @app.get("/stream")
+    async def stream(count: int = 3, delay: float = 0.0):
+        return StreamingResponse(
+            chunks(count, delay),
+            media_type="text/plain",
+            background=BackgroundTask(lambda: events.append("background"))
+        )
+
+    @app.get("/slow")
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            events.append("slow cancelled")
+            raise
+        return {"ok": True}
+
+    @app.get("/budget")
+    async def budget():
+        check_deadline(10)
+        return {"ok": True}
+
+    return RequestLifecycleMiddleware(app, default_timeout=None, max_timeout=None)
+
+
+async def call(app, path, headers=(), disconnect_after_chunks=None):
+    """模拟uvicorn：响应体发完后 receive() 立即返回断开；可以在收到若干块后模拟客户端断开"""
+    sent = []
+    complete = asyncio.Event()
+    chunks = 0
+    chunk_seen = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        if disconnect_after_chunks is not None:
+            while chunks < disconnect_after_chunks:
+                chunk_seen.clear()
+                await chunk_seen.wait()
+        else:
+            await complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal chunks
+        sent.append(message)
+        if message["type"] == "http.response.body":
+            if message.get("body"):
+                chunks += 1
+                chunk_seen.set()
+            if not message.get("more_body", False):
+                complete.set()
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 1),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, body
+
+
+def test_completed_stream_runs_background_task_and_is_not_cancelled():
+    events = []
+    app = build_app(events)
+    before = cancelled("/stream", "disconnect")
+
+    async def run():
+        return [await call(app, "/stream") for _ in range(20)]
+
+    results = asyncio.run(run())
+    assert all(status == 200 and body == b"chunk0\nchunk1\nchunk2\n" for status, body in results)
+    assert events.count("background") == 20
+    assert events.count("stream closed") == 20
+    assert cancelled("/stream", "disconnect") == before
+
+
+def test_client_disconnect_mid_stream_stops_stream():
+    events = []
+    app = build_app(events)
+    status, body = asyncio.run(call(app, "/stream?count=100&delay=0.01", disconnect_after_chunks=2))
+    assert status == 200
+    assert body.count(b"chunk") < 100
+    assert "stream closed" in events
+
+
+def test_client_disconnect_cancels_handler():
+    events = []
+    app = build_app(events)
+    before = cancelled("/slow", "disconnect")
+    asyncio.run(call(app, "/slow", disconnect_after_chunks=0))
+    assert events == ["slow cancelled"]
+    assert cancelled("/slow", "disconnect") == before + 1
+
+
+def test_deadline_returns_504_and_cancels_handler():
+    events = []
+    app = build_app(events)
+    status, body = asyncio.run(call(app, "/slow", headers=[("x-request-timeout", "0.1")]))
+    assert status == 504
+    assert json.loads(body)["detail"] == "Request deadline exceeded"
+    assert events == ["slow cancelled"]
+
+
+def test_check_deadline_fails_fast_when_budget_is_too_small():
+    events = []
+    app = build_app(events)
+    status, _ = asyncio.run(call(app, "/budget", headers=[("x-request-timeout", "1")]))
+    assert status == 504
+    status, _ = asyncio.run(call(app, "/budget"))
+    assert status == 200
@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+from resilience import Hedger
+
+
+def scripted(*plan):
+    """依次返回每次调用的 (耗时, 状态码或异常)，记录调用和取消"""
+    calls = []
+
+    async def attempt():
+        index = len(calls)
+        calls.append("started")
+        delay, outcome = plan[index]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls[index] = "cancelled"
+            raise
+        calls[index] = "finished"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return httpx.Response(outcome, text=f"attempt{index}")
+
+    return attempt, calls
+
+
+def hedger(**kwargs):
+    kwargs.setdefault("initial_delay", 0.02)
+    kwargs.setdefault("min_delay", 0.02)
+    # 预算足够每个请求都对冲
+    kwargs.setdefault("budget_ratio", 1.0)
+    return Hedger("test", **kwargs)
+
+
+def test_fast_primary_is_not_hedged():
+    attempt, calls = scripted((0.0, 200))
+    response = asyncio.run(hedger().run(attempt))
+    assert response.text == "attempt0"
+    assert calls == ["finished"]
+
+
+def test_hedge_wins_and_primary_is_cancelled():
+    attempt, calls = scripted((1.0, 200), (0.0, 200))
+    response = asyncio.run(hedger().run(attempt))
+    assert response.text == "attempt1"
+    assert calls == ["cancelled", "finished"]
+
+
+@pytest.mark.parametrize("failure", [503, 429, httpx.ConnectError("boom")])
+def test_fast_failure_waits_for_the_other_attempt(failure):
+    attempt, calls = scripted((0.1, 200), (0.0, failure))
+    response = asyncio.run(hedger().run(attempt))
+    assert response.status_code == 200
+    assert response.text == "attempt0"
+    assert calls == ["finished", "finished"]
+
+
+def test_all_attempts_fail_returns_first_failure():
+    attempt, _ = scripted((0.1, 500), (0.0, 503))
+    response = asyncio.run(hedger().run(attempt))
+    assert response.status_code == 503
+
+
+def test_all_attempts_raise():
+    attempt, _ = scripted((0.1, httpx.ReadTimeout("slow")), (0.0, httpx.ConnectError("boom")))
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(hedger().run(attempt))
+
+
+def test_no_budget_waits_for_primary():
+    attempt, calls = scripted((0.05, 200), (0.0, 200))
+    response = asyncio.run(hedger(budget_ratio=0.0).run(attempt))
+    assert response.text == "attempt0"
+    assert calls == ["finished"]
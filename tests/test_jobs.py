@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from jobs import FAILED, SUCCEEDED, JobManager
+from state import MemoryBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+async def handler(payload):
+    if payload == "fail":
+        raise ValueError("bad payload")
+    return {"echo": payload}
+
+
+async def run_jobs(manager, payloads):
+    jobs = [await manager.submit(payload) for payload in payloads]
+    await manager._queue.join()
+    return jobs
+
+
+def test_finished_jobs_are_dropped_after_retention(clock):
+    async def main():
+        manager = JobManager(handler, workers=2, retention=60)
+        manager.start()
+        try:
+            ok, failed = await run_jobs(manager, ["a", "fail"])
+            assert (await manager.lookup(ok.id))["result"] == {"echo": "a"}
+            assert (await manager.lookup(failed.id))["state"] == FAILED
+
+            clock.now += 59
+            assert manager.get(ok.id).state == SUCCEEDED
+
+            clock.now += 2
+            assert await manager.lookup(ok.id) is None
+            # 提交新任务时清理其余过期任务
+            await manager.submit("b")
+            assert failed.id not in manager._jobs
+            assert len(manager._jobs) == 1
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_shared_store_entries_expire_with_retention(clock):
+    async def main():
+        store = MemoryBackend()
+        manager = JobManager(handler, workers=1, retention=60, store=store)
+        manager.start()
+        try:
+            job, = await run_jobs(manager, ["a"])
+            # 另一个进程只能从共享存储查到
+            other = JobManager(handler, store=store)
+            assert (await other.lookup(job.id))["state"] == SUCCEEDED
+
+            clock.now += 61
+            assert await other.lookup(job.id) is None
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_memory_backend_purges_expired_keys_without_reads(clock):
+    async def main():
+        store = MemoryBackend()
+        await store.set("forever", 1)
+        for i in range(MemoryBackend.PURGE_EVERY - 2):
+            await store.set(f"job:{i}", i, ttl=60)
+        assert len(store._data) == MemoryBackend.PURGE_EVERY - 1
+
+        clock.now += 61
+        # 下一次写入触发清理
+        await store.set("fresh", 1, ttl=60)
+        assert set(store._data) == {"forever", "fresh"}
+
+    asyncio.run(main())
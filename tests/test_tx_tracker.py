@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from tx_tracker import SUCCESS, TrackerFull, TransactionTracker
+
+
+async def never_confirmed(tx_hash, last_valid_height):
+    return {"data": {"success": False, "expired": False}}
+
+
+def test_register_rejects_new_transactions_when_full():
+    async def main():
+        tracker = TransactionTracker(never_confirmed, max_pending=2)
+        tracker.register("a", 1)
+        tracker.register("b", 1)
+        # 已在跟踪的交易重复登记不受上限影响
+        tracker.register("a", 1)
+        with pytest.raises(TrackerFull):
+            tracker.register("c", 1)
+        assert not tracker.is_tracking("c")
+
+    asyncio.run(main())
+
+
+def test_finished_transactions_free_their_slot():
+    async def confirmed(tx_hash, last_valid_height):
+        return {"data": {"success": True}}
+
+    async def main():
+        tracker = TransactionTracker(confirmed, max_pending=1)
+        tracker.start()
+        try:
+            queue = tracker.subscribe("a")
+            tracker.register("a", 1)
+            event = await asyncio.wait_for(queue.get(), 1)
+            assert event["state"] == SUCCESS
+            tracker.register("b", 1)
+            assert tracker.is_tracking("b")
+        finally:
+            await tracker.stop()
+
+    asyncio.run(main())
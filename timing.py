@@ -0,0 +1,114 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from app_logging import get_logger, log_event
+
+logger = get_logger("timing")
+
+# 当前请求的阶段耗时，请求之外（后台任务、轮询）为None，记录时直接忽略
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """一次请求内各阶段的累计耗时（秒）和次数，同名阶段（例如重试）合并"""
+
+    __slots__ = ("started_at", "phases", "counts")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def header_value(self) -> str:
+        """Server-Timing 格式：name;dur=毫秒，多次出现的阶段附带次数"""
+        entries: List[str] = []
+        for name, seconds in self.phases.items():
+            entry = f"{name};dur={seconds * 1000:.1f}"
+            if self.counts[name] > 1:
+                entry += f';desc="x{self.counts[name]}"'
+            entries.append(entry)
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+
+
+def record(name: str, seconds: float) -> None:
+    """把一段已测得的耗时计入当前请求"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """统计代码块的耗时；并发执行的同名阶段耗时累加，可能超过总耗时"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started_at)
+
+
+class ServerTimingMiddleware:
+    """为每个HTTP请求收集阶段耗时，写入 Server-Timing 响应头和结构化日志。
+
+    响应头在响应开始时生成，流式响应之后的阶段只出现在日志里。
+    总耗时不低于 log_threshold 秒的请求以INFO记录，其余为DEBUG。
+    """
+
+    def __init__(self, app, expose_header: bool = True, log_threshold: float = 1.0):
+        self.app = app
+        self.expose_header = expose_header
+        self.log_threshold = log_threshold
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.expose_header:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timings.header_value().encode("latin-1"))
+                    ]
+            await send(message)
+
+        token = _current.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            total = timings.elapsed()
+            level = logging.INFO if total >= self.log_threshold else logging.DEBUG
+            log_event(
+                "请求阶段耗时",
+                level,
+                logger=logger,
+                endpoint=getattr(scope.get("route"), "path", None) or scope["path"],
+                method=scope["method"],
+                status=status,
+                latency=total,
+                phases=timings.as_dict()
+            )
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app_logging import get_logger, log_event
+from cache import TTLCache
+
+logger = get_logger("tx_tracker")
+
+SUCCESS = "success"
+EXPIRED = "expired"
+TIMEOUT = "timeout"
+
+
+class TrackerFull(RuntimeError):
+    pass
+
+
+class _PendingTx:
+    def __init__(self, tx_hash: str, last_valid_height: int, deadline: float):
+        self.hash = tx_hash
+        self.last_valid_height = last_valid_height
+        self.deadline = deadline
+        self.polls = 0
+        self.next_poll_at = time.monotonic()
+
+
+class TransactionTracker:
+    """集中轮询待确认交易的状态，并把最终结果推送给订阅者。
+
+    同一笔交易无论有多少订阅者，每个周期只查询一次；每笔交易的轮询间隔
+    从poll_interval开始按backoff递增，最长max_interval。
+    同时跟踪的交易最多 max_pending 笔，已满时登记新交易抛出 TrackerFull。
+    """
+
+    def __init__(
+        self,
+        fetch_status: Callable[[str, int], Awaitable[Dict[str, Any]]],
+        poll_interval: float = 1.0,
+        max_interval: float = 5.0,
+        backoff: float = 1.5,
+        timeout: float = 60.0,
+        concurrency: int = 10,
+        result_retention: float = 300.0,
+        max_pending: int = 1000
+    ):
+        self.fetch_status = fetch_status
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: Dict[str, _PendingTx] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # 已结束交易的最终事件，供晚到的订阅者直接读取
+        self._results = TTLCache(maxsize=4096, ttl=result_retention)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def register(self, tx_hash: str, last_valid_height: int) -> None:
+        if tx_hash in self._pending or self._results.get(tx_hash) is not None:
+            return
+        if len(self._pending) >= self.max_pending:
+            raise TrackerFull("Too many transactions are being tracked")
+        self._pending[tx_hash] = _PendingTx(tx_hash, last_valid_height, time.monotonic() + self.timeout)
+        self._wakeup.set()
+
+    def subscribe(self, tx_hash: str) -> asyncio.Queue:
+        """返回接收该交易最终事件的队列"""
+        queue: asyncio.Queue = asyncio.Queue()
+        result = self._results.get(tx_hash)
+        if result is not None:
+            queue.put_nowait(result)
+        else:
+            self._subscribers.setdefault(tx_hash, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, tx_hash: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(tx_hash)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[tx_hash]
+
+    def is_tracking(self, tx_hash: str) -> bool:
+        return tx_hash in self._pending or self._results.get(tx_hash) is not None
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            due = [tx for tx in self._pending.values() if tx.next_poll_at <= now]
+            if due:
+                await asyncio.gather(*(self._poll(tx) for tx in due))
+
+            self._wakeup.clear()
+            if self._pending:
+                next_at = min(tx.next_poll_at for tx in self._pending.values())
+                delay = max(next_at - time.monotonic(), 0)
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+            else:
+                await self._wakeup.wait()
+
+    async def _poll(self, tx: _PendingTx) -> None:
+        try:
+            async with self._semaphore:
+                result = await self.fetch_status(tx.hash, tx.last_valid_height)
+            data = result.get("data") or {}
+            if data.get("success"):
+                self._finish(tx, SUCCESS, data)
+                return
+            if data.get("expired"):
+                self._finish(tx, EXPIRED, data)
+                return
+        except Exception as e:
+            log_event("查询交易状态失败", logging.WARNING, logger=logger, hash=tx.hash, error=str(e))
+
+        if time.monotonic() >= tx.deadline:
+            self._finish(tx, TIMEOUT, None)
+            return
+        tx.polls += 1
+        interval = min(self.poll_interval * (self.backoff ** tx.polls), self.max_interval)
+        tx.next_poll_at = time.monotonic() + interval
+
+    def _finish(self, tx: _PendingTx, state: str, data: Optional[Dict[str, Any]]) -> None:
+        self._pending.pop(tx.hash, None)
+        event = {"hash": tx.hash, "state": state, "data": data}
+        self._results.set(tx.hash, event)
+        for queue in self._subscribers.pop(tx.hash, set()):
+            queue.put_nowait(event)